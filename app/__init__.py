@@ -1,17 +1,32 @@
 from flask import Flask
+from jinja2 import ChoiceLoader, FileSystemLoader
 from flask_cors import CORS
-from app.config import jwt, MONGO_URI
+from app.config import jwt, MONGO_URI, LAZY_STARTUP
 from mongoengine import connect, connection
 
 def create_app():
     
     app = Flask(__name__)
     app.config.from_prefixed_env()
+    
+    from utils.json_provider import FastJSONProvider
+    app.json = FastJSONProvider(app)
     CORS(app) 
     
+    # Slow-request capture hooks Mongo command events, so it goes in first.
+    from utils import profiling
+    profiling.install(app)
+    
     try:
-        connect(host=MONGO_URI)
-        if connection.get_connection():
+        if LAZY_STARTUP:
+            # Connects on the first query; /_ah/warmup pings it ahead of traffic.
+            connect(host=MONGO_URI, connect=False)
+        else:
+            # Start the password pool before the Mongo client's threads.
+            from utils import passwords
+            passwords.warm_up()
+            connect(host=MONGO_URI)
+            connection.get_connection().admin.command('ping')
             app.logger.info("Database connected successfully.")
     except Exception as e:
         app.logger.error(f"Database connection failed: {e}")
@@ -19,21 +34,42 @@ def create_app():
     
     jwt.init_app(app)
     
+    from utils.sessions import MongoSessionInterface
+    app.session_interface = MongoSessionInterface()
+    
     
     from app.create_orders import order_bp
     from app.auth import auth_bp
-    from app.users import user_bp
     from app.main import main_bp
     from app.logs import logs_bp
     from app.settings import settings_bp
+    from app.assets import assets_bp
+    from app.admin import admin_bp
     
     app.register_blueprint(order_bp, url_prefix='/api')
     app.register_blueprint(auth_bp, url_prefix='/auth')
-    app.register_blueprint(user_bp, url_prefix='/users')
     app.register_blueprint(main_bp)
     app.register_blueprint(logs_bp, url_prefix='/api')
     app.register_blueprint(settings_bp, url_prefix='/settings')
+    app.register_blueprint(assets_bp)
+    app.register_blueprint(admin_bp, url_prefix='/admin')
+    
+    # Prefer templates rewritten to hashed asset URLs when a build exists.
+    from utils.assets import load_manifest, BUILD_TEMPLATE_DIR
+    if load_manifest() is not None:
+        app.jinja_loader = ChoiceLoader([FileSystemLoader(BUILD_TEMPLATE_DIR), app.jinja_loader])
     
     import models
     
+    from app.commands import register_commands
+    register_commands(app)
+    
+    # Deliver queued outbound calls from a background thread in each worker.
+    from utils import outbox
+    app.before_request(outbox.start_worker)
+    
+    # Evict local caches when users, wallets or revoked tokens change elsewhere.
+    from utils import invalidation
+    app.before_request(invalidation.start)
+    
     return app
\ No newline at end of file
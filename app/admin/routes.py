@@ -0,0 +1,110 @@
+import codecs
+from flask import jsonify, request, make_response, url_for
+from . import admin_bp
+from utils.utils import admin_required
+from utils import profiling
+from utils.bulk_admin import read_records, apply_changes, new_run_id, FORMATS
+
+
+@admin_bp.post('/profile')
+@admin_required
+def start_profile():
+    """Start a sampling profile of this worker.
+
+    Query params: seconds (default 10, capped by PROFILE_MAX_SECONDS) and
+    interval_ms (default 5). Poll the returned Location for the result.
+    """
+    try:
+        seconds = int(request.args.get('seconds', 10))
+        interval_ms = int(request.args.get('interval_ms', 5))
+    except ValueError:
+        return jsonify({"error": "seconds and interval_ms must be integers"}), 400
+
+    try:
+        profile_id = profiling.start_sampling(seconds, interval_ms)
+    except profiling.ProfilerBusy as e:
+        return jsonify({"error": "A profile is already running in this worker", "id": str(e)}), 409
+
+    location = url_for('admin_bp.get_profile', profile_id=profile_id)
+    response = jsonify({"id": profile_id, "status": "running", "location": location})
+    response.headers['Location'] = location
+    return response, 202
+
+
+@admin_bp.get('/profile/<profile_id>')
+@admin_required
+def get_profile(profile_id):
+    """Collapsed stacks of a finished run (flamegraph.pl / speedscope input)."""
+    profile = profiling.get_profile(profile_id)
+    if profile is None:
+        return jsonify({"error": "Profile not found in this worker"}), 404
+    if profile['status'] != 'done':
+        return jsonify({"id": profile['id'], "status": profile['status'],
+                        "started_at": profile['started_at'].isoformat(), "seconds": profile['seconds']}), 202
+
+    response = make_response(profile['folded'])
+    response.mimetype = 'text/plain'
+    response.headers['Content-Disposition'] = f"attachment; filename=profile-{profile['pid']}-{profile['id']}.folded"
+    response.headers['X-Profile-Samples'] = str(profile['samples'])
+    return response
+
+
+@admin_bp.get('/slow-requests')
+@admin_required
+def list_slow_requests():
+    return jsonify({"data": profiling.slow_requests()}), 200
+
+
+@admin_bp.get('/slow-requests/<entry_id>')
+@admin_required
+def get_slow_request(entry_id):
+    """One captured request: its query log and the top functions by cumulative time.
+
+    Add ?format=prof to download the raw cProfile dump instead.
+    """
+    entry = profiling.get_slow_request(entry_id)
+    if entry is None:
+        return jsonify({"error": "Slow request not found in this worker"}), 404
+
+    if request.args.get('format') == 'prof':
+        response = make_response(profiling.profile_dump(entry))
+        response.mimetype = 'application/octet-stream'
+        response.headers['Content-Disposition'] = f"attachment; filename=request-{entry_id}.prof"
+        return response
+
+    return jsonify({**profiling.slow_request_json(entry), "profile": profiling.profile_summary(entry)}), 200
+
+
+@admin_bp.post('/bulk')
+@admin_required
+def bulk_changes():
+    """Apply a CSV or NDJSON body of wallet adjustments and user status changes.
+
+    Query params: format (csv|ndjson, default from Content-Type), run_id and
+    start to resume, dry_run=true, actor and reason. Large files are better
+    run with ``flask bulk-admin``; the report is the same.
+    """
+    fmt = request.args.get('format') or ('csv' if request.mimetype == 'text/csv' else 'ndjson')
+    if fmt not in FORMATS:
+        return jsonify({"error": f"format must be one of {', '.join(FORMATS)}"}), 400
+    try:
+        start = int(request.args.get('start', 0))
+    except ValueError:
+        return jsonify({"error": "start must be an integer"}), 400
+
+    run_id = request.args.get('run_id') or new_run_id()
+    try:
+        report = apply_changes(
+            read_records(codecs.iterdecode(request.stream, 'utf-8'), fmt),
+            run_id=run_id,
+            start=start,
+            dry_run=request.args.get('dry_run', 'false').lower() == 'true',
+            actor=request.args.get('actor') or 'admin-api',
+            reason=request.args.get('reason') or None,
+        )
+    except Exception as e:
+        print(f"Bulk admin run failed: {e}")
+        # The ledger keeps what was applied; re-send with this run_id to resume.
+        return jsonify({"error": "Bulk run failed", "message": str(e), "run_id": run_id}), 500
+
+    return jsonify(report), 200
@@ -0,0 +1,5 @@
+from flask import Blueprint
+
+assets_bp = Blueprint('assets_bp', __name__)
+
+from . import routes
\ No newline at end of file
@@ -0,0 +1,38 @@
+import mimetypes
+import os
+from flask import request, send_file, abort
+from werkzeug.security import safe_join
+from . import assets_bp
+from utils.assets import DIST_DIR
+from utils import metrics
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+
+@assets_bp.get('/assets/<path:filename>')
+def hashed_asset(filename):
+    """Serve a content-hashed build asset, preferring a precompressed variant.
+
+    send_file hands the open file to the server's wsgi.file_wrapper, which
+    gunicorn streams with sendfile(2).
+    """
+    path = safe_join(DIST_DIR, filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+
+    # Parsed header: quality of each coding, 0 when absent or refused (q=0).
+    accepted = request.accept_encodings
+    encoding = None
+    for candidate, suffix in (('br', '.br'), ('gzip', '.gz')):
+        if accepted[candidate] > 0 and os.path.isfile(path + suffix):
+            encoding, path = candidate, path + suffix
+            break
+
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    response = send_file(path, mimetype=mimetype, conditional=True, etag=True)
+    response.headers['Cache-Control'] = IMMUTABLE
+    response.headers['Vary'] = 'Accept-Encoding'
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    metrics.incr('assets.served', encoding=encoding or 'identity')
+    return response
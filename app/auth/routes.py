@@ -1,10 +1,11 @@
-from flask import request, jsonify, session, render_template, redirect, url_for
+from flask import request, jsonify, session, render_template, redirect, url_for, g
 from . import auth_bp
 from models import User, Wallet
-from flask_jwt_extended import create_access_token
-from marshmallow import ValidationError
-import uuid
 from utils.utils import *
+from utils.passwords import HashingBusy
+from utils import api_tokens, user_status
+from utils.schemas import validate_json
+from app.schemas import SEND_OTP, VERIFY_OTP, LOGIN, SET_CREDENTIALS
 import random
 import string
 
@@ -16,13 +17,12 @@ def generate_otp(length=6):
     return ''.join(random.choices(string.digits, k=length))
     
 @auth_bp.post('/send-otp')
+@validate_json(SEND_OTP)
 def send_otp():
     """Generate and send OTP to user's email."""
     try:
-        data = request.get_json()
-        email = data.get('email')
-        if not email:
-            return jsonify({"error": "Email is required"}), 400
+        data = g.payload
+        email = data['email']
 
         user = User.objects(email=email).first()
         if user:
@@ -54,15 +54,13 @@ def send_otp():
 
 
 @auth_bp.post('/verify-otp')
+@validate_json(VERIFY_OTP)
 def verify_otp():
     """Verify OTP and register user."""
     try:
-        data = request.get_json()
-        email = data.get('email')
-        otp = data.get('otp')
-
-        if not email or not otp:
-            return jsonify({"error": "Email and OTP are required"}), 400
+        data = g.payload
+        email = data['email']
+        otp = data['otp']
 
         # Validate OTP
         if email not in otp_store or otp_store[email] != otp:
@@ -101,6 +99,8 @@ def verify_otp():
 
 
         return jsonify({"message": "User successfully registered"}), 201
+    except HashingBusy as e:
+        return jsonify({"error": str(e)}), 503, {'Retry-After': '1'}
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -112,12 +112,10 @@ def loginPage():
         return render_template('login.html')
 
 @auth_bp.post('/login')
+@validate_json(LOGIN)
 def login():
     try:
-        data = request.get_json()
-
-        if not data or not data.get('email') or not data.get('password'):
-            return jsonify({'error': 'Missing email or password or captcha'}), 400
+        data = g.payload
 
         user = User.objects(email=data.get('email')).first()
 
@@ -126,22 +124,31 @@ def login():
 
         if not user.check_password(password=data.get('password')):
             return jsonify({'error': 'Invalid email or password'}), 401
+
+        if not user.is_active:
+            return jsonify({'error': 'Account is inactive'}), 403
         
+        wallet = Wallet.objects(user=user).only('id').first()
+        
+        # New session id on login; the record carries the resolved user and wallet ids
+        session.regenerate()
         session['user'] = {
             'id': str(user.id),
             'email': user.email,
             'name': user.username
         }
+        session['wallet_id'] = str(wallet.id) if wallet else None
 
         return jsonify({'message': 'Login Successfully', 'redirect': '/docs/app'}), 200
 
-    except ValidationError as ve:
-        return jsonify({'error': str(ve)}), 400
+    except HashingBusy as e:
+        return jsonify({'error': str(e)}), 503, {'Retry-After': '1'}
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @auth_bp.route('/set-credentials', methods=['POST', 'OPTIONS'])
 @login_required
+@validate_json(SET_CREDENTIALS)
 def set_razorpay_credentials():
     if request.method == 'OPTIONS':
         return '', 200
@@ -150,19 +157,16 @@ def set_razorpay_credentials():
     if not current_user:
         return jsonify({'error': 'User not logged in'}), 401
     
-    user = User.objects(email=current_user['email']).first()
+    user = User.objects(id=current_user['id']).first()
     
-    data = request.get_json()
+    data = g.payload
     
-    razorpay_key_id = data.get('key_id')
-    razorpay_key_secret = data.get('key_secret')
+    razorpay_key_id = data['key_id']
+    razorpay_key_secret = data['key_secret']
     
     if not validate_razorpay_credentials(razorpay_key_id, razorpay_key_secret):
         return jsonify({"error": "Invalid Razorpay credentials"}), 401
 
-    if not razorpay_key_id or not razorpay_key_secret:
-        return jsonify({"error": "Both key_id and key_secret are required"}), 400
-
     user.set_razorpay_credentials(razorpay_key_id, razorpay_key_secret)
     user.save()
     
@@ -176,9 +180,9 @@ def generate_access_token():
     if not current_user:
         return jsonify({'error': 'User not logged in'}), 401
     
-    user = User.objects(email=current_user['email']).first()
+    user = User.objects(id=current_user['id']).first()
     
-    wallet = Wallet.objects(user=user).first()
+    wallet = session_wallet()
     if not wallet or wallet.credits <= 0:
         return jsonify({"error": "Insufficient credits to generate an API access token.", "message": "Please recharge your account to continue using the API."}), 400
     
@@ -200,13 +204,37 @@ def generate_access_token():
     if user.access_token:
         return jsonify({'error': 'Access token already exists. Delete it before creating a new one.'}), 403
 
-    jti = str(uuid.uuid4())
-    access_token = create_access_token(identity=current_user['email'], expires_delta=False, additional_claims={"jti": jti})
-    user.access_token = access_token
+    # The stored token is a refresh token (the API key); clients trade it for
+    # short-lived access tokens at /auth/refresh-token.
+    refresh_token, jti = api_tokens.issue_refresh_token(current_user['email'])
+    user.access_token = refresh_token
     user.jti = jti
     user.save()
     
-    return jsonify({'message': 'New Access Token Generated', 'access_token': access_token}), 200
+    access_token, expires_in = api_tokens.issue_access_token(current_user['email'], jti,
+                                                             api_tokens.token_expiry(refresh_token))
+    return jsonify({'message': 'New Access Token Generated', 'refresh_token': refresh_token,
+                    'access_token': access_token, 'expires_in': expires_in}), 200
+
+
+@auth_bp.post('/refresh-token')
+def refresh_access_token():
+    """Exchange the API key (refresh token) for a short-lived access token."""
+    try:
+        verify_jwt_in_request(refresh=True)
+    except Exception as e:
+        return jsonify({"error": "Token verification failed", "message": str(e)}), 401
+
+    claims = get_jwt()
+    if is_token_revoked(claims.get("jti")):
+        return jsonify({"error": "Token has been revoked"}), 401
+
+    if not user_status.is_active(get_jwt_identity()):
+        return jsonify({"error": "Account is inactive"}), 403
+
+    access_token, expires_in = api_tokens.issue_access_token(get_jwt_identity(), claims.get("jti"),
+                                                             api_tokens.claims_expiry(claims))
+    return jsonify({'access_token': access_token, 'token_type': 'Bearer', 'expires_in': expires_in}), 200
 
 
 @auth_bp.delete('/delete-access-token')
@@ -218,10 +246,14 @@ def delete_access_token():
     if not current_user:
         return jsonify({'error': 'User not logged in'}), 401
     
-    user = User.objects(email=current_user['email']).first()
+    user = User.objects(id=current_user['id']).first()
 
     if user.access_token:
-        add_token_to_blacklist(user.jti)
+        # Revoked until the key would have expired anyway; access tokens issued
+        # from it are covered through their rid claim, and none outlives the
+        # key by more than ACCESS_TTL.
+        expires_at = api_tokens.token_expiry(user.access_token)
+        add_token_to_blacklist(user.jti, expires_at + api_tokens.ACCESS_TTL if expires_at else None)
         user.access_token = None
         user.jti = None
         user.save()
@@ -235,20 +267,25 @@ def delete_access_token():
 def get_access_token():
     try:
         current_user = session.get('user')
-        user = User.objects(email=current_user['email']).first()
+        user = User.objects(id=current_user['id']).first()
         
-        wallet = Wallet.objects(user=user).first()
+        wallet = session_wallet()
         if not wallet or wallet.credits <= 0:
             return jsonify({"error": "Insufficient credits, We can't able to proceed with your request.", "message": "Please recharge your account to continue using the API."}), 400
         
-        access_token = user.access_token
-        if not access_token:
+        if not user.access_token:
             return jsonify({"error": "Access token not found, Please generate the access token and try again."}), 400
-        return jsonify({'access_token': access_token}), 200
+        key_expires_at = api_tokens.token_expiry(user.access_token)
+        if api_tokens.is_expired(key_expires_at):
+            return jsonify({"error": "Access token has expired, Please delete it and generate a new one."}), 401
+        # A fresh short-lived token for the logged-in user's own API calls (the docs console)
+        access_token, expires_in = api_tokens.issue_access_token(user.email, user.jti, key_expires_at)
+        return jsonify({'access_token': access_token, 'expires_in': expires_in}), 200
     except Exception as e:
         return jsonify({'error': e})
 
 @auth_bp.get('/logout')
 def logout():
-    session.pop('user', None)
+    # Clearing the session revokes the server-side record on every worker
+    session.clear()
     return render_template('home.html')
\ No newline at end of file
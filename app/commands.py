@@ -0,0 +1,162 @@
+import os
+import click
+from app.config import LOG_RETENTION_DAYS, LOG_RESPONSE_GRACE_DAYS, LOG_ARCHIVE_BACKEND
+
+
+@click.command('archive-logs')
+@click.option('--days', default=LOG_RETENTION_DAYS, show_default=True, help='Archive logs older than this many days.')
+@click.option('--grace-days', default=LOG_RESPONSE_GRACE_DAYS, show_default=True, help='Drop response payloads older than this many days.')
+@click.option('--backend', type=click.Choice(['collection', 'file']), default=LOG_ARCHIVE_BACKEND, show_default=True)
+@click.option('--batch-size', default=1000, show_default=True)
+def archive_logs_command(days, grace_days, backend, batch_size):
+    """Archive old api_logs into monthly buckets and strip stale response payloads."""
+    from utils.retention import archive_old_logs, strip_old_responses
+
+    moved = archive_old_logs(days=days, backend=backend, batch_size=batch_size)
+    click.echo(f"Archived {moved} logs older than {days} days ({backend}).")
+    stripped = strip_old_responses(grace_days=grace_days)
+    click.echo(f"Dropped response payload from {stripped} logs older than {grace_days} days.")
+
+
+@click.command('compact-logs')
+@click.option('--batch-size', default=1000, show_default=True)
+@click.option('--limit', type=int, default=None, help='Stop after converting this many logs.')
+def compact_logs_command(batch_size, limit):
+    """Convert legacy api_logs documents to the compact (interned, compressed) schema."""
+    from utils.migrations import compact_legacy_logs
+
+    converted = compact_legacy_logs(batch_size=batch_size, limit=limit)
+    click.echo(f"Converted {converted} logs to the compact schema.")
+
+
+@click.command('rotate-secret-key')
+@click.option('--batch-size', default=500, show_default=True)
+def rotate_secret_key_command(batch_size):
+    """Re-encrypt all users' Razorpay secrets with the current SECRET_KEY.
+
+    Set the new key as SECRET_KEY and the old one in SECRET_KEY_PREVIOUS
+    before running; remove SECRET_KEY_PREVIOUS once this completes.
+    """
+    from utils.migrations import rotate_user_secrets
+
+    rotated, scanned = rotate_user_secrets(batch_size=batch_size)
+    click.echo(f"Re-encrypted {rotated} of {scanned} stored secrets.")
+
+
+@click.command('build-assets')
+def build_assets_command():
+    """Fingerprint, minify and precompress the static files used by the templates."""
+    from utils.assets import build_assets, DIST_DIR
+
+    manifest = build_assets()
+    click.echo(f"Built {len(manifest)} assets into {DIST_DIR}.")
+
+
+@click.command('rebuild-analytics')
+@click.option('--since', type=click.DateTime(formats=['%Y-%m-%d']), default=None,
+              help='Recompute months from this date on (default: all logs).')
+@click.option('--batch-size', default=1000, show_default=True)
+def rebuild_analytics_command(since, batch_size):
+    """Recompute the usage rollups behind /api/analytics from api_logs."""
+    from utils.analytics import rebuild_rollups
+
+    scanned = rebuild_rollups(since=since, batch_size=batch_size)
+    click.echo(f"Rebuilt usage rollups from {scanned} logs.")
+
+
+@click.command('reconcile-credits')
+@click.option('--since', type=click.DateTime(formats=['%Y-%m-%d']), default=None,
+              help='Only check leases created on or after this date.')
+@click.option('--reclaim/--no-reclaim', default=True, show_default=True,
+              help='First close leases abandoned by dead workers.')
+def reconcile_credits_command(since, reclaim):
+    """Check credit lease accounting against the API logs."""
+    from utils.credit_leases import reclaim_abandoned, reconcile
+
+    if reclaim:
+        click.echo(f"Reclaimed {reclaim_abandoned()} abandoned leases.")
+    report = reconcile(since=since)
+    click.echo(f"Checked {report['leases']} leases; {report['outstanding']} credits held by active leases.")
+    for mismatch in report['mismatches']:
+        click.echo(f"  lease {mismatch['lease']} (wallet {mismatch['wallet']}): {'; '.join(mismatch['problems'])}")
+    if report['mismatches']:
+        raise SystemExit(1)
+
+
+@click.command('sync-orders')
+@click.option('--max-age-days', default=None, type=int,
+              help='Only refresh open orders created within this many days.')
+def sync_orders_command(max_age_days):
+    """Refresh open orders in the local store from Razorpay (run from cron)."""
+    from utils.orders import sync_open_orders
+    from app.config import ORDER_SYNC_MAX_AGE_DAYS
+
+    updated = sync_open_orders(max_age_days or ORDER_SYNC_MAX_AGE_DAYS)
+    click.echo(f"Updated {updated} orders.")
+
+
+@click.command('migrate-api-tokens')
+@click.option('--prune', is_flag=True, help='Drop revocations of legacy tokens (only after LEGACY_API_TOKEN_SUNSET).')
+def migrate_api_tokens_command(prune):
+    """Report users still on non-expiring API tokens; optionally prune their revocations."""
+    from models import User, RevokedToken
+    from utils import api_tokens
+
+    legacy = [user.email for user in User.objects(access_token__ne=None).only('email', 'access_token')
+              if api_tokens.token_expiry(user.access_token) is None]
+    click.echo(f"{len(legacy)} users still hold a non-expiring API token.")
+    for email in legacy:
+        click.echo(f"  {email}")
+
+    if prune:
+        if not api_tokens.legacy_refused():
+            raise click.ClickException("Set LEGACY_API_TOKEN_SUNSET to a past date before pruning legacy revocations.")
+        # Legacy tokens are refused outright now, so their revocations are dead weight.
+        deleted = RevokedToken.objects(expires_at=None).delete()
+        click.echo(f"Deleted {deleted} legacy revocation entries.")
+
+
+@click.command('bulk-admin')
+@click.argument('source', type=click.File('r', encoding='utf-8'))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'ndjson']), default=None,
+              help='Input format (default: from the file extension).')
+@click.option('--run-id', default=None, help='Resume an earlier run; records it already applied are skipped, failed ones are retried.')
+@click.option('--start', default=0, show_default=True, help='Skip this many records (a previous next_offset).')
+@click.option('--chunk-size', default=None, type=int, help='Records per transaction (default BULK_ADMIN_CHUNK_SIZE).')
+@click.option('--dry-run', is_flag=True, help='Report what would change without writing anything.')
+@click.option('--actor', default=lambda: os.environ.get('USER', 'cli'), help='Recorded on every ledger entry.')
+@click.option('--reason', default=None, help='Default reason for records without one.')
+def bulk_admin_command(source, fmt, run_id, start, chunk_size, dry_run, actor, reason):
+    """Apply wallet adjustments and user status changes from a CSV or NDJSON file ('-' for stdin)."""
+    from utils.bulk_admin import read_records, apply_changes, new_run_id
+    from app.config import BULK_ADMIN_CHUNK_SIZE
+
+    fmt = fmt or ('csv' if source.name.endswith('.csv') else 'ndjson')
+    run_id = run_id or new_run_id()
+
+    def progress(report):
+        click.echo(f"  {report['next_offset']} records, {report['per_second']:.0f}/s "
+                   f"(applied {report['applied']}, unchanged {report['unchanged']}, "
+                   f"failed {report['failed']}, skipped {report['skipped']})")
+
+    click.echo(f"{'Dry run' if dry_run else 'Run'} {run_id} from record {start}:")
+    report = apply_changes(read_records(source, fmt), run_id=run_id, start=start,
+                           chunk_size=chunk_size or BULK_ADMIN_CHUNK_SIZE, dry_run=dry_run,
+                           actor=actor, reason=reason, progress=progress)
+    for error in report['errors']:
+        click.echo(f"  record {error['offset']}: {error['error']}")
+    click.echo(f"Run {report['run_id']} finished in {report['seconds']:.1f}s at record {report['next_offset']}.")
+    if report['failed']:
+        raise SystemExit(1)
+
+
+def register_commands(app):
+    app.cli.add_command(archive_logs_command)
+    app.cli.add_command(compact_logs_command)
+    app.cli.add_command(rotate_secret_key_command)
+    app.cli.add_command(build_assets_command)
+    app.cli.add_command(rebuild_analytics_command)
+    app.cli.add_command(reconcile_credits_command)
+    app.cli.add_command(sync_orders_command)
+    app.cli.add_command(migrate_api_tokens_command)
+    app.cli.add_command(bulk_admin_command)
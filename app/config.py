@@ -1,9 +1,142 @@
 # from mongoengine import connect
 from flask_jwt_extended import JWTManager
+from dotenv import load_dotenv
 import os
 
+load_dotenv()
+
 MONGO_URI = os.getenv('MONGO_URI', 'mongodb://localhost:27017/cloudlesspayprepaid')
 
+# With LAZY_STARTUP the Mongo client connects on first use (or in the
+# /_ah/warmup hook) instead of while the app is being created.
+LAZY_STARTUP = os.getenv('LAZY_STARTUP', 'true').lower() == 'true'
+
+# The platform's own Razorpay account, used for dashboard wallet top-ups.
+RAZORPAY_KEY_ID = os.environ.get('RAZORPAY_KEY_ID')
+RAZORPAY_KEY_SECRET = os.environ.get('RAZORPAY_KEY_SECRET')
+
+# Read-only dashboard/reporting queries are routed with this read preference.
+# pymongo rejects a maxStalenessSeconds below 90, so clamp to that floor.
+REPORTING_READ_PREFERENCE = os.getenv('REPORTING_READ_PREFERENCE', 'secondaryPreferred')
+REPORTING_MAX_STALENESS_SECONDS = max(90, int(os.getenv('REPORTING_MAX_STALENESS_SECONDS', 90)))
+
+# api_logs retention: documents older than LOG_RETENTION_DAYS are moved to
+# monthly archives, and the raw response payload is dropped from hot
+# documents after LOG_RESPONSE_GRACE_DAYS.
+LOG_RETENTION_DAYS = int(os.getenv('LOG_RETENTION_DAYS', 90))
+LOG_RESPONSE_GRACE_DAYS = int(os.getenv('LOG_RESPONSE_GRACE_DAYS', 7))
+LOG_ARCHIVE_BACKEND = os.getenv('LOG_ARCHIVE_BACKEND', 'collection')  # 'collection' or 'file'
+LOG_ARCHIVE_DIR = os.getenv('LOG_ARCHIVE_DIR', 'archive/api_logs')
+
+# User-Agent classification: ordered rule table (JSON) and LRU size.
+UA_RULES_FILE = os.getenv('UA_RULES_FILE', os.path.join(os.path.dirname(os.path.dirname(__file__)), 'utils', 'user_agent_rules.json'))
+UA_CACHE_SIZE = int(os.getenv('UA_CACHE_SIZE', 1024))
+
+# Decrypted Razorpay secrets are kept in memory for this many seconds.
+SECRET_CACHE_TTL = int(os.getenv('SECRET_CACHE_TTL', 300))
+SECRET_CACHE_SIZE = int(os.getenv('SECRET_CACHE_SIZE', 1024))
+
+# Output of `flask build-assets`: hashed static files, rewritten templates, manifest.
+ASSET_BUILD_DIR = os.getenv('ASSET_BUILD_DIR', os.path.join(os.path.dirname(__file__), 'build'))
+
+# Outbound integrations (Zoho CRM, email) are queued in the outbox collection
+# and delivered by a background worker in each process.
+ZOHO_CREATOR_BASE_URL = os.getenv('ZOHO_CREATOR_BASE_URL', 'https://www.zohoapis.in/creator/custom/contact_mcubeinfotech')
+OUTBOX_CONNECT_TIMEOUT = float(os.getenv('OUTBOX_CONNECT_TIMEOUT', 3))
+OUTBOX_READ_TIMEOUT = float(os.getenv('OUTBOX_READ_TIMEOUT', 10))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', 8))
+OUTBOX_BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', 20))
+OUTBOX_POLL_SECONDS = float(os.getenv('OUTBOX_POLL_SECONDS', 5))
+# Messages from one claimed batch delivered in parallel per worker.
+OUTBOX_CONCURRENCY = int(os.getenv('OUTBOX_CONCURRENCY', 4))
+
+# Cross-process cache invalidation: Mongo change streams, or polling of the
+# collections' updated-at watermarks when change streams are unavailable.
+INVALIDATION_MODE = os.getenv('INVALIDATION_MODE', 'auto')  # 'auto', 'changestream', 'poll' or 'off'
+INVALIDATION_POLL_SECONDS = float(os.getenv('INVALIDATION_POLL_SECONDS', 2))
+# Each poll re-reads this far behind the watermark to catch writes stamped in
+# the same millisecond or by a host whose clock runs slightly behind.
+INVALIDATION_POLL_OVERLAP_SECONDS = float(os.getenv('INVALIDATION_POLL_OVERLAP_SECONDS', 5))
+
+# Wallet engine: orders are refused once a charge would take the balance
+# below WALLET_FLOOR; crossing a threshold sends a one-off low-balance email.
+WALLET_FLOOR = float(os.getenv('WALLET_FLOOR', 0))
+LOW_BALANCE_THRESHOLDS = sorted((float(t) for t in os.getenv('LOW_BALANCE_THRESHOLDS', '50,10,0').split(',')), reverse=True)
+
+# Server-side sessions: records live in Mongo, with a short-lived local cache.
+SESSION_CACHE_TTL = int(os.getenv('SESSION_CACHE_TTL', 60))
+SESSION_CACHE_SIZE = int(os.getenv('SESSION_CACHE_SIZE', 4096))
+# Unknown, revoked or expired session ids are remembered this long, so a stale
+# cookie does not cost a Mongo lookup on every request.
+SESSION_MISS_TTL = int(os.getenv('SESSION_MISS_TTL', 10))
+
+# Credit leasing: with CREDIT_LEASE_SIZE > 0 each worker takes blocks of this
+# many credits from a wallet and spends them locally, returning what is left
+# when the lease expires (CREDIT_LEASE_TTL seconds) or the worker exits.
+CREDIT_LEASE_SIZE = int(os.getenv('CREDIT_LEASE_SIZE', 0))
+CREDIT_LEASE_TTL = int(os.getenv('CREDIT_LEASE_TTL', 60))
+# A charge refused at the floor while other workers hold leases on the wallet
+# recalls them and waits up to this long for the credits to come back.
+CREDIT_LEASE_RECALL_WAIT = float(os.getenv('CREDIT_LEASE_RECALL_WAIT', 2))
+
+# Password hashing runs in a process pool of PASSWORD_HASH_WORKERS (0 hashes
+# inline); at most PASSWORD_HASH_MAX_PENDING hashes may be queued or running
+# before logins are refused with 503. Stored hashes made with a different
+# PASSWORD_HASH_METHOD are re-hashed at the next successful login.
+PASSWORD_HASH_METHOD = os.getenv('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', 2))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv('PASSWORD_HASH_MAX_PENDING', 16))
+PASSWORD_HASH_TIMEOUT = float(os.getenv('PASSWORD_HASH_TIMEOUT', 5))
+
+# `flask sync-orders` refreshes orders still open (created/attempted) that were
+# created within this many days.
+ORDER_SYNC_MAX_AGE_DAYS = int(os.getenv('ORDER_SYNC_MAX_AGE_DAYS', 7))
+
+# Deferred orders: clients sending `Prefer: respond-async` get a 202 and an
+# intent id; the outbox dispatcher submits the order to Razorpay.
+ASYNC_ORDERS_ENABLED = os.getenv('ASYNC_ORDERS_ENABLED', 'true').lower() == 'true'
+
+# API tokens: the dashboard issues a refresh token (the long-lived API key);
+# clients exchange it at /auth/refresh-token for short-lived access tokens.
+# Tokens issued before this scheme never expire; they are refused from
+# LEGACY_API_TOKEN_SUNSET (YYYY-MM-DD) on, if set.
+API_ACCESS_TOKEN_TTL_MINUTES = int(os.getenv('API_ACCESS_TOKEN_TTL_MINUTES', 60))
+API_REFRESH_TOKEN_TTL_DAYS = int(os.getenv('API_REFRESH_TOKEN_TTL_DAYS', 90))
+LEGACY_API_TOKEN_SUNSET = os.getenv('LEGACY_API_TOKEN_SUNSET') or None
+# Each worker also reloads the (small, self-pruning) revocation set this often,
+# in case an invalidation event was missed.
+REVOCATION_RELOAD_SECONDS = int(os.getenv('REVOCATION_RELOAD_SECONDS', 60))
+
+# Per-user dashboard summary cache; wallet changes evict it immediately.
+SUMMARY_CACHE_TTL = int(os.getenv('SUMMARY_CACHE_TTL', 30))
+
+# Largest number of time buckets one /api/analytics query may span.
+ANALYTICS_MAX_BUCKETS = int(os.getenv('ANALYTICS_MAX_BUCKETS', 744))
+# The domain dimension comes from the caller's Origin header; past this many
+# distinct domains per user and month, further ones are counted as "other".
+ANALYTICS_MAX_DOMAINS = int(os.getenv('ANALYTICS_MAX_DOMAINS', 50))
+# Rollup increments are buffered per worker and written this often (seconds).
+ANALYTICS_FLUSH_INTERVAL = float(os.getenv('ANALYTICS_FLUSH_INTERVAL', 2))
+
+# Admin endpoints (/admin/...) require `Authorization: Bearer <ADMIN_API_TOKEN>`
+# and are disabled while it is unset.
+ADMIN_API_TOKEN = os.getenv('ADMIN_API_TOKEN') or None
+# Requests slower than SLOW_REQUEST_MS are kept, with a cProfile dump and their
+# Mongo commands, in a per-worker ring buffer of SLOW_REQUEST_BUFFER entries.
+# 0 turns capture off. Only SLOW_REQUEST_SAMPLE_RATE of requests are profiled.
+SLOW_REQUEST_MS = int(os.getenv('SLOW_REQUEST_MS', 0))
+SLOW_REQUEST_BUFFER = int(os.getenv('SLOW_REQUEST_BUFFER', 20))
+SLOW_REQUEST_SAMPLE_RATE = float(os.getenv('SLOW_REQUEST_SAMPLE_RATE', 1))
+# Longest on-demand sampling run /admin/profile will start.
+PROFILE_MAX_SECONDS = int(os.getenv('PROFILE_MAX_SECONDS', 60))
+
+# Cached User.is_active lookups on the API token and login paths; bulk
+# deactivations reach other workers through the invalidation bus.
+USER_STATUS_CACHE_TTL = int(os.getenv('USER_STATUS_CACHE_TTL', 60))
+USER_STATUS_CACHE_SIZE = int(os.getenv('USER_STATUS_CACHE_SIZE', 4096))
+# Records applied per transaction by bulk admin runs (flask bulk-admin, /admin/bulk).
+BULK_ADMIN_CHUNK_SIZE = int(os.getenv('BULK_ADMIN_CHUNK_SIZE', 500))
+
 # connect(host=MONGO_URI)
 
 jwt = JWTManager()
@@ -1,56 +1,62 @@
-from flask import request, jsonify
-import razorpay.errors
+from flask import request, jsonify, g
 from . import order_bp
 from flask_jwt_extended import jwt_required, get_jwt_identity
-import razorpay
-from models import User, Wallet
 from utils.utils import *
+from utils.principals import load_api_principal
+from utils import crypto, wallet, order_intents, razorpay_sdk
+from utils.orders import record_order, list_orders
+from models import Order, User
+from app.config import WALLET_FLOOR, ASYNC_ORDERS_ENABLED
+from app.schemas import CREATE_ORDER
+from utils.schemas import validate_json
 
 @order_bp.post('/create-order')
 @token_required
+@validate_json(CREATE_ORDER, log_endpoint="/auth/create-order")
 def create_order(current_user):
     current_user = get_jwt_identity()
     email = current_user
-    user = User.objects(email=email).first()
+    principal = load_api_principal(email)
+    if principal is None:
+        return jsonify({"error": "User not found"}), 404
+    g.api_principal = principal
     
-    if not user.razorpay_key_id or not user.razorpay_key_secret:
+    if not principal.key_id or not principal.key_secret:
         log_api_request("/auth/create-order", email, "Razorpay credentials not found for the user", "failure")
         return jsonify({"error": "Razorpay credentials not found for the user"}), 400
     
-    key_id = user.razorpay_key_id
-    key_secret = user.get_razorpay_key_secret()
+    key_id = principal.key_id
+    key_secret = crypto.decrypt_cached(principal.user_id, principal.key_secret)
 
-    razorpay_client = razorpay.Client(auth=(key_id, key_secret))
+    razorpay_client = razorpay_sdk.client(key_id, key_secret)
     
-    data = request.get_json()
+    data = g.payload
     
-    actual_amount = data.get('amount', 0)
+    amount = int(data['amount']) * 100
+    currency = data['currency']
+    receipt = data['receipt']
+    notes = {key: str(value) for key, value in data['notes'].items()}
+    partial_payment = data['partial_payment']
+    payment_capture = data['payment_capture']
+    first_payment_min_amount = data['first_payment_min_amount'] or 0
     
-    if not actual_amount or not isinstance(actual_amount, (int, float)) or actual_amount <= 0:
-        log_api_request("/auth/create-order", email, "Amount is required and must be a positive number", "failure")
-        return jsonify({"error": "Invalid Input", "message": "Amount is required and must be a positive number"}), 400
-    
-    amount = int(actual_amount) * 100
-    currency = data.get('currency', 'INR')
-    receipt = str(data.get('receipt', 'receipt#1'))
-    notes = {key: str(value) for key, value in data.get('notes', {}).items()}
-    partial_payment = data.get('partial_payment', False)
-    payment_capture = data.get('payment_capture', False) 
-    
-    first_payment_min_amount = 0
-    if partial_payment:
+    # Deferred mode: acknowledge with 202 and let the outbox dispatcher call Razorpay
+    defer = ASYNC_ORDERS_ENABLED and 'respond-async' in request.headers.get('Prefer', '')
+    callback_url = data['callback_url']
+    if callback_url is not None and not defer:
+        log_api_request("/auth/create-order", email, "callback_url requires Prefer: respond-async", "failure")
+        return jsonify({"error": "Invalid Input", "message": "callback_url requires Prefer: respond-async"}), 400
+    if callback_url is not None:
         try:
-            first_payment_min_amount = data['first_payment_min_amount']
-            if first_payment_min_amount >= actual_amount:
-                log_api_request("/auth/create-order", email, "First payment minimum amount must be less than total order amount","failure")
-                return jsonify({"error": "Invalid Input", "message": "First payment minimum amount must be less than total order amount"}), 400
-        except Exception as e:
-            log_api_request("/auth/create-order", email, "The first_payment_min_amount is required if partial_payment is true.", "failure")
-            return jsonify({"error": "Missing Input Parameter", "message": "The first_payment_min_amount is required if partial_payment is true."}), 400
-    
-    # Check if user has enough credits
-    wallet = Wallet.objects(user=user).first()
-    if not wallet or wallet.credits <= 0:
+            callback_error = order_intents.callback_url_error(callback_url)
+        except OSError:
+            callback_error = "callback_url host could not be resolved"
+        if callback_error:
+            log_api_request("/auth/create-order", email, callback_error, "failure")
+            return jsonify({"error": "Invalid Input", "message": callback_error}), 400
+
+    # Check if user has enough credits, counting leased ones (cheap early refusal; the charge below is authoritative)
+    if principal.wallet_id is None or principal.credits - 1 < WALLET_FLOOR:
         log_api_request("/api/order/create-order", email, "Insufficient credits", "failure")
         return jsonify({"error": "Insufficient credits", "message": "You don't have enough credits to create this order"}), 400
 
@@ -70,25 +76,107 @@ def create_order(current_user):
         payment_data.pop('partial_payment', None)
         payment_data.pop('first_payment_min_amount', None)
     
+    # Take the credit before calling Razorpay so concurrent orders cannot overdraw
+    balance = wallet.charge(principal.wallet_id)
+    if balance is None:
+        log_api_request("/api/order/create-order", email, "Insufficient credits", "failure")
+        return jsonify({"error": "Insufficient credits", "message": "You don't have enough credits to create this order"}), 400
+
+    if defer:
+        domain, platform = request_client()
+        # The low-balance alert is sent by the dispatcher once the order exists.
+        intent = order_intents.submit(principal, payment_data, domain, platform, callback_url, g.get('credit_lease'),
+                                      email=email, balance=balance)
+        location = f"/api/order-intents/{intent.id}"
+        return jsonify({"intent_id": str(intent.id), "status": "pending", "status_url": location,
+                        "message": "Order accepted for processing"}), 202, {
+            'Location': location, 'Preference-Applied': 'respond-async'}
+
     try:
 
         order = razorpay_client.order.create(payment_data)
 
+        try:
+            record_order(principal.user_id, order)
+        except Exception as e:
+            # The order exists at Razorpay and is paid for; don't fail the call over the local copy
+            print(f"Error storing order {order.get('id')}: {e}")
+
         order['amount'] = int(order['amount']) / 100  # Convert to actual amount
         order['amount_due'] = int(order['amount_due']) / 100  # Convert due amount to actual
 
         order_response = {"order": order, "message": "Order created successfully"}
 
         log_api_request("/auth/create-order", email, order_response, "success")
-        # Deduct 1 credit for this operation
-        wallet.update(inc__credits=-1)
+        wallet.notify_low_balance(email, balance + 1, balance)
         return jsonify(order_response), 201
 
-    except razorpay.errors.BadRequestError as e:
+    except razorpay_sdk.BadRequestError as e:
+        wallet.refund(principal.wallet_id)
         log_api_request("/auth/create-order", email, str(e), "failure")
         return jsonify({"error": "Razorpay Bad Request", "message": str(e)}), 400
 
     except Exception as e:
+        wallet.refund(principal.wallet_id)
         log_api_request("/auth/create-order", email, str(e), "failure")
         return jsonify({"error": "An unexpected error occurred", "message": str(e)}), 500
-            
\ No newline at end of file
+            
+
+
+def _api_user_id(email):
+    user = User.objects(email=email).only('id').first()
+    return user.id if user else None
+
+
+@order_bp.get('/orders')
+@token_required
+def get_orders(current_user):
+    """List the caller's orders, newest first, from the local order store.
+
+    Query params: limit (max 100), cursor (from next_cursor), status.
+    """
+    user_id = _api_user_id(current_user)
+    if user_id is None:
+        return jsonify({"error": "User not found"}), 404
+    try:
+        limit = int(request.args.get('limit', 20))
+        orders, next_cursor = list_orders(user_id, limit, request.args.get('cursor'), request.args.get('status'))
+    except ValueError as e:
+        return jsonify({"error": "Invalid Input", "message": str(e)}), 400
+    return jsonify({"orders": [order.to_json() for order in orders], "next_cursor": next_cursor}), 200
+
+
+@order_bp.get('/orders/<order_id>')
+@token_required
+def get_order(current_user, order_id):
+    user_id = _api_user_id(current_user)
+    order = Order.objects(id=order_id, user=user_id).first() if user_id else None
+    if order is None:
+        return jsonify({"error": "Order not found"}), 404
+    return jsonify({"order": order.to_json()}), 200
+
+
+@order_bp.get('/orders/by-receipt/<path:receipt>')
+@token_required
+def get_orders_by_receipt(current_user, receipt):
+    """Orders with this receipt (receipts are not unique), newest first."""
+    user_id = _api_user_id(current_user)
+    if user_id is None:
+        return jsonify({"error": "User not found"}), 404
+    try:
+        limit = int(request.args.get('limit', 20))
+        orders, next_cursor = list_orders(user_id, limit, request.args.get('cursor'), receipt=receipt)
+    except ValueError as e:
+        return jsonify({"error": "Invalid Input", "message": str(e)}), 400
+    return jsonify({"orders": [order.to_json() for order in orders], "next_cursor": next_cursor}), 200
+
+
+@order_bp.get('/order-intents/<intent_id>')
+@token_required
+def get_order_intent(current_user, intent_id):
+    """Status of a deferred order; includes the order once Razorpay has accepted it."""
+    user_id = _api_user_id(current_user)
+    intent = order_intents.get_intent(intent_id, user_id) if user_id else None
+    if intent is None:
+        return jsonify({"error": "Order intent not found"}), 404
+    return jsonify(order_intents.intent_json(intent)), 200
@@ -1,9 +1,14 @@
-from flask import jsonify
-from models import APILog, User
+from flask import jsonify, Response, stream_with_context
+from models import APILog, LogCode, User
 from datetime import datetime, timedelta
 from . import logs_bp
 from utils.utils import *
 from mongoengine import Q
+from utils.db import reporting_read
+from utils.retention import iter_archived_logs, archived_log_json
+from utils.analytics import query_usage
+from utils import json_provider
+from dateutil.relativedelta import relativedelta
     
 @logs_bp.route('/logs', methods=['GET'])
 @login_required
@@ -38,13 +43,12 @@ def get_logs():
         
         # Current user
         current_user = session.get('user')
-        email = current_user.get('email')
-        user = User.objects(email=email).first()
+        user = User.objects(id=current_user['id']).first()
         if not user:
             return jsonify({"error": "User not found"}), 404
         
         # Base query
-        logs_query = APILog.objects(user=str(user.id))
+        logs_query = reporting_read(APILog.objects(user=str(user.id)), 'get_logs')
         
         # Date range filter
         start_date = request.args.get('start_date')
@@ -59,35 +63,56 @@ def get_logs():
             end_date = datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1)
             logs_query = logs_query.filter(log_time__gte=start_date, log_time__lt=end_date)
         
-        # Apply search filter (case-insensitive)
+        # Apply search filter (case-insensitive). Compressed responses are
+        # matched on their order id and receipt.
         if search_value:
             logs_query = logs_query.filter(
+                Q(endpoint_code__in=LogCode.codes_matching('endpoint', search_value)) |
                 Q(endpoint__icontains=search_value) |
-                Q(response__icontains=search_value) |
                 Q(domain__icontains=search_value) |
+                Q(platform_code__in=LogCode.codes_matching('platform', search_value)) |
                 Q(platform__icontains=search_value) |
+                Q(response__icontains=search_value) |
+                Q(response_keys__icontains=search_value) |
                 Q(user__icontains=search_value)
             )
         
         # Total logs (before filtering)
-        total_logs = APILog.objects(user=str(user.id)).count()
+        total_logs = reporting_read(APILog.objects(user=str(user.id)), 'get_logs').count()
         
         # Filtered logs count
         filtered_logs = logs_query.count()
         
-        # Apply sorting, pagination
-        logs_query = logs_query.order_by(order_by).skip(start).limit(length)
+        # Apply sorting, pagination. Log and Response are stored as interned
+        # codes / compressed payloads, so they are ordered by their text in an
+        # aggregation rather than by the stored field.
+        if order_column in ('endpoint', 'response'):
+            pipeline = [
+                {'$addFields': {'_sort': APILog.sort_expression(order_column)}},
+                {'$sort': {'_sort': -1 if order_direction == 'desc' else 1}},
+                {'$skip': start},
+            ]
+            if length > 0:
+                pipeline.append({'$limit': length})
+            docs = logs_query.aggregate(pipeline)
+        else:
+            docs = logs_query.order_by(order_by).skip(start).limit(length).as_pymongo()
         
-        # Prepare log data
-        log_data = [{
-            "id": str(log.id),
-            "time": log.log_time.strftime('%Y-%m-%d %H:%M:%S'),
-            "endpoint": log.endpoint,
-            "user": User.objects(id=log.user.id).first().username if log.user else "Unknown",
-            "domain": log.domain,
-            "platform": log.platform,
-            "response": log.response
-        } for log in logs_query]
+        # Prepare log data. Every row belongs to the current user, so read raw
+        # documents (no per-row user dereference). The stored response text
+        # (decompressed if needed) is returned as a JSON string, not parsed.
+        log_data = []
+        for doc in docs:
+            log = APILog.raw_to_json(doc)
+            log_data.append({
+                "id": str(doc['_id']),
+                "time": doc['log_time'].strftime('%Y-%m-%d %H:%M:%S'),
+                "endpoint": log['endpoint'],
+                "user": user.username,
+                "domain": log['domain'],
+                "platform": log['platform'],
+                "response": log['response']
+            })
         
         # Return data in DataTables format
         return jsonify({
@@ -100,3 +125,74 @@ def get_logs():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+
+@logs_bp.route('/logs/archive', methods=['GET'])
+@login_required
+def get_archived_logs():
+    """Stream a user's archived logs for one month (YYYY-MM) as NDJSON, e.g. for export.
+
+    One log per line, oldest first; the month is never held in memory.
+    """
+    month = request.args.get('month', '')
+    try:
+        start_date = datetime.strptime(month, '%Y-%m')
+    except ValueError:
+        return jsonify({"error": "Invalid month, expected YYYY-MM"}), 400
+    end_date = start_date + relativedelta(months=1)
+    user_id = session.get('user')['id']
+
+    def generate():
+        for doc in iter_archived_logs(user_id, start_date, end_date):
+            yield json_provider.dumps(archived_log_json(doc)) + '\n'
+
+    response = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    response.headers['Content-Disposition'] = f"attachment; filename=api-logs-{month}.ndjson"
+    return response
+
+
+def _local_datetime(value):
+    """Parse an ISO date/datetime as naive local time, the way log times are stored."""
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone().replace(tzinfo=None)
+    return parsed
+
+
+@logs_bp.route('/analytics', methods=['GET'])
+@login_required
+def get_usage_analytics():
+    """Usage time series from the pre-aggregated rollups.
+
+    Query params: start, end (YYYY-MM-DD or ISO datetime; end exclusive; an
+    offset is converted to local time), granularity (hour|day|month, default
+    day), group_by (endpoint|domain|platform).
+    Domains are the callers' Origin hosts, with any past ANALYTICS_MAX_DOMAINS
+    in a month grouped as "other".
+    """
+    try:
+        try:
+            end_date = _local_datetime(request.args['end']) if request.args.get('end') else datetime.now()
+            start_date = (_local_datetime(request.args['start']) if request.args.get('start')
+                          else end_date - timedelta(days=30))
+        except ValueError:
+            return jsonify({"error": "Invalid start or end, expected YYYY-MM-DD"}), 400
+
+        granularity = request.args.get('granularity', 'day')
+        group_by = request.args.get('group_by') or None
+
+        current_user = session.get('user')
+        try:
+            series = query_usage(current_user['id'], start_date, end_date, granularity, group_by)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        return jsonify({
+            "start": start_date.isoformat(),
+            "end": end_date.isoformat(),
+            "granularity": granularity,
+            "group_by": group_by,
+            "data": series,
+        }), 200
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
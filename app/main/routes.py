@@ -1,36 +1,44 @@
 from . import main_bp
-from flask import render_template, redirect, url_for, session, request, jsonify
+from flask import render_template, redirect, url_for, session, request, jsonify, make_response, current_app, g
+from werkzeug.local import LocalProxy
 from models import User
-import requests
+from utils import metrics
+from utils.utils import login_required, admin_required
+from utils import outbox
+from app.config import ZOHO_CREATOR_BASE_URL
+import hashlib
+
+# Anonymous renders of the docs pages: template name -> (html, etag).
+_page_cache = {}
+
+def session_user():
+    """The logged-in User document, loaded on first use and memoized for the request."""
+    if '_session_user' not in g:
+        user = session.get('user')
+        g._session_user = User.objects(id=user['id']).first() if user else None
+        if user:
+            metrics.incr('context.user_lookup')
+    return g._session_user
+
+
+def _authentication_keys():
+    user = session_user()
+    if not user or not user.razorpay_key_id:
+        return {}
+    return {
+        'key_id': user.razorpay_key_id,
+        'key_secret': user.get_razorpay_key_secret() if user.razorpay_key_secret else None,
+    }
+
 
 @main_bp.app_context_processor
 def inject_user():
-    """Check if user is in session and inject user data."""
-    user = session.get('user')
-    
-    if user is None:
-        keys = {}
-        access_token = False
-    else:
-        # Get user object from database
-        user = User.objects(email=user['email']).first()
-        
-        # Ensure user exists in database before accessing attributes
-        if user:
-            keys = {
-                'key_id': user.razorpay_key_id if user.razorpay_key_id else None,
-                'key_secret': User.get_razorpay_key_secret(user) if user.razorpay_key_secret else None
-            }
-            access_token = True if user.access_token else False
-        else:
-            keys = {}
-            access_token = False
-
+    """Inject user data lazily; Mongo is only queried if a template reads it."""
     return {
-        'is_logged_in': user is not None,
-        'current_user': user if user else {},
-        'authentication_keys': keys if keys.get('key_id') else {},
-        'is_access_token': access_token,
+        'is_logged_in': 'user' in session,
+        'current_user': LocalProxy(lambda: session_user() or {}),
+        'authentication_keys': LocalProxy(_authentication_keys),
+        'is_access_token': LocalProxy(lambda: bool(session_user() and session_user().access_token)),
     }
 
 
@@ -38,47 +46,92 @@ def inject_user():
 def home_redirect():
     return redirect(url_for('main_bp.home'))
 
+def render_page(template):
+    """Render a docs page with an ETag, reusing the cached render for anonymous visitors."""
+    anonymous = 'user' not in session
+    cached = _page_cache.get(template) if anonymous else None
+    metrics.incr('docs.page', template=template, cache='hit' if cached else 'miss')
+
+    if cached is None:
+        html = render_template(template)
+        cached = (html, hashlib.sha1(html.encode()).hexdigest())
+        if anonymous and not current_app.debug:
+            _page_cache[template] = cached
+
+    html, etag = cached
+    response = make_response(html)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache' if anonymous else 'private, no-cache'
+    response.vary.add('Cookie')
+    return response.make_conditional(request)
+
 @main_bp.get('/docs/')
 def home():
-    return render_template('home.html')
+    return render_page('home.html')
 
 @main_bp.get('/docs/app')
 def app():
-    return render_template('index.html')
+    return render_page('index.html')
 
 @main_bp.get('/docs/razorpay')
 def doc_page():
-    return render_template('razorpay.html')
+    return render_page('razorpay.html')
 
 @main_bp.get('/docs/settings')
 def settings():
-    return render_template('settings.html')
-
-def newsletterSubscriber(email, stream_name):
-    url = "https://www.zohoapis.in/creator/custom/contact_mcubeinfotech/addLeadIntoEmailCampaign"
+    return render_page('settings.html')
+
+@main_bp.get('/docs/session-context')
+@login_required
+def session_context():
+    """Per-user playground state, kept out of the cached page renders."""
+    user = session_user()
+    if not user:
+        return jsonify({'error': 'User not found'}), 404
+
+    response = jsonify({
+        'key_id': user.razorpay_key_id,
+        'key_secret': user.get_razorpay_key_secret(),
+        'is_access_token': bool(user.access_token),
+    })
+    response.headers['Cache-Control'] = 'no-store'
+    return response, 200
+
+@main_bp.get('/metrics')
+@admin_required
+def metrics_snapshot():
+    return jsonify(metrics.snapshot()), 200
+
+def _from_appengine():
+    # App Engine sets X-Appengine-User-IP on every request (clients cannot
+    # supply it); its own requests, warm-ups included, come from 0.1.0.0/24.
+    return request.headers.get('X-Appengine-User-IP', '').startswith('0.1.0.')
+
+@main_bp.get('/_ah/warmup')
+def warmup():
+    """App Engine warm-up request: connect and load per-worker state before traffic arrives.
+
+    Step errors are logged by utils.warmup; the response only reports timings.
+    """
+    if not _from_appengine():
+        return jsonify({"error": "Not found"}), 404
+    from utils.warmup import warm_up
+    timings, errors = warm_up()
+    return jsonify({'ready': not errors, 'seconds': timings}), 503 if errors else 200
+
+@outbox.handler('zoho.newsletter')
+def newsletterSubscriber(payload, http):
+    url = f"{ZOHO_CREATOR_BASE_URL}/addLeadIntoEmailCampaign"
     
     params = {
         "publickey": "nrmEdjYaOO6fvTfQrhXx07k4O"
     }
 
-    payload = {
-        "email": email,
-        "streamName": stream_name
-    }
-
-    try:
-        response = requests.post(url, params=params, json=payload)
-        
-        if response.status_code == 200:
-            print("Data pushed successfully:", response.json())
-            return response.json()
-        else:
-            print(f"Failed to push data. Status Code: {response.status_code}, Response: {response.text}")
-            return {"error": response.text}
-
-    except Exception as e:
-        print(f"An error occurred: {str(e)}")
-        return {"error": str(e)}
+    response = http.post(url, params=params, json=payload, timeout=outbox.TIMEOUT)
+    if 400 <= response.status_code < 500:
+        raise outbox.PermanentFailure(f"Status Code: {response.status_code}, Response: {response.text}")
+    response.raise_for_status()
+    return response.json()
 
 
 @main_bp.route('/docs/subscribe-to-cloudlesspay', methods=['POST'])
@@ -91,50 +144,38 @@ def subscriberEmail():
         if not email or not stream_name:
             return jsonify({"error": "Missing 'email' or 'streamName' in the payload."}), 400
         
-        # Call the function to push data to Zoho
-        result = newsletterSubscriber(email, stream_name)
-        
-        if "error" in result:
-            return jsonify(result), 400
+        # Delivered to Zoho by the background outbox worker
+        message = outbox.enqueue('zoho.newsletter', {"email": email, "streamName": stream_name})
         
         return jsonify({
-            "message": "Data pushed to Zoho successfully!",
-            "response": result
-        }), 200
+            "message": "Subscription received.",
+            "id": str(message.id)
+        }), 202
     
     except Exception as e:
         return jsonify({"error": f"An unexpected error occurred: {str(e)}"}), 500
     
 
-def customerInquiry(formData):
-    url = "https://www.zohoapis.in/creator/custom/contact_mcubeinfotech/Create_Ticket"
+@outbox.handler('zoho.ticket')
+def customerInquiry(formData, http):
+    url = f"{ZOHO_CREATOR_BASE_URL}/Create_Ticket"
     params = {
         "publickey": "RD2BWP5v4fVRvpfqZjdXWgb9x"
     }
 
-    try:
-        response = requests.post(url, params=params, json=formData)
-        if response.status_code == 200:
-            print("Data pushed successfully:", response.json())
-            return {"status": "success", "data": response.json()}
-        else:
-            print(f"Failed to push data. Status Code: {response.status_code}")
-            return {"status": "error", "message": response.text}
-
-    except Exception as e:
-        print(f"An error occurred: {str(e)}")
-        return {"status": "error", "message": str(e)}
+    response = http.post(url, params=params, json=formData, timeout=outbox.TIMEOUT)
+    if 400 <= response.status_code < 500:
+        raise outbox.PermanentFailure(f"Status Code: {response.status_code}, Response: {response.text}")
+    response.raise_for_status()
+    return response.json()
 
 @main_bp.route('/docs/contact', methods=['POST'])
 def contactForm():
     try:
         data = request.form
-        result = customerInquiry(dict(data))
-
-        if result["status"] == "error":
-            return jsonify(result), 400
+        message = outbox.enqueue('zoho.ticket', dict(data))
 
-        return jsonify(result), 200
+        return jsonify({"status": "success", "message": "Inquiry received.", "id": str(message.id)}), 202
 
     except Exception as e:
         return jsonify({"status": "error", "message": f"Unexpected error: {str(e)}"}), 500
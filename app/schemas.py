@@ -0,0 +1,63 @@
+from utils.schemas import Field, Schema
+
+CREATE_ORDER = Schema('create_order', {
+    'amount': Field('number', gt=0),
+    'currency': Field('str', required=False, default='INR', min_length=3, max_length=3),
+    'receipt': Field('str', required=False, default='receipt#1', max_length=40, coerce=True),
+    'notes': Field('dict', required=False, default=dict),
+    'partial_payment': Field('bool', required=False, default=False),
+    'payment_capture': Field('bool', required=False, default=False),
+    'first_payment_min_amount': Field('number', required=False, gt=0),
+    'callback_url': Field('str', required=False, pattern=r"https://\S+", max_length=2048),
+}, rules=[
+    (lambda d: not d['partial_payment'] or d['first_payment_min_amount'] is not None,
+     'first_payment_min_amount', "The first_payment_min_amount is required if partial_payment is true."),
+    (lambda d: not d['partial_payment'] or d['first_payment_min_amount'] < d['amount'],
+     'first_payment_min_amount', "First payment minimum amount must be less than total order amount"),
+])
+
+SEND_OTP = Schema('send_otp', {
+    'email': Field('email', max_length=254),
+    'username': Field('str', min_length=1, max_length=150),
+})
+
+VERIFY_OTP = Schema('verify_otp', {
+    'email': Field('email', max_length=254),
+    'otp': Field('str', pattern=r"\d{4,8}", coerce=True),
+    'username': Field('str', min_length=1, max_length=150),
+    'password': Field('str', min_length=1, max_length=1024),
+})
+
+LOGIN = Schema('login', {
+    'email': Field('email', max_length=254),
+    'password': Field('str', min_length=1, max_length=1024),
+})
+
+SET_CREDENTIALS = Schema('set_credentials', {
+    'key_id': Field('str', min_length=1, max_length=64),
+    'key_secret': Field('str', min_length=1, max_length=128),
+})
+
+ADD_CREDITS = Schema('add_credits', {
+    'amount': Field('int', gt=0, coerce=True),
+})
+
+PAYMENT_SUCCESS = Schema('payment_success', {
+    'razorpay_order_id': Field('str', min_length=1, max_length=64),
+    'razorpay_payment_id': Field('str', min_length=1, max_length=64),
+    'razorpay_signature': Field('str', min_length=1, max_length=256),
+    'amount': Field('int', gt=0, coerce=True),
+})
+
+BILLING_ADDRESS = Schema('billing_address', {
+    'company_name': Field('str', max_length=200),
+    'phone': Field('str', max_length=20, coerce=True),
+    'email': Field('str', max_length=254),
+    'address': Field('str', max_length=500),
+    'country': Field('str', max_length=100),
+    'state': Field('str', max_length=100),
+    'city': Field('str', max_length=100),
+    'pincode': Field('str', max_length=12, coerce=True),
+    'gst_registered': Field('bool', coerce=True),
+    'gst_number': Field('str', required=False, default='', max_length=15),
+})
@@ -1,36 +1,27 @@
-from flask import request, jsonify, session, render_template
+from flask import request, jsonify, session, render_template, g
 from . import settings_bp
-from models import User, Wallet, PaymentHistory
+from models import User, PaymentHistory
 from utils.utils import *
 from datetime import datetime, timedelta
-import razorpay
-import os
-from dotenv import load_dotenv
-load_dotenv()
 from dateutil.relativedelta import relativedelta
 from mongoengine import Q
-
-RAZORPAY_KEY_ID = os.environ.get('RAZORPAY_KEY_ID')
-RAZORPAY_KEY_SECRET = os.environ.get('RAZORPAY_KEY_SECRET')
-
-razorpay_client = razorpay.Client(auth=(RAZORPAY_KEY_ID, RAZORPAY_KEY_SECRET))
+from utils.db import reporting_read
+from utils.retention import count_logs
+from utils.dashboard import get_summary
+from utils.schemas import validate_json
+from app.schemas import ADD_CREDITS, PAYMENT_SUCCESS, BILLING_ADDRESS
+from app.config import RAZORPAY_KEY_ID
+from utils import razorpay_sdk
 
 @settings_bp.post('/add-credits')
 @login_required
+@validate_json(ADD_CREDITS)
 def add_credits():
-    current_user = session.get('user')
-    user_name = current_user['email']
-    user = User.objects(email=user_name).first()
-
     try:
-        data = request.get_json()
-        amount_to_recharge = int(data.get('amount'))  # amount to add to the wallet
-
-        if not amount_to_recharge or amount_to_recharge <= 0:
-            return jsonify({"error": "Invalid amount provided."}), 400
+        amount_to_recharge = g.payload['amount']  # amount to add to the wallet
         
         # Create a payment order in Razorpay
-        order = razorpay_client.order.create({
+        order = razorpay_sdk.platform_client().order.create({
             'amount': amount_to_recharge * 100,  # Razorpay expects amount in paise
             'currency': 'INR',
             'payment_capture': 1
@@ -41,7 +32,7 @@ def add_credits():
             'message': "Payment order created successfully.",
             'order_id': order['id'],
             'amount': amount_to_recharge * 100,
-            'razorpay_key_id': os.environ.get('RAZORPAY_KEY_ID')
+            'razorpay_key_id': RAZORPAY_KEY_ID
         }), 200
 
     except Exception as e:
@@ -51,36 +42,33 @@ def add_credits():
 
 @settings_bp.post('/payment-success')
 @login_required
+@validate_json(PAYMENT_SUCCESS)
 def payment_success():
     current_user = session.get('user')
-    user_name = current_user['email']
-    user = User.objects(email=user_name).first()
+    user = User.objects(id=current_user['id']).first()
 
     try:
-        data = request.get_json()
-        
-        razorpay_order_id = data.get("razorpay_order_id")
-        razorpay_payment_id = data.get("razorpay_payment_id")
-        razorpay_signature = data.get("razorpay_signature")
-        amount = data.get("amount")
+        data = g.payload
         
-        if not all([razorpay_order_id, razorpay_payment_id, razorpay_signature, amount]):
-            return jsonify({"error": "Missing required fields"}), 400
+        razorpay_order_id = data["razorpay_order_id"]
+        razorpay_payment_id = data["razorpay_payment_id"]
+        razorpay_signature = data["razorpay_signature"]
+        amount = data["amount"]
         
         try:
-            razorpay_client.utility.verify_payment_signature({
+            razorpay_sdk.platform_client().utility.verify_payment_signature({
                 "razorpay_order_id": razorpay_order_id,
                 "razorpay_payment_id": razorpay_payment_id,
                 "razorpay_signature": razorpay_signature
             })
-        except razorpay.errors.SignatureVerificationError:
+        except razorpay_sdk.SignatureVerificationError:
             return jsonify({"error": "Payment verification failed"}), 400
         
-        payment_details = razorpay_client.payment.fetch(razorpay_payment_id)
+        payment_details = razorpay_sdk.platform_client().payment.fetch(razorpay_payment_id)
         payment_method = payment_details.get('method', 'Unknown')
         
         # Get user's wallet and update credits
-        wallet = Wallet.objects(user=user).first()
+        wallet = session_wallet()
         if not wallet:
             return jsonify({"error": "Wallet not found"}), 404
 
@@ -121,13 +109,12 @@ def payment_success():
 
 @settings_bp.post('/save_billing_address')
 @login_required
+@validate_json(BILLING_ADDRESS)
 def save_billing_address():
     current_user = session.get('user')
-    
-    user_name = current_user['email']
-    user = User.objects(email=user_name).first()
+    user = User.objects(id=current_user['id']).first()
 
-    data = request.get_json()
+    data = g.payload
     
     user.set_billing_address({
         'company_name': data['company_name'],
@@ -138,7 +125,8 @@ def save_billing_address():
         'state': data['state'],
         'city': data['city'],
         'pincode': data['pincode'],
-        'gst_registered': data['gst_registered'],
+        # Stored as the string the settings page compares against
+        'gst_registered': 'true' if data['gst_registered'] else 'false',
         'gst_number': data['gst_number'],
     })
     
@@ -150,9 +138,7 @@ def save_billing_address():
 @login_required
 def get_bill_address():
     current_user = session.get('user')
-    
-    user_name = current_user['email']
-    user = User.objects(email=user_name).first()
+    user = User.objects(id=current_user['id']).first()
     
     return jsonify({"message": "Billing addresses retrieved successfully.", "billings": user.get_billing_address()}), 200
 
@@ -181,14 +167,13 @@ def payment_history():
 
         # Current user
         current_user = session.get('user')
-        user_email = current_user.get('email')
-        user = User.objects(email=user_email).first()
+        user = User.objects(id=current_user['id']).first()
 
         if not user:
             return jsonify({"error": "User not found"}), 404
 
         # Base query for PaymentHistory
-        payment_query = PaymentHistory.objects(user=user)
+        payment_query = reporting_read(PaymentHistory.objects(user=user), 'payment_history')
 
         # Apply search filter
         if search_value:
@@ -198,7 +183,7 @@ def payment_history():
             )
 
         # Total records before filtering
-        total_records = PaymentHistory.objects(user=user).count()
+        total_records = reporting_read(PaymentHistory.objects(user=user), 'payment_history').count()
 
         # Filtered records count
         filtered_records = payment_query.count()
@@ -234,13 +219,8 @@ def payment_history():
 @login_required
 def get_user_credits():
     current_user = session.get('user')
-    user_name = current_user['email']
-    user = User.objects(email=user_name).first()
-    
-    if not user:
-        return jsonify({"error": "Invalid or Login expired"}), 403
 
-    wallet = Wallet.objects(user=user).first()
+    wallet = session_wallet()
     if not wallet:
         return jsonify({"error": "Wallet not found"}), 404
 
@@ -249,12 +229,11 @@ def get_user_credits():
     start_of_month = current_date.replace(day=1)
     end_of_month = (start_of_month + relativedelta(months=1)).replace(day=1) - timedelta(seconds=1)
 
-    total_credits_used = APILog.objects(
-        user=user,
-        log_time__gte=start_of_month,
-        log_time__lte=end_of_month,
-        status="success"
-    ).count()  # Count API calls (1 credit per call)
+    # Count API calls (1 credit per call), including months already archived
+    total_credits_used = count_logs(
+        current_user['id'], start_of_month, end_of_month + timedelta(seconds=1),
+        status="success", route='get_credits'
+    )
 
     return jsonify({
         "total_credits": wallet.credits,
@@ -267,17 +246,8 @@ def get_user_credits():
 @login_required
 def get_users_monthwise_credits():
     current_user = session.get('user')
-    user_name = current_user['email']
-    user = User.objects(email=user_name).first()
     
     month = request.args.get("month", "this-month")
-    
-    if not user:
-        return jsonify({"error": "Invalid or Login expired"}), 403
-
-    wallet = Wallet.objects(user=user).first()
-    if not wallet:
-        return jsonify({"error": "Wallet not found"}), 404
 
     today = datetime.today()
     if month == "this-month":
@@ -292,14 +262,34 @@ def get_users_monthwise_credits():
     else:
         return jsonify({"error": "Invalid month selection"}), 400
 
-    total_credits_used = APILog.objects(
-        user=user,
-        log_time__gte=start_date,
-        log_time__lte=end_date,
-        status="success"
-    ).count()
+    total_credits_used = count_logs(
+        current_user['id'], start_date, end_date + timedelta(seconds=1),
+        status="success", route='get_monthwise_credits'
+    )
 
     return jsonify({
         "selected_month": month,
         "credits_used": total_credits_used,
-    }), 200
\ No newline at end of file
+    }), 200
+
+
+@settings_bp.route("/summary", methods=["GET"])
+@login_required
+def get_dashboard_summary():
+    """Balance, recent usage and latest payments for the settings page in one call."""
+    current_user = session.get('user')
+    try:
+        wallet_id = session.get('wallet_id')
+        if not wallet_id:
+            wallet = session_wallet()
+            if not wallet:
+                return jsonify({"error": "Wallet not found"}), 404
+            wallet_id = str(wallet.id)
+
+        summary = get_summary(current_user['id'], wallet_id)
+        if summary is None:
+            return jsonify({"error": "Wallet not found"}), 404
+        return jsonify(summary), 200
+    except Exception as e:
+        print(f"Error building dashboard summary: {e}")
+        return jsonify({"error": "Internal server error"}), 500
@@ -198,9 +198,9 @@ document.getElementById("subscribe").addEventListener("click", () => {
       "streamName": "CloudlessPay"
     }),
   })
-    .then(response => response.json())
-    .then(data => {
-      if (data['response']['code'] === 3000) {
+    .then(response => response.json().then(data => ({ ok: response.ok, data })))
+    .then(({ ok, data }) => {
+      if (ok) {
         // Show success modal
         //alert("You have successfully subscribed to our newsletter. We will keep you updated with our new templates and pricing plans.");
         showModal('You have successfully subscribed to our newsletter. We will keep you updated with our new templates and pricing plans.', 'Success');
@@ -208,7 +208,7 @@ document.getElementById("subscribe").addEventListener("click", () => {
       } else {
         // Show error modal (if API returns an error)
         //alert("Something went wrong. Please try again later.");
-        showModal('Something went wrong. Please try again later.' + error, 'Error');
+        showModal('Something went wrong. Please try again later. ' + (data.error || ''), 'Error');
         document.getElementById("Email").value = "";
       }
     })
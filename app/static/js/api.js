@@ -34,6 +34,7 @@ export const api = {
     addAuthentication: (authData) => apiCall('/auth/set-credentials', 'POST', authData),
     createAccessToken: () => apiCall('/auth/create-access-token'),
     deleteAccessToken: () => apiCall('/auth/delete-access-token', 'DELETE'),
+    getSessionContext: () => apiCall('/docs/session-context'),
 
     login: (loginData) => apiCall('/auth/login', 'POST', loginData),
     register: (registerData) => apiCall('/auth/register', 'POST', registerData),
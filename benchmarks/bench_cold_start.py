@@ -0,0 +1,55 @@
+"""Cold-start benchmark: import time, create_app and the first request served.
+
+Each sample runs in a fresh interpreter, once with LAZY_STARTUP on and once
+off. Eager startup pings Mongo, so it needs MONGO_URI to point at a reachable
+server; lazy startup can serve the docs pages without one. For a per-module
+import breakdown use:  python -X importtime -c "import run"
+
+Run from the repository root:  python -m benchmarks.bench_cold_start [path]
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+SCRIPT = r"""
+import json, sys, time
+started = time.perf_counter()
+from app import create_app
+imported = time.perf_counter()
+app = create_app()
+created = time.perf_counter()
+status = app.test_client().get(sys.argv[1]).status_code
+served = time.perf_counter()
+print(json.dumps({"import": imported - started, "create_app": created - imported,
+                  "first_request": served - created, "status": status}))
+"""
+
+
+def sample(path, lazy):
+    env = dict(os.environ, LAZY_STARTUP='true' if lazy else 'false', INVALIDATION_MODE='off')
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, '-c', SCRIPT, path], env=env,
+                            capture_output=True, text=True, check=True)
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    timings['process'] = time.perf_counter() - started
+    return timings
+
+
+def main(path='/docs/', repeat=5):
+    for lazy in (True, False):
+        try:
+            runs = [sample(path, lazy) for _ in range(repeat)]
+        except subprocess.CalledProcessError as e:
+            print(f"LAZY_STARTUP={lazy}: failed\n{e.stderr.strip().splitlines()[-1]}")
+            continue
+        medians = {key: statistics.median(run[key] for run in runs)
+                   for key in ('import', 'create_app', 'first_request', 'process')}
+        print(f"LAZY_STARTUP={str(lazy).lower():5s} GET {path} -> {runs[0]['status']}  " +
+              '  '.join(f"{key} {value * 1000:7.1f} ms" for key, value in medians.items()))
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:2])
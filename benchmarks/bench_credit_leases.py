@@ -0,0 +1,71 @@
+"""Contention benchmark: per-request wallet $inc vs per-worker credit leases.
+
+Needs a MongoDB replica set (leases use transactions). Uses a throwaway
+wallet document that is removed afterwards.
+
+Run from the repository root:  MONGO_URI=... python -m benchmarks.bench_credit_leases
+"""
+import multiprocessing
+import time
+from bson import ObjectId
+from mongoengine import connect
+from mongoengine.connection import get_db
+from app.config import MONGO_URI
+
+WORKERS = 8
+CHARGES_PER_WORKER = 2_000
+LEASE_SIZE = 50
+
+
+def _worker(mode, wallet_id, charges, start):
+    connect(host=MONGO_URI)
+    from models import Wallet
+    from utils import credit_leases
+    credit_leases.CREDIT_LEASE_SIZE = LEASE_SIZE
+
+    start.wait()
+    for _ in range(charges):
+        if mode == 'inc':
+            Wallet.apply_credits(wallet_id, -1, floor=0)
+        elif credit_leases.charge(wallet_id) is None:
+            Wallet.apply_credits(wallet_id, -1, floor=0)
+    credit_leases.release_all()
+
+
+def run(mode, wallets, leases):
+    initial = WORKERS * CHARGES_PER_WORKER + 10_000
+    wallet_id = ObjectId()
+    wallets.insert_one({'_id': wallet_id, 'user': ObjectId(), 'credits': float(initial)})
+
+    start = multiprocessing.Barrier(WORKERS + 1)
+    procs = [multiprocessing.Process(target=_worker, args=(mode, wallet_id, CHARGES_PER_WORKER, start))
+             for _ in range(WORKERS)]
+    for proc in procs:
+        proc.start()
+    start.wait()
+    began = time.perf_counter()
+    for proc in procs:
+        proc.join()
+    elapsed = time.perf_counter() - began
+
+    final = wallets.find_one({'_id': wallet_id})['credits']
+    expected = initial - WORKERS * CHARGES_PER_WORKER
+    wallets.delete_one({'_id': wallet_id})
+    leases.delete_many({'wallet': wallet_id})
+    return elapsed, final, expected
+
+
+def main():
+    connect(host=MONGO_URI)
+    db = get_db()
+    wallets, leases = db['wallet'], db['credit_leases']
+    total = WORKERS * CHARGES_PER_WORKER
+    print(f"{WORKERS} workers x {CHARGES_PER_WORKER} charges on one wallet (lease size {LEASE_SIZE})")
+    for mode, label in [('inc', "per-request $inc"), ('lease', "credit leases")]:
+        elapsed, final, expected = run(mode, wallets, leases)
+        status = "exact" if final == expected else f"MISMATCH (expected {expected})"
+        print(f"{label:18s} {total / elapsed:9.0f} charges/s  final balance {final:g} {status}")
+
+
+if __name__ == '__main__':
+    main()
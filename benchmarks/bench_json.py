@@ -0,0 +1,81 @@
+"""Micro-benchmark: JSON encoding of the logs and payment-history DataTables pages.
+
+Compares Flask's default provider with utils.json_provider on synthetic
+pages shaped like /api/logs and /settings/payment-history responses, and
+the encoding of order payloads stored on api_logs. No database is needed.
+
+Run from the repository root:  python -m benchmarks.bench_json
+"""
+import json
+import timeit
+from datetime import datetime, timedelta
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+from utils import json_provider
+from utils.json_provider import FastJSONProvider
+
+
+def razorpay_order(i):
+    return {
+        "id": f"order_N5dK2aJ1b{i:05d}", "entity": "order", "amount": 49900 + i, "amount_paid": 0,
+        "amount_due": 49900 + i, "currency": "INR", "receipt": f"inv-2024-{i:05d}", "offer_id": None,
+        "status": "created", "attempts": 0, "created_at": 1718000000 + i,
+        "notes": {"customer": "Acme Traders", "plan": "pro", "intent": f"{i:024x}"},
+    }
+
+
+def logs_page(rows):
+    now = datetime(2024, 6, 1, 9, 30)
+    return {
+        "draw": 3, "recordsTotal": 125_000, "recordsFiltered": 125_000,
+        "data": [{
+            "id": f"{i:024x}",
+            "time": (now - timedelta(minutes=i)).strftime('%Y-%m-%d %H:%M:%S'),
+            "endpoint": "/api/create-order",
+            "user": "acme",
+            "domain": "shop.acme.in",
+            "platform": "Chrome on Windows",
+            "response": json_provider.dumps(razorpay_order(i)),
+        } for i in range(rows)],
+    }
+
+
+def payments_page(rows):
+    now = datetime(2024, 6, 1)
+    return {
+        "draw": 1, "recordsTotal": 480, "recordsFiltered": 480,
+        "data": [{
+            "payment_date": (now - timedelta(days=i)).strftime("%d-%m-%Y"),
+            "transaction_id": f"pay_N5dK7Yv2c{i:05d}",
+            "amount": f"₹{500 + i:.2f}",
+            "status": "success",
+            "payment_method": "upi",
+        } for i in range(rows)],
+    }
+
+
+def main(number=200):
+    app = Flask(__name__)
+    providers = [("default", DefaultJSONProvider(app)), ("orjson", FastJSONProvider(app))]
+    cases = [
+        ("logs, 10 rows", logs_page(10)),
+        ("logs, 100 rows", logs_page(100)),
+        ("payment-history, 10 rows", payments_page(10)),
+        ("payment-history, 100 rows", payments_page(100)),
+    ]
+
+    with app.app_context():
+        for name, page in cases:
+            for label, provider in providers:
+                seconds = min(timeit.repeat(lambda: provider.response(page), number=number, repeat=5))
+                size = len(provider.response(page).get_data())
+                print(f"{name:26s} {label:8s} {seconds * 1e6 / number:9.1f} us/response  {size:7d} bytes")
+
+    order = razorpay_order(1)
+    for label, dumps in [("json.dumps", json.dumps), ("orjson", json_provider.dumps)]:
+        seconds = min(timeit.repeat(lambda: dumps(order), number=number * 50, repeat=5))
+        print(f"{'stored log payload':26s} {label:10s} {seconds * 1e9 / (number * 50):7.0f} ns/payload")
+
+
+if __name__ == '__main__':
+    main()
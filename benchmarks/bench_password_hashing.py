@@ -0,0 +1,60 @@
+"""Login hashing benchmark: inline werkzeug checks vs the bounded process pool.
+
+Each simulated request thread verifies one password. Reports throughput,
+tail latency and admission-control rejections at several concurrency levels.
+
+Run from the repository root:  python -m benchmarks.bench_password_hashing
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.security import generate_password_hash, check_password_hash
+from app.config import PASSWORD_HASH_METHOD, PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_PENDING
+from utils import passwords
+
+CONCURRENCY = (1, 4, 16, 64)
+LOGINS = 200
+PASSWORD = "correct horse battery staple"
+
+
+def _login(verify, stored):
+    started = time.perf_counter()
+    try:
+        ok = verify(stored, PASSWORD)
+    except passwords.HashingBusy:
+        return None
+    assert ok
+    return time.perf_counter() - started
+
+
+def _percentile(sorted_values, pct):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * pct / 100))]
+
+
+def run(verify, stored, concurrency):
+    with ThreadPoolExecutor(max_workers=concurrency) as threads:
+        started = time.perf_counter()
+        results = list(threads.map(lambda _: _login(verify, stored), range(LOGINS)))
+        elapsed = time.perf_counter() - started
+    latencies = sorted(r for r in results if r is not None)
+    rejected = LOGINS - len(latencies)
+    if not latencies:
+        return f"all {rejected} rejected"
+    p50, p95, p99 = (_percentile(latencies, pct) * 1e3 for pct in (50, 95, 99))
+    return (f"{len(latencies) / elapsed:7.1f} logins/s  p50 {p50:7.1f}ms  "
+            f"p95 {p95:7.1f}ms  p99 {p99:7.1f}ms  rejected {rejected}")
+
+
+def main():
+    stored = generate_password_hash(PASSWORD, PASSWORD_HASH_METHOD)
+    print(f"method {PASSWORD_HASH_METHOD}, pool {PASSWORD_HASH_WORKERS} workers, "
+          f"max pending {PASSWORD_HASH_MAX_PENDING}, {LOGINS} logins per run")
+    pooled = lambda h, p: passwords.verify_password(h, p)[0]
+    passwords.verify_password(stored, PASSWORD)  # start the pool outside the timings
+    for concurrency in CONCURRENCY:
+        print(f"\nconcurrency {concurrency}")
+        print(f"  inline  {run(check_password_hash, stored, concurrency)}")
+        print(f"  pool    {run(pooled, stored, concurrency)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,39 @@
+"""Micro-benchmark: per-request cost of the compiled request schemas.
+
+Run from the repository root:  python -m benchmarks.bench_schemas
+"""
+import timeit
+from app import schemas
+
+CASES = [
+    ("create_order (minimal)", schemas.CREATE_ORDER, {"amount": 499}),
+    ("create_order (full)", schemas.CREATE_ORDER, {
+        "amount": 1500, "currency": "INR", "receipt": "inv-2024-0042",
+        "notes": {"customer": "acme", "plan": "pro"}, "partial_payment": True,
+        "first_payment_min_amount": 500, "payment_capture": True,
+    }),
+    ("create_order (invalid)", schemas.CREATE_ORDER, {"amount": "lots", "notes": ["x"]}),
+    ("login", schemas.LOGIN, {"email": "dev@example.com", "password": "hunter2hunter2"}),
+    ("verify_otp", schemas.VERIFY_OTP, {"email": "dev@example.com", "otp": "482913",
+                                        "username": "dev", "password": "hunter2hunter2"}),
+    ("payment_success", schemas.PAYMENT_SUCCESS, {
+        "razorpay_order_id": "order_N5dK2aJ1bX", "razorpay_payment_id": "pay_N5dK7Yv2cQ",
+        "razorpay_signature": "9f2c" * 16, "amount": 50000,
+    }),
+    ("billing_address", schemas.BILLING_ADDRESS, {
+        "company_name": "Acme", "phone": "9876543210", "email": "billing@acme.in",
+        "address": "12 MG Road", "country": "India", "state": "Karnataka", "city": "Bengaluru",
+        "pincode": "560001", "gst_registered": "true", "gst_number": "29ABCDE1234F1Z5",
+    }),
+]
+
+
+def main(number=100_000):
+    for name, schema, payload in CASES:
+        seconds = min(timeit.repeat(lambda: schema(payload), number=number, repeat=5))
+        _, errors = schema(payload)
+        print(f"{name:26s} {seconds * 1e9 / number:8.0f} ns/request  {'rejected' if errors else 'ok'}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""Micro-benchmark: User-Agent classification over a realistic log corpus.
+
+Run from the repository root:  python -m benchmarks.bench_user_agents
+"""
+import random
+import timeit
+from utils.user_agents import classify
+
+CORPUS = [
+    "PostmanRuntime/7.36.0",
+    "curl/8.4.0",
+    "python-requests/2.31.0",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36 Edg/120.0.2210.91",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.1 Safari/605.1.15",
+    "Mozilla/5.0 (iPhone; CPU iPhone OS 17_1 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.1 Mobile/15E148 Safari/604.1",
+    "Mozilla/5.0 (iPhone; CPU iPhone OS 17_1 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) CriOS/120.0.6099.119 Mobile/15E148 Safari/604.1",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:121.0) Gecko/20100101 Firefox/121.0",
+    "Mozilla/5.0 (Linux; Android 14; Pixel 8) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.6099.144 Mobile Safari/537.36",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36 OPR/106.0.0.0",
+    "Unknown",
+]
+
+
+def legacy_identify_client(user_agent):
+    """The substring chain classify() replaced, kept here for comparison."""
+    if 'Postman' in user_agent:
+        return 'Postman'
+    elif 'curl' in user_agent:
+        return 'cURL'
+    elif 'Chrome' in user_agent:
+        return 'Google Chrome'
+    elif 'Firefox' in user_agent:
+        return 'Mozilla Firefox'
+    elif 'Safari' in user_agent and 'Chrome' not in user_agent:
+        return 'Apple Safari'
+    elif 'Edge' in user_agent:
+        return 'Microsoft Edge'
+    else:
+        return 'Unknown Client'
+
+
+def main(requests=200_000):
+    random.seed(7)
+    # Skewed like production traffic: a few UAs dominate, most repeat.
+    stream = random.choices(CORPUS, weights=[30, 10, 5, 20, 10, 8, 6, 4, 2, 3, 2, 1, 1], k=requests)
+
+    def run(fn):
+        return min(timeit.repeat(lambda: [fn(ua) for ua in stream], number=1, repeat=5))
+
+    uncached = classify.__wrapped__
+    for name, fn in [("legacy substring chain", legacy_identify_client),
+                     ("compiled regex (no cache)", uncached),
+                     ("compiled regex + LRU", classify)]:
+        seconds = run(fn)
+        print(f"{name:28s} {seconds * 1e9 / requests:8.1f} ns/request")
+    print(classify.cache_info())
+
+    print("\nClassification changes vs legacy:")
+    for ua in CORPUS:
+        old, new = legacy_identify_client(ua), classify(ua)
+        if old != new:
+            print(f"  {old:16s} -> {new:16s} {ua[:70]}")
+
+
+if __name__ == '__main__':
+    main()
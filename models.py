@@ -1,13 +1,14 @@
-from mongoengine import Document, fields, CASCADE, signals
-from werkzeug.security import generate_password_hash, check_password_hash
-from cryptography.fernet import Fernet
+from mongoengine import Document, fields, CASCADE, signals, NotUniqueError
+from pymongo import ReturnDocument
+from utils import crypto, passwords
 from uuid import uuid4
 from datetime import datetime
-import os
+import json
+import zlib
 
 
 class User(Document):
-    meta = {'collection': 'users'}
+    meta = {'collection': 'users', 'indexes': ['updated_at']}
     
     id = fields.StringField(primary_key=True, default=lambda: str(uuid4()))
     username = fields.StringField(required=True, max_length=150)
@@ -23,23 +24,29 @@ class User(Document):
     is_active = fields.BooleanField(default=True)
 
     def set_hashed_password(self, password):
-        self.password = generate_password_hash(password)
+        self.password = passwords.hash_password(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password, password)
+        """Verify a password, re-hashing it if the hash parameters have changed."""
+        matches, needs_rehash = passwords.verify_password(self.password, password)
+        if needs_rehash:
+            # Best effort: a busy pool must not fail a login that already verified.
+            try:
+                rehashed = passwords.hash_password(password)
+            except passwords.HashingBusy:
+                return matches
+            self.password = rehashed
+            User.objects(id=self.id).update_one(set__password=self.password)
+        return matches
 
     def set_razorpay_credentials(self, key_id, key_secret):
-        if not os.environ.get('SECRET_KEY'):
-            raise ValueError("SECRET_KEY is not set in the environment variables.")
         self.razorpay_key_id = key_id
-        cipher_suite = Fernet(str(os.environ.get('SECRET_KEY')).encode())
-        self.razorpay_key_secret = cipher_suite.encrypt(key_secret.encode()).decode()
+        self.razorpay_key_secret = crypto.encrypt(key_secret)
 
     def get_razorpay_key_secret(self):
         if not self.razorpay_key_secret:
             return None
-        cipher_suite = Fernet(str(os.environ.get('SECRET_KEY')).encode())
-        return cipher_suite.decrypt(self.razorpay_key_secret.encode()).decode()
+        return crypto.decrypt_cached(self.id, self.razorpay_key_secret)
 
     def set_billing_address(self, address_data):
         self.billing_address = address_data
@@ -49,17 +56,28 @@ class User(Document):
         return self.billing_address or {}
 
 class RevokedToken(Document):
-    meta = {'collection': 'revoked_tokens'}
+    meta = {
+        'collection': 'revoked_tokens',
+        # Entries are pruned once the token could no longer be used anyway.
+        'indexes': [{'fields': ['expires_at'], 'expireAfterSeconds': 0}, 'revoked_at'],
+    }
     
     id = fields.SequenceField(primary_key=True)
     jti = fields.StringField(required=True, unique=True)
     revoked_at = fields.DateTimeField(default=datetime.now)
+    # The revoked token's own expiry; unset for legacy non-expiring tokens.
+    expires_at = fields.DateTimeField()
 
 
 class Wallet(Document):
+    meta = {'indexes': ['user', 'last_updated']}
+
     user = fields.ReferenceField(User, reverse_delete_rule=CASCADE)
     credits = fields.FloatField(default=200.0)  # Initial free credits
-    last_updated = fields.DateTimeField(default=datetime.now())
+    # Credits taken out of ``credits`` by active leases (see utils.credit_leases).
+    leased = fields.IntField(default=0)
+    lease_recall_at = fields.DateTimeField()
+    last_updated = fields.DateTimeField(default=datetime.now)
 
     def to_json(self):
         return {
@@ -68,11 +86,32 @@ class Wallet(Document):
             "last_updated": self.last_updated.isoformat(),
         }
 
+    @classmethod
+    def apply_credits(cls, wallet_id, delta, floor=None, include_leased=False):
+        """Atomically add ``delta`` credits and return the new balance.
+
+        With ``floor`` set, the update only applies if the balance stays at
+        or above it; None is returned when it would not. The floor applies to
+        unleased credits; ``include_leased`` adds credits held by active
+        leases to the balance returned.
+        """
+        query = {'_id': wallet_id}
+        if floor is not None:
+            query['credits'] = {'$gte': floor - delta}
+        doc = cls._get_collection().find_one_and_update(
+            query,
+            {'$inc': {'credits': delta}, '$set': {'last_updated': datetime.now()}},
+            projection={'credits': True, 'leased': True},
+            return_document=ReturnDocument.AFTER,
+        )
+        if doc is None:
+            return None
+        return doc['credits'] + doc.get('leased', 0) if include_leased else doc['credits']
+
     def add_credits(self, amount):
         """Add credits to the wallet."""
-        self.credits += amount
+        self.credits = Wallet.apply_credits(self.id, amount)
         self.last_updated = datetime.now()
-        self.save()
 
     def deduct_credits(self, amount):
         """Deduct credits if sufficient balance exists."""
@@ -111,41 +150,351 @@ class PaymentHistory(Document):
         return cls.objects(user=user).order_by("-payment_date")
 
 
+# Process-local view of the api_log_codes lookup table; codes never change once assigned.
+_code_by_value = {}
+_value_by_code = {}
+
+
+class LogCode(Document):
+    """Interns low-cardinality APILog values (endpoint, platform, status) as small integers."""
+    meta = {
+        'collection': 'api_log_codes',
+        'indexes': [{'fields': ('kind', 'value'), 'unique': True}],
+    }
+
+    id = fields.SequenceField(primary_key=True)
+    kind = fields.StringField(required=True)
+    value = fields.StringField(required=True)
+
+    def _remember(self):
+        _code_by_value[(self.kind, self.value)] = self.id
+        _value_by_code[self.id] = self.value
+
+    @classmethod
+    def code_for(cls, kind, value):
+        """Return the code for a value, creating the lookup entry on first use."""
+        if value is None:
+            return None
+        if (kind, value) not in _code_by_value:
+            entry = cls.objects(kind=kind, value=value).first()
+            if not entry:
+                try:
+                    entry = cls(kind=kind, value=value).save()
+                except NotUniqueError:
+                    entry = cls.objects(kind=kind, value=value).first()
+            entry._remember()
+        return _code_by_value[(kind, value)]
+
+    @classmethod
+    def value_for(cls, code):
+        if code is None:
+            return None
+        if code not in _value_by_code:
+            entry = cls.objects(id=code).first()
+            if not entry:
+                return None
+            entry._remember()
+        return _value_by_code[code]
+
+    @classmethod
+    def preload(cls):
+        """Load the whole (small) lookup table into this process, e.g. at warm-up."""
+        for entry in cls.objects:
+            entry._remember()
+        return len(_value_by_code)
+
+    @classmethod
+    def codes_matching(cls, kind, text):
+        """Codes whose value contains ``text`` (case-insensitive), for search filters."""
+        return [entry.id for entry in cls.objects(kind=kind, value__icontains=text)]
+
+    @classmethod
+    def value_expression(cls, kind, code_field, legacy_field):
+        """Aggregation expression for a field's text on compact and legacy documents, for sorting."""
+        entries = list(cls.objects(kind=kind))
+        for entry in entries:
+            entry._remember()
+        if not entries:
+            return f'${legacy_field}'
+        branches = [{'case': {'$eq': [f'${code_field}', entry.id]}, 'then': entry.value} for entry in entries]
+        return {'$ifNull': [f'${legacy_field}', {'$switch': {'branches': branches, 'default': None}}]}
+
+
 class APILog(Document):
-    meta = {'collection': 'api_logs'}
-    
+    meta = {
+        'collection': 'api_logs',
+        'indexes': [('user', '-log_time'), 'log_time', {'fields': ['credit_lease'], 'sparse': True}],
+    }
+
+    # Responses at least this long are stored zlib-compressed in ``response_blob``.
+    RESPONSE_COMPRESS_MIN = 128
+
     user = fields.ReferenceField(User, reverse_delete_rule=CASCADE)
     log_time = fields.DateTimeField(default=datetime.now)
-    endpoint = fields.StringField(max_length=120)
     domain = fields.StringField(max_length=120)
+    # Compact storage: interned codes and a compressed response payload.
+    endpoint_code = fields.IntField(db_field='ec')
+    platform_code = fields.IntField(db_field='pc')
+    status_code = fields.IntField(db_field='sc')
+    response_blob = fields.BinaryField(db_field='rz')
+    # Order id and receipt of a compressed response, kept as plain text for search.
+    response_keys = fields.StringField(db_field='rk')
+    # Legacy full-string fields, still present on documents not yet migrated
+    # (see ``flask compact-logs``). ``response`` also holds short responses.
+    endpoint = fields.StringField(max_length=120)
     platform = fields.StringField(max_length=50)
     response = fields.StringField()
-    status = fields.StringField(default="success")
-    
+    status = fields.StringField()
+    # Credit lease the call was charged against, when credit leasing is on.
+    credit_lease = fields.ObjectIdField(db_field='cl')
+
+    def get_endpoint(self):
+        return LogCode.value_for(self.endpoint_code) if self.endpoint_code is not None else self.endpoint
+
+    def get_platform(self):
+        return LogCode.value_for(self.platform_code) if self.platform_code is not None else self.platform
+
+    def get_status(self):
+        return LogCode.value_for(self.status_code) if self.status_code is not None else self.status
+
+    def get_response(self):
+        if self.response_blob is not None:
+            return zlib.decompress(self.response_blob).decode()
+        return self.response
+
     def to_json(self):
         return {
             "user_id": str(self.user.id),
-            "endpoint": self.endpoint,
+            "endpoint": self.get_endpoint(),
             "domain": self.domain,
-            "platform": self.platform,
-            "response": self.response,
-            "status": self.status,
+            "platform": self.get_platform(),
+            "response": self.get_response(),
+            "status": self.get_status(),
             "log_time": self.log_time.isoformat(),
         }
-    
+
     @classmethod
-    def log_api_call(cls, user, endpoint, domain, platform, response, status):
+    def compact_fields(cls, endpoint, platform, status, response):
+        """Map full-string values to their compact stored form (keyed by db field name)."""
+        stored = {
+            'ec': LogCode.code_for('endpoint', endpoint),
+            'pc': LogCode.code_for('platform', platform),
+            'sc': LogCode.code_for('status', status),
+        }
+        if response is not None and len(response) >= cls.RESPONSE_COMPRESS_MIN:
+            stored['rz'] = zlib.compress(response.encode())
+            keys = cls.response_keys_for(response)
+            if keys:
+                stored['rk'] = keys
+        elif response is not None:
+            stored['response'] = response
+        return stored
+
+    @staticmethod
+    def response_keys_for(response):
+        """Order id and receipt from a logged create-order response, space separated."""
+        try:
+            body = json.loads(response)
+        except ValueError:
+            return None
+        order = body.get('order') if isinstance(body, dict) else None
+        if not isinstance(order, dict):
+            return None
+        return ' '.join(str(order[key]) for key in ('id', 'receipt') if order.get(key)) or None
+
+    @classmethod
+    def sort_expression(cls, column):
+        """Aggregation expression ordering by the text of ``endpoint`` or ``response``.
+
+        Compressed responses sort by their order id and receipt.
+        """
+        if column == 'endpoint':
+            return LogCode.value_expression('endpoint', 'ec', 'endpoint')
+        return {'$ifNull': ['$response', '$rk']}
+
+    @classmethod
+    def status_raw_query(cls, status):
+        """Raw filter matching ``status`` on both compact and legacy documents."""
+        return {'$or': [{'sc': LogCode.code_for('status', status)}, {'status': status}]}
+
+    @classmethod
+    def raw_to_json(cls, doc):
+        """Render a raw api_logs document (hot or archived) like ``to_json``."""
+        return {
+            "user_id": str(doc.get('user')),
+            "endpoint": LogCode.value_for(doc['ec']) if 'ec' in doc else doc.get('endpoint'),
+            "domain": doc.get('domain'),
+            "platform": LogCode.value_for(doc['pc']) if 'pc' in doc else doc.get('platform'),
+            "response": zlib.decompress(doc['rz']).decode() if 'rz' in doc else doc.get('response'),
+            "status": LogCode.value_for(doc['sc']) if 'sc' in doc else doc.get('status'),
+            "log_time": doc['log_time'].isoformat(),
+        }
+
+    @classmethod
+    def log_api_call(cls, user, endpoint, domain, platform, response, status, credit_lease=None):
         """Log an API call made by a user."""
+        stored = cls.compact_fields(endpoint, platform, status, response)
         log = cls(
             user=user,
             log_time=datetime.now(),
-            endpoint=endpoint,
             domain=domain,
-            platform=platform,
-            response=response,
-            status=status,
+            endpoint_code=stored['ec'],
+            platform_code=stored['pc'],
+            status_code=stored['sc'],
+            response_blob=stored.get('rz'),
+            response_keys=stored.get('rk'),
+            response=stored.get('response'),
+            credit_lease=credit_lease,
         )
         log.save()
+        return log
+
+
+class UsageRollup(Document):
+    """Pre-aggregated API call counts per user, time bucket and dimension value.
+
+    ``dimension`` is one of endpoint/domain/platform, or ``all`` (with an empty
+    ``value``) for the user's overall totals. Maintained by utils.analytics.
+    """
+    meta = {
+        'collection': 'usage_rollups',
+        'indexes': [
+            {'fields': ('user', 'granularity', 'dimension', 'bucket', 'value'), 'unique': True},
+        ],
+    }
+
+    user = fields.StringField(required=True)
+    granularity = fields.StringField(choices=["hour", "day", "month"], required=True)
+    bucket = fields.DateTimeField(required=True)
+    dimension = fields.StringField(choices=["all", "endpoint", "domain", "platform"], required=True)
+    value = fields.StringField(default="")
+    calls = fields.IntField(default=0)
+    failures = fields.IntField(default=0)
+
+
+class CreditLease(Document):
+    """A block of credits taken from a wallet by one worker process.
+
+    Closed leases satisfy granted == spent + returned, and ``spent`` equals the
+    number of successful API logs carrying this lease id (see utils.credit_leases).
+    """
+    meta = {
+        'collection': 'credit_leases',
+        'indexes': [('status', 'expires_at'), 'wallet'],
+    }
+
+    wallet = fields.ObjectIdField(required=True)
+    owner = fields.StringField()
+    granted = fields.IntField(required=True)
+    spent = fields.IntField(default=0)
+    returned = fields.IntField(default=0)
+    status = fields.StringField(choices=["active", "returned", "reclaimed"], default="active")
+    created_at = fields.DateTimeField(default=datetime.now)
+    expires_at = fields.DateTimeField()
+    closed_at = fields.DateTimeField()
+
+
+class AdminChange(Document):
+    """Ledger entry for one record of a bulk admin run (see utils.bulk_admin).
+
+    (run_id, offset) is unique: re-running a run skips records already
+    recorded, so an interrupted run can be resumed with the same run id.
+    """
+    meta = {
+        'collection': 'admin_changes',
+        'indexes': [{'fields': ('run_id', 'offset'), 'unique': True}, ('user', '-created_at')],
+    }
+
+    run_id = fields.StringField(required=True)
+    offset = fields.IntField(required=True)
+    action = fields.StringField(choices=["grant", "set_balance", "activate", "deactivate"])
+    user = fields.StringField()
+    wallet = fields.ObjectIdField()
+    amount = fields.FloatField()
+    # Wallet balance, or is_active for status changes, around the change.
+    before = fields.DynamicField()
+    after = fields.DynamicField()
+    status = fields.StringField(choices=["applied", "unchanged", "failed"], required=True)
+    error = fields.StringField()
+    reason = fields.StringField()
+    actor = fields.StringField()
+    created_at = fields.DateTimeField(default=datetime.now)
+
+
+class Order(Document):
+    """Local copy of a Razorpay order created through /api/create-order.
+
+    Written at creation and refreshed by ``flask sync-orders``; the /api/orders
+    endpoints read only from here. Amounts are in rupees.
+    """
+    meta = {
+        'collection': 'orders',
+        'indexes': [('user', '-created_at', '-id'), ('user', 'receipt'), ('status', 'created_at')],
+    }
+
+    id = fields.StringField(primary_key=True)  # Razorpay order id
+    user = fields.ReferenceField(User, reverse_delete_rule=CASCADE)
+    amount = fields.FloatField()
+    amount_paid = fields.FloatField(default=0)
+    amount_due = fields.FloatField()
+    currency = fields.StringField(max_length=3)
+    receipt = fields.StringField()
+    status = fields.StringField()
+    attempts = fields.IntField(default=0)
+    notes = fields.DictField()
+    partial_payment = fields.BooleanField(default=False)
+    created_at = fields.DateTimeField()
+    synced_at = fields.DateTimeField(default=datetime.now)
+
+    def to_json(self):
+        return {
+            "id": self.id,
+            "amount": self.amount,
+            "amount_paid": self.amount_paid,
+            "amount_due": self.amount_due,
+            "currency": self.currency,
+            "receipt": self.receipt,
+            "status": self.status,
+            "attempts": self.attempts,
+            "notes": self.notes,
+            "partial_payment": self.partial_payment,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "synced_at": self.synced_at.isoformat() if self.synced_at else None,
+        }
+
+
+class OutboxMessage(Document):
+    """An outbound integration call (Zoho, email) awaiting background delivery."""
+    meta = {
+        'collection': 'outbox',
+        'indexes': [('status', 'next_attempt_at')],
+    }
+
+    kind = fields.StringField(required=True)
+    payload = fields.DictField()
+    status = fields.StringField(choices=["pending", "sending", "delivered", "failed"], default="pending")
+    attempts = fields.IntField(default=0)
+    next_attempt_at = fields.DateTimeField(default=datetime.now)
+    last_error = fields.StringField()
+    result = fields.DictField()
+    created_at = fields.DateTimeField(default=datetime.now)
+    delivered_at = fields.DateTimeField()
+
+
+class ServerSession(Document):
+    """Server-side login session; the cookie only carries the session id."""
+    meta = {
+        'collection': 'sessions',
+        'indexes': [{'fields': ['expires_at'], 'expireAfterSeconds': 0}, 'user_id', 'updated_at'],
+    }
+
+    id = fields.StringField(primary_key=True)
+    data = fields.DictField()
+    user_id = fields.StringField()
+    wallet_id = fields.StringField()
+    revoked = fields.BooleanField(default=False)
+    expires_at = fields.DateTimeField()
+    updated_at = fields.DateTimeField(default=datetime.now)
 
 
 def create_wallet(sender, document, **kwargs):
@@ -154,6 +503,12 @@ def create_wallet(sender, document, **kwargs):
         Wallet(user=document).save()
 
 
+def touch_user(sender, document, **kwargs):
+    """Keep updated_at current; it is the invalidation polling watermark."""
+    document.updated_at = datetime.now()
+
+
+signals.pre_save.connect(touch_user, sender=User)
 signals.post_save.connect(create_wallet, sender=User)
         
         
@@ -0,0 +1,21 @@
+import os
+import sys
+import pytest
+
+# Settings are read at import time, so set them before the app is imported.
+# No server is needed: a query that is not expected fails fast instead.
+os.environ.setdefault('MONGO_URI', 'mongodb://127.0.0.1:1/cloudlesspay_test?serverSelectionTimeoutMS=300')
+os.environ.setdefault('INVALIDATION_MODE', 'off')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def db():
+    """An in-memory mongomock database in place of the unreachable server."""
+    mongomock = pytest.importorskip('mongomock')
+    from mongoengine import connect, disconnect
+    disconnect()
+    connect('cloudlesspay_test', host='mongodb://localhost', mongo_client_class=mongomock.MongoClient)
+    yield
+    disconnect()
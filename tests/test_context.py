@@ -0,0 +1,65 @@
+"""Templates that never read the user context must not query Mongo."""
+import threading
+import pytest
+from mongoengine import disconnect
+from pymongo import monitoring
+
+SID = 'test-session-id'
+USER = {'id': 'd6f0c1a4-0000-4000-8000-000000000001', 'email': 'dev@example.com', 'name': 'dev'}
+
+
+class CommandLog(monitoring.CommandListener):
+    """Commands started from the test's own thread (the outbox worker polls from its own)."""
+
+    def __init__(self):
+        self.thread = threading.get_ident()
+        self.commands = []
+
+    def started(self, event):
+        if threading.get_ident() == self.thread:
+            self.commands.append(event.command_name)
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+# Listeners only apply to clients created after they are registered.
+commands = CommandLog()
+monitoring.register(commands)
+
+
+@pytest.fixture
+def client():
+    from app import create_app
+
+    disconnect()
+    app = create_app()
+    app.testing = True
+    yield app.test_client()
+    disconnect()
+
+
+def test_anonymous_login_page_issues_no_queries(client):
+    commands.commands.clear()
+    response = client.get('/auth/authorize')
+
+    # Without a reachable server a query would also turn this into an error.
+    assert response.status_code == 200
+    assert commands.commands == []
+
+
+def test_logged_in_login_page_issues_no_queries(client):
+    from utils.sessions import _sessions
+
+    # A live session already cached on this worker, as after any earlier request.
+    _sessions.set(SID, {'user': USER, 'wallet_id': None})
+    client.set_cookie('session', SID)
+    commands.commands.clear()
+
+    response = client.get('/auth/authorize')
+
+    assert response.status_code == 200
+    assert commands.commands == []
@@ -0,0 +1,70 @@
+"""Deferred order intents: dispatch, release and merchant callbacks."""
+import pytest
+
+import utils.order_intents  # noqa: F401 registers handlers
+
+pytest.importorskip('mongomock')
+
+
+def test_callback_to_private_address_is_refused(db):
+    from models import OutboxMessage
+    from utils import outbox
+
+    message = OutboxMessage(kind='order.callback',
+                            payload={'url': 'https://127.0.0.1/hook', 'user_id': 'u1', 'body': {}}).save()
+    outbox.process_batch()
+
+    message.reload()
+    assert message.status == 'failed'
+    assert message.last_error == "callback_url must resolve to a public address"
+
+
+def _intent(status='failed'):
+    from models import OutboxMessage
+    return OutboxMessage(kind='order.create', status=status, attempts=5, last_error='Read timed out', payload={
+        'key': 'intent-1', 'user_id': 'u1', 'wallet_id': '65f000000000000000000001', 'credit_lease': None,
+        'payment_data': {'amount': 50000, 'receipt': 'r1'}, 'domain': 'shop.example.com', 'platform': 'web',
+        'callback_url': None, 'email': 'dev@example.com', 'balance': 10,
+    }).save()
+
+
+def test_release_completes_an_intent_whose_order_was_created(db, monkeypatch):
+    from utils import order_intents, wallet
+
+    calls, refunds, alerts = [], [], []
+    monkeypatch.setattr(order_intents, '_client', lambda payload, http: None)
+    monkeypatch.setattr(order_intents, '_find_existing', lambda client, payload: {
+        'id': 'order_1', 'amount': 50000, 'amount_due': 50000, 'receipt': 'r1'})
+    monkeypatch.setattr(order_intents, 'record_api_call', lambda *args: calls.append(args[5]))
+    monkeypatch.setattr(wallet, 'refund', lambda *args, **kwargs: refunds.append(args))
+    monkeypatch.setattr(wallet, 'notify_low_balance', lambda *args: alerts.append(args))
+
+    message = _intent()
+    order_intents._release(message, 'Read timed out')
+
+    message.reload()
+    assert message.status == 'delivered'
+    assert message.result['order']['id'] == 'order_1'
+    assert message.last_error is None
+    assert calls == ['success']
+    assert refunds == []
+    assert alerts == [('dev@example.com', 11, 10)]
+
+
+def test_release_refunds_when_no_order_exists(db, monkeypatch):
+    from utils import order_intents, wallet
+
+    calls, refunds = [], []
+    monkeypatch.setattr(order_intents, '_client', lambda payload, http: None)
+    monkeypatch.setattr(order_intents, '_find_existing', lambda client, payload: None)
+    monkeypatch.setattr(order_intents, 'record_api_call', lambda *args: calls.append(args[5]))
+    monkeypatch.setattr(wallet, 'refund', lambda *args, **kwargs: refunds.append(args))
+    monkeypatch.setattr(wallet, 'notify_low_balance', lambda *args: pytest.fail("alerted for a failed order"))
+
+    message = _intent()
+    order_intents._release(message, 'Read timed out')
+
+    message.reload()
+    assert message.status == 'failed'
+    assert calls == ['failure']
+    assert len(refunds) == 1
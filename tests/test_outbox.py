@@ -0,0 +1,161 @@
+"""Outbox delivery, mostly against a local stub of the Zoho Creator API."""
+import json
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+
+pytest.importorskip('mongomock')
+
+
+class StubZoho(BaseHTTPRequestHandler):
+    """Answers every POST with the server's next queued status code."""
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.server.requests.append((self.path, json.loads(body)))
+        status = self.server.statuses.pop(0) if self.server.statuses else 200
+        payload = json.dumps({'code': 3000 if status == 200 else status}).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def zoho(monkeypatch):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubZoho)
+    server.requests, server.statuses = [], []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    import app.main.routes
+    monkeypatch.setattr(app.main.routes, 'ZOHO_CREATOR_BASE_URL', f"http://127.0.0.1:{server.server_port}")
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def handlers(monkeypatch):
+    """Handlers a test registers are dropped again afterwards."""
+    from utils import outbox
+    monkeypatch.setattr(outbox, '_handlers', dict(outbox._handlers))
+    monkeypatch.setattr(outbox, '_failure_handlers', dict(outbox._failure_handlers))
+
+
+def queue(kind='zoho.newsletter', payload=None):
+    # Saved directly rather than via enqueue(), which would also start the worker thread.
+    from models import OutboxMessage
+    return OutboxMessage(kind=kind, payload=payload or {'email': 'dev@example.com', 'streamName': 'news'}).save()
+
+
+def test_backoff_doubles_and_is_capped():
+    from utils.outbox import backoff
+
+    assert [backoff(n).total_seconds() for n in (1, 2, 3)] == [5, 10, 20]
+    assert backoff(30) == timedelta(hours=1)
+
+
+def test_delivers_message(db, zoho):
+    from utils import outbox
+
+    message = queue()
+    assert outbox.process_batch() == 1
+
+    message.reload()
+    assert message.status == 'delivered'
+    assert message.attempts == 1
+    assert message.result == {'code': 3000}
+    assert zoho.requests == [('/addLeadIntoEmailCampaign?publickey=nrmEdjYaOO6fvTfQrhXx07k4O',
+                              {'email': 'dev@example.com', 'streamName': 'news'})]
+
+
+def test_server_error_is_retried_after_backoff(db, zoho):
+    from utils import outbox
+
+    zoho.statuses = [503]
+    message = queue()
+    before = datetime.now()
+    outbox.process_batch()
+
+    message.reload()
+    assert message.status == 'pending'
+    assert message.attempts == 1
+    assert 'Server Error' in message.last_error
+    assert message.next_attempt_at >= before + outbox.backoff(1)
+    # Not due yet: nothing is claimed.
+    assert outbox.process_batch() == 0
+
+    message.update(set__next_attempt_at=datetime.now())
+    assert outbox.process_batch() == 1
+    message.reload()
+    assert message.status == 'delivered'
+    assert message.attempts == 2
+    assert len(zoho.requests) == 2
+
+
+def test_client_error_fails_permanently(db, zoho):
+    from utils import outbox
+
+    zoho.statuses = [400]
+    message = queue()
+    outbox.process_batch()
+
+    message.reload()
+    assert message.status == 'failed'
+    assert message.attempts == 1
+    assert message.last_error.startswith('Status Code: 400')
+
+    message.update(set__next_attempt_at=datetime.now())
+    assert outbox.process_batch() == 0
+    assert len(zoho.requests) == 1
+
+
+def test_result_is_dropped_when_the_claim_was_lost(db, handlers):
+    from models import OutboxMessage
+    from utils import outbox
+
+    taken_over = datetime(2030, 1, 1)
+
+    @outbox.handler('test.reclaimed')
+    def deliver(payload, http):
+        # Another worker re-claims the message while this attempt is running.
+        OutboxMessage.objects(kind='test.reclaimed').update(set__next_attempt_at=taken_over)
+        return {'ok': True}
+
+    message = queue('test.reclaimed', {'n': 1})
+    outbox.process_batch()
+
+    message.reload()
+    assert message.status == 'sending'
+    assert message.attempts == 0
+    assert message.next_attempt_at == taken_over
+
+
+def test_claim_is_renewed_during_slow_delivery(db, handlers, monkeypatch):
+    from utils import outbox
+
+    from models import OutboxMessage
+
+    monkeypatch.setattr(outbox, 'SENDING_LEASE', timedelta(milliseconds=200))
+    leases = []
+
+    @outbox.handler('test.slow')
+    def deliver(payload, http):
+        leases.append(OutboxMessage.objects.get(kind='test.slow').next_attempt_at)
+        time.sleep(0.5)
+        leases.append(OutboxMessage.objects.get(kind='test.slow').next_attempt_at)
+        return {'ok': True}
+
+    message = queue('test.slow', {'n': 1})
+    outbox.process_batch()
+
+    message.reload()
+    assert leases[1] > leases[0] + timedelta(milliseconds=200)
+    assert message.status == 'delivered'
+    assert message.attempts == 1
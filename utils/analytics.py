@@ -0,0 +1,267 @@
+import atexit
+import logging
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from dateutil.relativedelta import relativedelta
+from mongoengine.connection import get_db
+from urllib.parse import urlsplit
+from pymongo import UpdateOne
+from app.config import ANALYTICS_MAX_BUCKETS, ANALYTICS_MAX_DOMAINS, ANALYTICS_FLUSH_INTERVAL
+from models import APILog, LogCode, UsageRollup
+from utils import metrics
+from utils.cache import TTLCache
+from utils.db import REPORTING_READ
+from utils.retention import month_start, months_between, archive_collection_name
+
+GRANULARITIES = ('hour', 'day', 'month')
+DIMENSIONS = ('endpoint', 'domain', 'platform')
+OTHER_DOMAIN = 'other'
+_HOSTNAME = re.compile(r'^([a-z0-9-]{1,63}\.)*[a-z0-9-]{1,63}$')
+
+log = logging.getLogger(__name__)
+
+# (user id, month) -> domains that already have a rollup row, on this worker.
+_known_domains = TTLCache(maxsize=4096, ttl=3600)
+
+# Calls recorded on this worker and not yet written to the rollups.
+_pending = []
+_pending_lock = threading.Lock()
+_flusher = None
+_flusher_pid = None
+
+
+def bucket_start(dt, granularity):
+    if granularity == 'hour':
+        return dt.replace(minute=0, second=0, microsecond=0)
+    if granularity == 'day':
+        return dt.replace(hour=0, minute=0, second=0, microsecond=0)
+    return month_start(dt)
+
+
+def next_bucket(bucket, granularity):
+    if granularity == 'hour':
+        return bucket + timedelta(hours=1)
+    if granularity == 'day':
+        return bucket + timedelta(days=1)
+    return bucket + relativedelta(months=1)
+
+
+def bucket_count(start, end, granularity):
+    """Number of buckets overlapping [start, end)."""
+    if granularity == 'month':
+        return sum(1 for _ in months_between(start, end))
+    seconds = 3600 if granularity == 'hour' else 86400
+    return math.ceil((end - bucket_start(start, granularity)).total_seconds() / seconds)
+
+
+def normalize_domain(origin):
+    """The lower-cased host of an Origin header, '' when absent, or "other" when malformed."""
+    if not origin or origin in ('null', 'unknown domain'):
+        return ''
+    try:
+        host = urlsplit(origin if '//' in origin else '//' + origin).hostname
+    except ValueError:
+        host = None
+    if not host or len(host) > 253 or not _HOSTNAME.match(host):
+        return OTHER_DOMAIN
+    return host
+
+
+def _cap_domain(known, domain):
+    """Keep ``domain`` if it is already known or there is room for it, else "other"."""
+    if not domain or domain in known:
+        return domain
+    if len(known) >= ANALYTICS_MAX_DOMAINS:
+        metrics.incr('analytics.domains_capped')
+        return OTHER_DOMAIN
+    known.add(domain)
+    return domain
+
+
+def _month_domains(user_id, month):
+    known = _known_domains.get((user_id, month))
+    if known is None:
+        known = set(UsageRollup._get_collection().distinct('value', {
+            'user': user_id, 'granularity': 'month', 'bucket': month, 'dimension': 'domain'}))
+        known.discard(OTHER_DOMAIN)
+        _known_domains.set((user_id, month), known)
+    return known
+
+
+def _keys(log_time, values):
+    """Every (granularity, bucket, dimension, value) a single call contributes to."""
+    for granularity in GRANULARITIES:
+        bucket = bucket_start(log_time, granularity)
+        yield granularity, bucket, 'all', ''
+        for dimension in DIMENSIONS:
+            yield granularity, bucket, dimension, values.get(dimension) or ''
+
+
+def record_call(user_id, log_time, endpoint, domain, platform, status):
+    """Queue the rollup increments for one logged call; the flush thread writes them."""
+    if user_id is None:
+        return
+    _start_flusher()
+    with _pending_lock:
+        _pending.append((str(user_id), log_time, endpoint, domain, platform, int(status != 'success')))
+
+
+def flush():
+    """Write the queued calls, one coalesced increment per bucket, in a single round trip.
+
+    Returns the number of calls written.
+    """
+    global _pending
+    with _pending_lock:
+        queued, _pending = _pending, []
+    if not queued:
+        return 0
+    try:
+        counts = defaultdict(lambda: [0, 0])
+        for user_id, log_time, endpoint, domain, platform, failed in queued:
+            domain = normalize_domain(domain)
+            if domain:
+                domain = _cap_domain(_month_domains(user_id, month_start(log_time)), domain)
+            values = {'endpoint': endpoint, 'domain': domain, 'platform': platform}
+            for key in _keys(log_time, values):
+                counts[(user_id,) + key][0] += 1
+                counts[(user_id,) + key][1] += failed
+        ops = [
+            UpdateOne(
+                {'user': user_id, 'granularity': granularity, 'bucket': bucket,
+                 'dimension': dimension, 'value': value},
+                {'$inc': {'calls': calls, 'failures': failures}},
+                upsert=True,
+            )
+            for (user_id, granularity, bucket, dimension, value), (calls, failures) in counts.items()
+        ]
+        UsageRollup._get_collection().bulk_write(ops, ordered=False)
+        metrics.incr('analytics.recorded', len(queued))
+    except Exception as e:
+        # Missed increments are recoverable with `flask rebuild-analytics`.
+        metrics.incr('analytics.record_failed', len(queued))
+        log.error("Error updating usage rollups: %s", e)
+    return len(queued)
+
+
+def _flush_loop():
+    while True:
+        time.sleep(ANALYTICS_FLUSH_INTERVAL)
+        flush()
+
+
+def _start_flusher():
+    global _flusher, _flusher_pid, _pending
+    if _flusher is not None and _flusher_pid == os.getpid() and _flusher.is_alive():
+        return
+    with _pending_lock:
+        if _flusher is not None and _flusher_pid == os.getpid() and _flusher.is_alive():
+            return
+        if _flusher_pid != os.getpid():
+            # Forked with calls still queued: the parent writes those.
+            _pending = []
+        _flusher = threading.Thread(target=_flush_loop, name='analytics-flush', daemon=True)
+        _flusher_pid = os.getpid()
+        _flusher.start()
+
+
+def query_usage(user_id, start, end, granularity='day', group_by=None):
+    """Return rollup rows for [start, end), optionally split by one dimension.
+
+    Reads only the pre-aggregated buckets, so the cost depends on the number
+    of buckets requested, never on how many logs they summarize.
+    """
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"granularity must be one of {', '.join(GRANULARITIES)}")
+    if group_by is not None and group_by not in DIMENSIONS:
+        raise ValueError(f"group_by must be one of {', '.join(DIMENSIONS)}")
+    if end <= start:
+        raise ValueError("end must be after start")
+    if bucket_count(start, end, granularity) > ANALYTICS_MAX_BUCKETS:
+        raise ValueError(f"Range spans more than {ANALYTICS_MAX_BUCKETS} {granularity} buckets")
+
+    metrics.incr('db.read_route', route='analytics', target=REPORTING_READ.mongos_mode)
+    collection = UsageRollup._get_collection().with_options(read_preference=REPORTING_READ)
+    rows = collection.find(
+        {'user': user_id, 'granularity': granularity, 'dimension': group_by or 'all',
+         'bucket': {'$gte': bucket_start(start, granularity), '$lt': end}},
+        {'_id': 0, 'bucket': 1, 'value': 1, 'calls': 1, 'failures': 1},
+    ).sort([('bucket', 1), ('value', 1)])
+
+    return [{
+        "bucket": row['bucket'].isoformat(),
+        **({group_by: row['value']} if group_by else {}),
+        "calls": row['calls'],
+        "failures": row['failures'],
+        "failure_rate": round(row['failures'] / row['calls'], 4) if row['calls'] else 0.0,
+    } for row in rows]
+
+
+def _raw_values(doc):
+    return {
+        'endpoint': LogCode.value_for(doc['ec']) if 'ec' in doc else doc.get('endpoint'),
+        'domain': normalize_domain(doc.get('domain')),
+        'platform': LogCode.value_for(doc['pc']) if 'pc' in doc else doc.get('platform'),
+    }, (LogCode.value_for(doc['sc']) if 'sc' in doc else doc.get('status'))
+
+
+def rebuild_rollups(since=None, batch_size=1000):
+    """Recompute rollups month by month from api_logs and collection-backed archives.
+
+    Buckets are overwritten with ``$set``, so re-running is safe. Returns the
+    number of logs scanned.
+    """
+    db = get_db()
+    hot = APILog._get_collection()
+    oldest = hot.find_one({'user': {'$ne': None}}, sort=[('log_time', 1)])
+    if since is None and oldest is None:
+        return 0
+    since = since or oldest['log_time']
+    archives = set(db.list_collection_names())
+    fields = {'user': 1, 'log_time': 1, 'domain': 1, 'ec': 1, 'pc': 1, 'sc': 1,
+              'endpoint': 1, 'platform': 1, 'status': 1}
+    scanned = 0
+
+    for month in months_between(since, datetime.now() + timedelta(seconds=1)):
+        window = {'log_time': {'$gte': month, '$lt': month + relativedelta(months=1)}, 'user': {'$ne': None}}
+        sources = [hot]
+        if archive_collection_name(month) in archives:
+            sources.append(db[archive_collection_name(month)])
+
+        calls, failures = Counter(), Counter()
+        domains = defaultdict(set)
+        for source in sources:
+            for doc in source.find(window, fields).batch_size(batch_size):
+                values, status = _raw_values(doc)
+                values['domain'] = _cap_domain(domains[doc['user']], values['domain'])
+                for key in _keys(doc['log_time'], values):
+                    calls[(doc['user'],) + key] += 1
+                    failures[(doc['user'],) + key] += int(status != 'success')
+                scanned += 1
+
+        ops = [
+            UpdateOne(
+                {'user': user, 'granularity': granularity, 'bucket': bucket, 'dimension': dimension, 'value': value},
+                {'$set': {'calls': count, 'failures': failures[(user, granularity, bucket, dimension, value)]}},
+                upsert=True,
+            )
+            for (user, granularity, bucket, dimension, value), count in calls.items()
+        ]
+        # Domain rows are replaced rather than overwritten, which also drops rows
+        # recorded before origins were normalized.
+        UsageRollup._get_collection().delete_many(
+            {'dimension': 'domain', 'bucket': {'$gte': month, '$lt': month + relativedelta(months=1)}})
+        for i in range(0, len(ops), batch_size):
+            UsageRollup._get_collection().bulk_write(ops[i:i + batch_size], ordered=False)
+        metrics.incr('analytics.rebuilt_buckets', len(ops))
+        _known_domains.pop_matching(lambda key: key[1] == month)
+
+    return scanned
+
+
+atexit.register(flush)
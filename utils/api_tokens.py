@@ -0,0 +1,53 @@
+import uuid
+from datetime import datetime, timedelta
+from flask_jwt_extended import create_access_token, create_refresh_token, decode_token
+from app.config import API_ACCESS_TOKEN_TTL_MINUTES, API_REFRESH_TOKEN_TTL_DAYS, LEGACY_API_TOKEN_SUNSET
+
+ACCESS_TTL = timedelta(minutes=API_ACCESS_TOKEN_TTL_MINUTES)
+REFRESH_TTL = timedelta(days=API_REFRESH_TOKEN_TTL_DAYS)
+LEGACY_SUNSET = datetime.strptime(LEGACY_API_TOKEN_SUNSET, '%Y-%m-%d') if LEGACY_API_TOKEN_SUNSET else None
+
+
+def issue_refresh_token(email):
+    """The long-lived API key shown on the dashboard. Returns (token, jti)."""
+    jti = str(uuid.uuid4())
+    return create_refresh_token(identity=email, expires_delta=REFRESH_TTL, additional_claims={"jti": jti}), jti
+
+
+def issue_access_token(email, refresh_jti, refresh_expires_at=None):
+    """A short-lived access token; ``rid`` ties it to the refresh token it came from,
+    so revoking the API key also revokes every access token issued from it.
+
+    It never outlives the refresh token (``refresh_expires_at``, None for
+    legacy keys), so a revocation kept until then covers it.
+    """
+    ttl = ACCESS_TTL
+    if refresh_expires_at is not None:
+        # At least a second: a zero expires_delta would mint a token without exp.
+        ttl = max(min(ttl, refresh_expires_at - datetime.now()), timedelta(seconds=1))
+    token = create_access_token(identity=email, expires_delta=ttl, additional_claims={"rid": refresh_jti})
+    return token, int(ttl.total_seconds())
+
+
+def claims_expiry(claims):
+    """When a decoded token expires; None for legacy non-expiring tokens."""
+    exp = claims.get('exp')
+    return datetime.fromtimestamp(exp) if exp else None
+
+
+def token_expiry(token):
+    """When a stored token expires; None for legacy non-expiring tokens."""
+    return claims_expiry(decode_token(token, allow_expired=True))
+
+
+def is_expired(expires_at):
+    return expires_at is not None and expires_at <= datetime.now()
+
+
+def is_legacy(claims):
+    """Tokens issued with expires_delta=False carry no exp claim."""
+    return 'exp' not in claims
+
+
+def legacy_refused():
+    return LEGACY_SUNSET is not None and datetime.now() >= LEGACY_SUNSET
@@ -0,0 +1,150 @@
+import gzip
+import hashlib
+import json
+import os
+import posixpath
+import re
+import shutil
+from app.config import ASSET_BUILD_DIR
+
+try:
+    import brotli
+except ImportError:  # brotli variants are skipped without it
+    brotli = None
+
+try:
+    import rcssmin
+except ImportError:
+    rcssmin = None
+
+try:
+    import rjsmin
+except ImportError:
+    rjsmin = None
+
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app')
+STATIC_DIR = os.path.join(APP_DIR, 'static')
+TEMPLATE_DIR = os.path.join(APP_DIR, 'templates')
+
+DIST_DIR = os.path.join(ASSET_BUILD_DIR, 'assets')
+BUILD_TEMPLATE_DIR = os.path.join(ASSET_BUILD_DIR, 'templates')
+MANIFEST_PATH = os.path.join(ASSET_BUILD_DIR, 'manifest.json')
+
+# Hashed files are served from here with immutable caching.
+ASSET_URL_PREFIX = '/assets/'
+
+# "../static/x", "./../static/x" and "/static/x" inside quoted attributes or imports.
+TEMPLATE_REF = re.compile(r"""(?P<q>["'])(?:\./\.\./|\.\./|/)static/(?P<path>[^"'?#]+)(?P<suffix>[^"']*)(?P=q)""")
+CSS_URL = re.compile(r"""url\(\s*(?P<q>["']?)(?P<ref>[^"')]+)(?P=q)\s*\)""")
+COMPRESSIBLE = {'.css', '.js', '.mjs', '.svg', '.json', '.txt', '.ttf', '.eot', '.otf', '.ico'}
+
+
+def _hashed_name(relpath, content):
+    root, ext = posixpath.splitext(relpath)
+    return f"{root}.{hashlib.sha256(content).hexdigest()[:12]}{ext}"
+
+
+def _minify(relpath, content):
+    if '.min.' in relpath:
+        return content
+    if relpath.endswith('.css') and rcssmin:
+        return rcssmin.cssmin(content.decode()).encode()
+    if relpath.endswith('.js') and rjsmin:
+        return rjsmin.jsmin(content.decode()).encode()
+    return content
+
+
+def _write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as fh:
+        fh.write(content)
+
+
+def _emit(relpath, content):
+    """Write the hashed file and its precompressed variants; return the hashed path."""
+    hashed = _hashed_name(relpath, content)
+    target = os.path.join(DIST_DIR, hashed)
+    _write(target, content)
+
+    if posixpath.splitext(relpath)[1] in COMPRESSIBLE:
+        gz = gzip.compress(content, compresslevel=9, mtime=0)
+        if len(gz) < len(content):
+            _write(target + '.gz', gz)
+        if brotli:
+            br = brotli.compress(content, quality=11)
+            if len(br) < len(content):
+                _write(target + '.br', br)
+    return hashed
+
+
+def _is_local_ref(ref):
+    return not (ref.startswith(('data:', 'http:', 'https:', '//', '#', '/')))
+
+
+def _rewrite_css(relpath, content, manifest):
+    base = posixpath.dirname(relpath)
+
+    def replace(match):
+        ref = match.group('ref').strip()
+        if not _is_local_ref(ref):
+            return match.group(0)
+        path, suffix = re.match(r"([^?#]*)(.*)", ref).groups()
+        hashed = _build_file(posixpath.normpath(posixpath.join(base, path)), manifest)
+        if hashed is None:
+            return match.group(0)
+        return f'url("{posixpath.relpath(hashed, base)}{suffix}")'
+
+    return CSS_URL.sub(replace, content.decode()).encode()
+
+
+def _build_file(relpath, manifest):
+    """Hash one static file (and, for CSS, everything it references)."""
+    if relpath in manifest:
+        return manifest[relpath]
+    source = os.path.join(STATIC_DIR, relpath)
+    if not os.path.isfile(source):
+        return None
+
+    with open(source, 'rb') as fh:
+        content = fh.read()
+    if relpath.endswith('.css'):
+        content = _rewrite_css(relpath, content, manifest)
+
+    manifest[relpath] = _emit(relpath, _minify(relpath, content))
+    return manifest[relpath]
+
+
+def build_assets():
+    """Build hashed, precompressed copies of every static file the templates use.
+
+    Templates are rewritten into the build directory with references pointing
+    at ``ASSET_URL_PREFIX``; the originals in app/templates are left untouched.
+    Returns the manifest mapping original to hashed paths.
+    """
+    shutil.rmtree(ASSET_BUILD_DIR, ignore_errors=True)
+    manifest = {}
+
+    for name in sorted(os.listdir(TEMPLATE_DIR)):
+        if not name.endswith('.html'):
+            continue
+        with open(os.path.join(TEMPLATE_DIR, name), encoding='utf-8') as fh:
+            template = fh.read()
+
+        def replace(match):
+            hashed = _build_file(match.group('path'), manifest)
+            if hashed is None:
+                return match.group(0)
+            q = match.group('q')
+            return f"{q}{ASSET_URL_PREFIX}{hashed}{match.group('suffix')}{q}"
+
+        _write(os.path.join(BUILD_TEMPLATE_DIR, name), TEMPLATE_REF.sub(replace, template).encode('utf-8'))
+
+    _write(MANIFEST_PATH, json.dumps(manifest, indent=2, sort_keys=True).encode())
+    return manifest
+
+
+def load_manifest():
+    if not os.path.isfile(MANIFEST_PATH):
+        return None
+    with open(MANIFEST_PATH) as fh:
+        return json.load(fh)
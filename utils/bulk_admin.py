@@ -0,0 +1,208 @@
+import csv
+import json
+import math
+import time
+from datetime import datetime
+from itertools import islice
+from uuid import uuid4
+from mongoengine.connection import get_connection
+from pymongo import UpdateOne
+from app.config import BULK_ADMIN_CHUNK_SIZE
+from models import AdminChange, User, Wallet
+from utils import metrics, sessions, user_status
+
+# Record fields: action, user_id or email, amount (grant / set_balance), reason.
+#   grant        add ``amount`` credits (negative to take credits back)
+#   set_balance  correct the balance to ``amount``
+#   activate / deactivate  set User.is_active; deactivation also ends sessions
+ACTIONS = ('grant', 'set_balance', 'activate', 'deactivate')
+FORMATS = ('csv', 'ndjson')
+
+
+def read_records(lines, fmt):
+    """Raw records from an iterable of text lines: CSV with a header row, or NDJSON.
+
+    NDJSON lines are parsed lazily (in ``parse_change``) so resuming from an
+    offset does not decode the records it skips. Blank lines are not records.
+    """
+    if fmt == 'csv':
+        return csv.DictReader(lines)
+    if fmt == 'ndjson':
+        return (line for line in lines if line.strip())
+    raise ValueError(f"Unknown format '{fmt}', expected one of {', '.join(FORMATS)}")
+
+
+def parse_change(raw):
+    """Validate one record; raises ValueError with a message for the ledger."""
+    if isinstance(raw, str):
+        try:
+            raw = json.loads(raw)
+        except ValueError as e:
+            raise ValueError(f"Invalid JSON: {e}")
+    if not isinstance(raw, dict):
+        raise ValueError("Record must be an object")
+
+    action = str(raw.get('action') or '').strip().lower()
+    if action not in ACTIONS:
+        raise ValueError(f"action must be one of {', '.join(ACTIONS)}")
+    user_id = str(raw.get('user_id') or '').strip()
+    email = str(raw.get('email') or '').strip()
+    if not user_id and not email:
+        raise ValueError("user_id or email is required")
+
+    amount = None
+    if action in ('grant', 'set_balance'):
+        try:
+            amount = float(raw.get('amount'))
+        except (TypeError, ValueError):
+            raise ValueError("amount must be a number")
+        if not math.isfinite(amount) or (action == 'set_balance' and amount < 0):
+            raise ValueError("amount is out of range")
+
+    return {'action': action, 'user_id': user_id, 'email': email, 'amount': amount,
+            'reason': str(raw.get('reason') or '').strip() or None}
+
+
+def new_run_id():
+    return f"{datetime.now():%Y%m%d-%H%M%S}-{uuid4().hex[:6]}"
+
+
+def _in_transaction(callback):
+    with get_connection().start_session() as session:
+        return session.with_transaction(callback)
+
+
+def _apply_chunk(run_id, chunk, dry_run, actor, reason):
+    """Apply one chunk of (offset, raw) records; returns (ledger entries, deactivated users, skipped)."""
+    ledger = AdminChange._get_collection()
+    users = User._get_collection()
+    wallets = Wallet._get_collection()
+
+    def work(session):
+        now = datetime.now()
+        recorded = {doc['offset']: doc['status'] for doc in ledger.find(
+            {'run_id': run_id, 'offset': {'$in': [offset for offset, _ in chunk]}},
+            {'offset': True, 'status': True}, session=session)}
+        # Failed records are tried again; their old ledger entries are replaced.
+        done = {offset for offset, status in recorded.items() if status != 'failed'}
+        retried = [offset for offset, status in recorded.items() if status == 'failed']
+
+        entries, changes = [], []
+        for offset, raw in chunk:
+            if offset in done:
+                continue
+            entry = {'run_id': run_id, 'offset': offset, 'actor': actor, 'reason': reason, 'created_at': now}
+            try:
+                change = parse_change(raw)
+            except ValueError as e:
+                entries.append(dict(entry, status='failed', error=str(e)))
+                continue
+            entry.update(action=change['action'], amount=change['amount'], reason=change['reason'] or reason)
+            entries.append(entry)
+            changes.append((entry, change))
+
+        ids = list({change['user_id'] for _, change in changes if change['user_id']})
+        emails = list({change['email'] for _, change in changes if change['email']})
+        found = list(users.find({'$or': [{'_id': {'$in': ids}}, {'email': {'$in': emails}}]},
+                                {'email': True, 'is_active': True}, session=session))
+        by_id = {doc['_id']: doc for doc in found}
+        by_email = {doc['email']: doc for doc in found}
+        by_user = {}
+        for doc in wallets.find({'user': {'$in': list(by_id)}}, {'user': True, 'credits': True}, session=session):
+            by_user.setdefault(doc['user'], doc)
+
+        user_ops, wallet_ops, deactivated = [], [], []
+        for entry, change in changes:
+            user = by_id.get(change['user_id']) if change['user_id'] else by_email.get(change['email'])
+            if user is None:
+                entry.update(status='failed', error='User not found')
+                continue
+            entry['user'] = user['_id']
+
+            if change['action'] in ('activate', 'deactivate'):
+                active = change['action'] == 'activate'
+                before = user.get('is_active', True) is not False
+                if before != active:
+                    user_ops.append(UpdateOne({'_id': user['_id']},
+                                              {'$set': {'is_active': active, 'updated_at': now}}))
+                    user['is_active'] = active
+                    if not active:
+                        deactivated.append(user)
+                entry.update(before=before, after=active, status='applied' if before != active else 'unchanged')
+                continue
+
+            wallet = by_user.get(user['_id'])
+            if wallet is None:
+                entry.update(status='failed', error='Wallet not found')
+                continue
+            before = wallet['credits']
+            delta = change['amount'] if change['action'] == 'grant' else change['amount'] - before
+            if delta:
+                wallet_ops.append(UpdateOne({'_id': wallet['_id']},
+                                            {'$inc': {'credits': delta}, '$set': {'last_updated': now}}))
+            # Later records for the same wallet in this chunk build on this one.
+            wallet['credits'] = before + delta
+            entry.update(wallet=wallet['_id'], before=before, after=wallet['credits'],
+                         status='applied' if delta else 'unchanged')
+
+        if not dry_run:
+            if user_ops:
+                users.bulk_write(user_ops, ordered=False, session=session)
+            if wallet_ops:
+                wallets.bulk_write(wallet_ops, ordered=False, session=session)
+            if retried:
+                ledger.delete_many({'run_id': run_id, 'offset': {'$in': retried}, 'status': 'failed'},
+                                   session=session)
+            if entries:
+                ledger.insert_many(entries, ordered=False, session=session)
+        return entries, deactivated, len(done)
+
+    # Wallet reads and $inc writes share the transaction snapshot, so a
+    # concurrent charge makes it retry instead of being overwritten by a
+    # set_balance computed from a stale balance.
+    return work(None) if dry_run else _in_transaction(work)
+
+
+def apply_changes(records, run_id=None, start=0, chunk_size=BULK_ADMIN_CHUNK_SIZE, dry_run=False,
+                  actor=None, reason=None, progress=None):
+    """Apply bulk wallet adjustments and status changes from ``records`` (see ``read_records``).
+
+    Each chunk is one transaction: a bulk_write of $inc / $set updates plus
+    a ledger entry per record. Records before ``start`` are skipped unparsed,
+    and records already applied (or unchanged) in the ledger for ``run_id``
+    are skipped, so a failed run can be resumed from its ``next_offset`` (or
+    from 0) with the same run id; records that failed are tried again. ``dry_run`` computes the same outcome without writing anything.
+    ``progress(report)`` is called after every chunk. Returns the report.
+    """
+    run_id = run_id or new_run_id()
+    report = {'run_id': run_id, 'dry_run': dry_run, 'start': start, 'next_offset': start,
+              'applied': 0, 'unchanged': 0, 'failed': 0, 'skipped': 0, 'errors': [],
+              'seconds': 0.0, 'per_second': 0.0}
+    started = time.perf_counter()
+
+    def run(chunk):
+        entries, deactivated, skipped = _apply_chunk(run_id, chunk, dry_run, actor, reason)
+        if deactivated and not dry_run:
+            sessions.revoke_users_sessions([user['_id'] for user in deactivated])
+            user_status.forget(user['email'] for user in deactivated)
+        for entry in entries:
+            report[entry['status']] += 1
+            if entry['status'] == 'failed' and len(report['errors']) < 100:
+                report['errors'].append({'offset': entry['offset'], 'error': entry['error']})
+        report['skipped'] += skipped
+        report['next_offset'] = chunk[-1][0] + 1
+        report['seconds'] = round(time.perf_counter() - started, 3)
+        report['per_second'] = round((report['next_offset'] - start) / report['seconds'], 1) if report['seconds'] else 0.0
+        metrics.incr('bulk_admin.records', len(chunk), dry_run=dry_run)
+        if progress:
+            progress(report)
+
+    chunk = []
+    for offset, raw in enumerate(islice(records, start, None), start=start):
+        chunk.append((offset, raw))
+        if len(chunk) >= chunk_size:
+            run(chunk)
+            chunk = []
+    if chunk:
+        run(chunk)
+    return report
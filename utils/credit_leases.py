@@ -0,0 +1,322 @@
+import atexit
+import logging
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+from bson import ObjectId
+from mongoengine.connection import get_connection
+from pymongo import ReturnDocument
+from pymongo.errors import PyMongoError
+from app.config import (CREDIT_LEASE_SIZE, CREDIT_LEASE_TTL, CREDIT_LEASE_RECALL_WAIT, WALLET_FLOOR,
+                        LOW_BALANCE_THRESHOLDS)
+from models import APILog, CreditLease, Wallet
+from utils import metrics
+
+log = logging.getLogger(__name__)
+
+# No lease is granted if it would take the unleased balance down to the
+# highest alert threshold (or the floor). Near those limits every order is
+# charged directly, and a direct charge refused while credits are still out on
+# other workers' leases recalls them and retries (see ``recall``).
+LEASE_RESERVE = max(list(LOW_BALANCE_THRESHOLDS) + [WALLET_FLOOR])
+
+# Leases still active this long after expiry are treated as abandoned by a
+# dead worker and reclaimed from the API logs.
+RECLAIM_GRACE = timedelta(seconds=CREDIT_LEASE_TTL)
+
+# How often the return timer looks for expired or recalled leases.
+RETURN_INTERVAL = 1
+
+
+class Lease:
+    """This process's view of one active lease."""
+    __slots__ = ('id', 'wallet_id', 'granted', 'spent', 'granted_at', 'expires_at', 'balance')
+
+    def __init__(self, id, wallet_id, granted, granted_at, balance):
+        self.id = id
+        self.wallet_id = wallet_id
+        self.granted = granted
+        self.spent = 0
+        self.granted_at = granted_at
+        self.expires_at = granted_at + timedelta(seconds=CREDIT_LEASE_TTL)
+        # Wallet balance (counting other leases) right after the grant, excluding this lease.
+        self.balance = balance
+
+    @property
+    def remaining(self):
+        return self.granted - self.spent
+
+    def expired(self):
+        return datetime.now() >= self.expires_at
+
+
+_leases = {}
+_locks = {}
+_registry_lock = threading.Lock()
+_pid = os.getpid()
+_timer = None
+_timer_pid = None
+
+
+def _wallet_lock(wallet_id):
+    global _pid
+    with _registry_lock:
+        if _pid != os.getpid():
+            # Forked after leasing: those leases belong to the parent.
+            _leases.clear()
+            _locks.clear()
+            _pid = os.getpid()
+        return _locks.setdefault(wallet_id, threading.Lock())
+
+
+def _in_transaction(callback):
+    """Run ``callback(session)`` in a multi-document transaction."""
+    with get_connection().start_session() as session:
+        return session.with_transaction(callback)
+
+
+def _grant(wallet_id, size):
+    now = datetime.now()
+    lease_id = ObjectId()
+
+    def take(session):
+        doc = Wallet._get_collection().find_one_and_update(
+            {'_id': wallet_id, 'credits': {'$gt': LEASE_RESERVE + size}},
+            {'$inc': {'credits': -size, 'leased': size}, '$set': {'last_updated': now}},
+            projection={'credits': True, 'leased': True},
+            return_document=ReturnDocument.AFTER,
+            session=session,
+        )
+        if doc is None:
+            return None
+        CreditLease._get_collection().insert_one({
+            '_id': lease_id, 'wallet': wallet_id, 'owner': f"{socket.gethostname()}:{os.getpid()}",
+            'granted': size, 'spent': 0, 'returned': 0, 'status': 'active',
+            'created_at': now, 'expires_at': now + timedelta(seconds=CREDIT_LEASE_TTL),
+        }, session=session)
+        return doc['credits'] + doc['leased'] - size
+
+    balance = _in_transaction(take)
+    metrics.incr('credit_lease.grant', outcome='refused' if balance is None else 'ok')
+    if balance is None:
+        return None
+    return Lease(lease_id, wallet_id, size, now, balance)
+
+
+def _close(lease_id, wallet_id, granted, spent, status):
+    """Close an active lease and return its unused credits, atomically."""
+    unused = granted - spent
+    now = datetime.now()
+
+    def settle(session):
+        closed = CreditLease._get_collection().find_one_and_update(
+            {'_id': lease_id, 'status': 'active'},
+            {'$set': {'status': status, 'spent': spent, 'returned': unused, 'closed_at': now}},
+            session=session,
+        )
+        if closed is None:
+            return False
+        Wallet._get_collection().update_one(
+            {'_id': wallet_id},
+            {'$inc': {'credits': unused, 'leased': -granted}, '$set': {'last_updated': now}},
+            session=session,
+        )
+        return True
+
+    closed = _in_transaction(settle)
+    if closed:
+        metrics.incr('credit_lease.closed', status=status)
+        metrics.incr('credit_lease.returned', unused)
+    return closed
+
+
+def charge(wallet_id, amount=1):
+    """Spend ``amount`` from this process's lease on the wallet, leasing a new
+    block when needed. Returns the Lease charged, or None when no lease can be
+    granted (the caller should charge the wallet directly)."""
+    wallet_id = ObjectId(wallet_id)
+    with _wallet_lock(wallet_id):
+        lease = _leases.get(wallet_id)
+        if lease is not None and (lease.expired() or lease.remaining < amount):
+            del _leases[wallet_id]
+            _close(lease.id, wallet_id, lease.granted, lease.spent, 'returned')
+            lease = None
+        if lease is None:
+            lease = _grant(wallet_id, CREDIT_LEASE_SIZE)
+            if lease is None:
+                return None
+            _leases[wallet_id] = lease
+            _start_timer()
+        lease.spent += amount
+        return lease
+
+
+def refund(lease_id, wallet_id, amount=1):
+    """Give back credits charged against ``lease_id`` for a call that failed."""
+    wallet_id = ObjectId(wallet_id)
+    with _wallet_lock(wallet_id):
+        lease = _leases.get(wallet_id)
+        if lease is not None and lease.id == lease_id:
+            lease.spent -= amount
+            return
+
+    # The lease was closed in the meantime; move the credit back through its
+    # record. Reclaimed leases were settled from the logs and already exclude it.
+    def late_refund(session):
+        result = CreditLease._get_collection().update_one(
+            {'_id': lease_id, 'status': 'returned'},
+            {'$inc': {'spent': -amount, 'returned': amount}},
+            session=session,
+        )
+        if result.modified_count:
+            Wallet._get_collection().update_one(
+                {'_id': wallet_id}, {'$inc': {'credits': amount}, '$set': {'last_updated': datetime.now()}},
+                session=session,
+            )
+
+    _in_transaction(late_refund)
+    metrics.incr('credit_lease.late_refund')
+
+
+def _return(wallet_id, due):
+    """Close this process's lease on ``wallet_id`` if ``due(lease)``; True if one was returned."""
+    with _wallet_lock(wallet_id):
+        lease = _leases.get(wallet_id)
+        if lease is None or not due(lease):
+            return False
+        del _leases[wallet_id]
+        try:
+            return _close(lease.id, wallet_id, lease.granted, lease.spent, 'returned')
+        except Exception as e:
+            # Left active in the database; reclaim_abandoned settles it from the logs.
+            log.error("Error returning credit lease %s: %s", lease.id, e)
+            return False
+
+
+def release_all():
+    """Return every lease held by this process (called at exit)."""
+    if _pid != os.getpid():
+        return 0
+    return sum(_return(wallet_id, lambda lease: True) for wallet_id in list(_leases))
+
+
+def return_due():
+    """Return this process's leases that have expired or whose wallet recalled them."""
+    held = dict(_leases)
+    if not held:
+        return 0
+    recalled = {
+        doc['_id']: doc['lease_recall_at']
+        for doc in Wallet._get_collection().find(
+            {'_id': {'$in': list(held)}, 'lease_recall_at': {'$ne': None}}, {'lease_recall_at': True})
+    }
+    returned = 0
+    for wallet_id in held:
+        recall_at = recalled.get(wallet_id)
+        returned += _return(wallet_id, lambda lease: lease.expired() or (
+            recall_at is not None and recall_at >= lease.granted_at))
+    return returned
+
+
+def _return_loop():
+    # Without this an idle worker would keep its leases until its next charge or exit.
+    while True:
+        time.sleep(RETURN_INTERVAL)
+        try:
+            returned = return_due()
+            if returned:
+                metrics.incr('credit_lease.timer_returned', returned)
+        except PyMongoError as e:
+            log.error("Credit lease return timer error: %s", e)
+
+
+def _start_timer():
+    global _timer, _timer_pid
+    if _timer is not None and _timer_pid == os.getpid() and _timer.is_alive():
+        return
+    with _registry_lock:
+        if _timer is not None and _timer_pid == os.getpid() and _timer.is_alive():
+            return
+        _timer = threading.Thread(target=_return_loop, name='credit-lease-return', daemon=True)
+        _timer_pid = os.getpid()
+        _timer.start()
+
+
+def recall(wallet_id):
+    """Ask every worker to return its leases on ``wallet_id``.
+
+    Used when a direct charge is refused while credits are out on leases.
+    Waits up to CREDIT_LEASE_RECALL_WAIT seconds for them to come back and
+    returns True if there were any to recall (the caller should retry).
+    """
+    wallet_id = ObjectId(wallet_id)
+    recalled = Wallet._get_collection().update_one(
+        {'_id': wallet_id, 'leased': {'$gt': 0}}, {'$set': {'lease_recall_at': datetime.now()}})
+    if not recalled.modified_count:
+        return False
+    metrics.incr('credit_lease.recall')
+    deadline = time.monotonic() + CREDIT_LEASE_RECALL_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(0.1)
+        doc = Wallet._get_collection().find_one({'_id': wallet_id}, {'leased': True})
+        if doc is None or not doc.get('leased'):
+            break
+    return True
+
+
+atexit.register(release_all)
+
+
+def _logged_spend(lease_ids):
+    """Successful API calls recorded against each lease id."""
+    pipeline = [
+        {'$match': dict({'cl': {'$in': list(lease_ids)}}, **APILog.status_raw_query('success'))},
+        {'$group': {'_id': '$cl', 'n': {'$sum': 1}}},
+    ]
+    return {row['_id']: row['n'] for row in APILog._get_collection().aggregate(pipeline)}
+
+
+def reclaim_abandoned():
+    """Close leases whose worker died without returning them.
+
+    A dead worker's local count is lost, so ``spent`` is taken from the
+    successful API logs charged against the lease. Returns the number reclaimed.
+    """
+    abandoned = list(CreditLease._get_collection().find(
+        {'status': 'active', 'expires_at': {'$lt': datetime.now() - RECLAIM_GRACE}}
+    ))
+    spent = _logged_spend(doc['_id'] for doc in abandoned)
+    reclaimed = 0
+    for doc in abandoned:
+        reclaimed += _close(doc['_id'], doc['wallet'], doc['granted'], spent.get(doc['_id'], 0), 'reclaimed')
+    return reclaimed
+
+
+def reconcile(since=None):
+    """Check lease accounting against the API logs.
+
+    Returns a summary with every closed lease whose counts do not balance
+    (granted != spent + returned, or spent != logged successful calls) and
+    the credits still held by active leases.
+    """
+    query = {'created_at': {'$gte': since}} if since else {}
+    leases = list(CreditLease._get_collection().find(query))
+    logged = _logged_spend(doc['_id'] for doc in leases)
+
+    mismatches = []
+    outstanding = 0
+    for doc in leases:
+        if doc['status'] == 'active':
+            outstanding += doc['granted']
+            continue
+        problems = []
+        if doc['granted'] != doc['spent'] + doc['returned']:
+            problems.append(f"granted {doc['granted']} != spent {doc['spent']} + returned {doc['returned']}")
+        if doc['spent'] != logged.get(doc['_id'], 0):
+            problems.append(f"spent {doc['spent']} != logged {logged.get(doc['_id'], 0)}")
+        if problems:
+            mismatches.append({'lease': str(doc['_id']), 'wallet': str(doc['wallet']), 'problems': problems})
+
+    return {'leases': len(leases), 'mismatches': mismatches, 'outstanding': outstanding}
@@ -0,0 +1,73 @@
+import os
+import threading
+from cryptography.fernet import Fernet, MultiFernet, InvalidToken
+from app.config import SECRET_CACHE_TTL, SECRET_CACHE_SIZE
+from utils.cache import TTLCache
+from utils import invalidation
+
+# Built once per process. SECRET_KEY encrypts; SECRET_KEY_PREVIOUS (comma
+# separated) holds retired keys that can still decrypt during a rotation.
+_cipher = None
+_cipher_lock = threading.Lock()
+
+# Decrypted secrets keyed by (user id, ciphertext), so a credential change
+# naturally misses the cache.
+_secrets = TTLCache(maxsize=SECRET_CACHE_SIZE, ttl=SECRET_CACHE_TTL)
+invalidation.subscribe('users', lambda user_id, doc: _secrets.pop_matching(lambda key: key[0] == user_id))
+
+
+def _fernet_keys():
+    primary = os.environ.get('SECRET_KEY')
+    if not primary:
+        raise ValueError("SECRET_KEY is not set in the environment variables.")
+    previous = [key.strip() for key in os.environ.get('SECRET_KEY_PREVIOUS', '').split(',') if key.strip()]
+    return [primary] + previous
+
+
+def get_cipher():
+    global _cipher
+    if _cipher is None:
+        with _cipher_lock:
+            if _cipher is None:
+                _cipher = MultiFernet([Fernet(key.encode()) for key in _fernet_keys()])
+    return _cipher
+
+
+def reset_cipher():
+    """Drop the cached cipher and secrets, e.g. after the keys change."""
+    global _cipher
+    with _cipher_lock:
+        _cipher = None
+    _secrets.clear()
+
+
+def encrypt(plaintext):
+    return get_cipher().encrypt(plaintext.encode()).decode()
+
+
+def decrypt(ciphertext):
+    return get_cipher().decrypt(ciphertext.encode()).decode()
+
+
+def decrypt_cached(user_id, ciphertext):
+    """Decrypt a stored secret, reusing a recent result for the same user and ciphertext."""
+    key = (user_id, ciphertext)
+    secret = _secrets.get(key)
+    if secret is None:
+        secret = decrypt(ciphertext)
+        _secrets.set(key, secret)
+    return secret
+
+
+def needs_rotation(ciphertext):
+    """True if the ciphertext was not produced with the current primary key."""
+    try:
+        Fernet(_fernet_keys()[0].encode()).decrypt(ciphertext.encode())
+        return False
+    except InvalidToken:
+        return True
+
+
+def rotate(ciphertext):
+    """Re-encrypt a ciphertext under the current primary key."""
+    return get_cipher().rotate(ciphertext.encode()).decode()
@@ -0,0 +1,100 @@
+from datetime import datetime
+from bson import ObjectId
+from dateutil.relativedelta import relativedelta
+from app.config import SUMMARY_CACHE_TTL
+from models import APILog, Wallet, PaymentHistory
+from utils import invalidation, metrics
+from utils.cache import TTLCache
+from utils.db import REPORTING_READ
+from utils.retention import month_start, count_archived_logs
+
+# Month keys match the settings page's month selector values.
+MONTHS = ('this-month', 'last-month', 'last-previous-month')
+RECENT_PAYMENTS = 5
+
+_summaries = TTLCache(maxsize=4096, ttl=SUMMARY_CACHE_TTL)
+invalidation.subscribe('wallet', lambda wallet_id, doc: doc and _summaries.pop(str(doc.get('user'))))
+
+
+def _month_ranges(now):
+    this_month = month_start(now)
+    return {key: (this_month - relativedelta(months=i), this_month - relativedelta(months=i - 1))
+            for i, key in enumerate(MONTHS)}
+
+
+def _summary_pipeline(wallet_id, ranges):
+    usage_facets = {
+        key: [{'$match': {'log_time': {'$gte': start, '$lt': end}}}, {'$count': 'n'}]
+        for key, (start, end) in ranges.items()
+    }
+    oldest = min(start for start, _ in ranges.values())
+    newest = max(end for _, end in ranges.values())
+    return [
+        {'$match': {'_id': ObjectId(wallet_id)}},
+        {'$facet': {
+            'wallet': [{'$project': {'_id': 0, 'credits': 1}}],
+            'usage': [
+                {'$lookup': {
+                    'from': APILog._get_collection_name(), 'localField': 'user', 'foreignField': 'user', 'as': 'u',
+                    'pipeline': [
+                        {'$match': dict({'log_time': {'$gte': oldest, '$lt': newest}}, **APILog.status_raw_query('success'))},
+                        {'$facet': usage_facets},
+                    ],
+                }},
+                {'$project': {'_id': 0, 'u': {'$arrayElemAt': ['$u', 0]}}},
+            ],
+            'payments': [
+                {'$lookup': {
+                    'from': PaymentHistory._get_collection_name(), 'localField': 'user', 'foreignField': 'user', 'as': 'p',
+                    'pipeline': [
+                        {'$sort': {'payment_date': -1}},
+                        {'$limit': RECENT_PAYMENTS},
+                        {'$project': {'_id': 0, 'transaction_id': 1, 'amount': 1, 'payment_date': 1,
+                                      'payment_method': 1, 'status': 1}},
+                    ],
+                }},
+                {'$project': {'_id': 0, 'p': 1}},
+            ],
+        }},
+    ]
+
+
+def build_summary(user_id, wallet_id):
+    """Balance, three months of usage and recent payments in one aggregation."""
+    ranges = _month_ranges(datetime.now())
+    metrics.incr('db.read_route', route='dashboard_summary', target=REPORTING_READ.mongos_mode)
+    collection = Wallet._get_collection().with_options(read_preference=REPORTING_READ)
+    result = next(collection.aggregate(_summary_pipeline(wallet_id, ranges)), None)
+    if not result or not result['wallet']:
+        return None
+
+    usage_facets = result['usage'][0].get('u') or {}
+    usage = {}
+    for key, (start, end) in ranges.items():
+        counted = usage_facets.get(key) or []
+        # Logs moved by archive-logs live in the monthly archives, not api_logs
+        usage[key] = (counted[0]['n'] if counted else 0) + count_archived_logs(user_id, start, end, 'success')
+
+    return {
+        "total_credits": result['wallet'][0].get('credits'),
+        "usage": usage,
+        "credits_used_this_month": usage['this-month'],
+        "recent_payments": [{
+            "payment_date": payment['payment_date'].strftime("%d-%m-%Y"),
+            "transaction_id": payment['transaction_id'],
+            "amount": f"₹{payment['amount']:.2f}",
+            "status": payment.get('status'),
+            "payment_method": payment.get('payment_method'),
+        } for payment in result['payments'][0].get('p', [])],
+    }
+
+
+def get_summary(user_id, wallet_id):
+    """Cached per user for SUMMARY_CACHE_TTL seconds, evicted on wallet changes."""
+    summary = _summaries.get(user_id)
+    metrics.incr('dashboard.summary', cache='hit' if summary is not None else 'miss')
+    if summary is None:
+        summary = build_summary(user_id, wallet_id)
+        if summary is not None:
+            _summaries.set(user_id, summary)
+    return summary
@@ -0,0 +1,33 @@
+from pymongo.read_preferences import Primary, PrimaryPreferred, Secondary, SecondaryPreferred, Nearest
+from app.config import REPORTING_READ_PREFERENCE, REPORTING_MAX_STALENESS_SECONDS
+from utils import metrics
+
+_READ_MODES = {
+    'primary': Primary,
+    'primaryPreferred': PrimaryPreferred,
+    'secondary': Secondary,
+    'secondaryPreferred': SecondaryPreferred,
+    'nearest': Nearest,
+}
+
+
+def _reporting_read_preference():
+    mode = _READ_MODES.get(REPORTING_READ_PREFERENCE, SecondaryPreferred)
+    if mode is Primary:
+        return Primary()
+    return mode(max_staleness=REPORTING_MAX_STALENESS_SECONDS)
+
+
+REPORTING_READ = _reporting_read_preference()
+
+
+def reporting_read(queryset, route):
+    """Route a read-only dashboard query to secondaries (bounded staleness)."""
+    metrics.incr('db.read_route', route=route, target=REPORTING_READ.mongos_mode)
+    return queryset.read_preference(REPORTING_READ)
+
+
+def primary_read(queryset, route):
+    """Keep a consistency-sensitive read (wallet, token checks) on the primary."""
+    metrics.incr('db.read_route', route=route, target='primary')
+    return queryset.read_preference(Primary())
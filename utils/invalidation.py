@@ -0,0 +1,118 @@
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from mongoengine.connection import get_db
+from pymongo.errors import PyMongoError
+from app.config import INVALIDATION_MODE, INVALIDATION_POLL_SECONDS, INVALIDATION_POLL_OVERLAP_SECONDS
+from utils import metrics
+
+log = logging.getLogger(__name__)
+
+# Watched collections and the field each write path keeps current, used as
+# the polling watermark when change streams are unavailable.
+WATERMARKS = {
+    'users': 'updated_at',
+    'wallet': 'last_updated',
+    'revoked_tokens': 'revoked_at',
+    'sessions': 'updated_at',
+}
+
+_subscribers = {collection: [] for collection in WATERMARKS}
+_thread = None
+_thread_pid = None
+_lock = threading.Lock()
+
+
+def subscribe(collection, callback):
+    """Call ``callback(doc_id, document)`` whenever a document in ``collection`` changes.
+
+    ``document`` is the post-change document when available (None on delete).
+    Callbacks should only evict local cache entries.
+    """
+    _subscribers[collection].append(callback)
+
+
+def publish(collection, doc_id, document=None, changed_at=None):
+    """Dispatch one change to the local subscribers and record propagation lag."""
+    if changed_at is not None:
+        metrics.observe('invalidation.lag_seconds', max(0.0, (datetime.now() - changed_at).total_seconds()),
+                        collection=collection)
+    metrics.incr('invalidation.events', collection=collection)
+    for callback in _subscribers.get(collection, []):
+        try:
+            callback(doc_id, document)
+        except Exception:
+            log.exception("Invalidation callback failed for %s", collection)
+
+
+def _tail_change_stream():
+    pipeline = [{'$match': {'ns.coll': {'$in': list(WATERMARKS)}}}]
+    resume_token = None
+    while True:
+        try:
+            with get_db().watch(pipeline, full_document='updateLookup', resume_after=resume_token) as stream:
+                for change in stream:
+                    resume_token = stream.resume_token
+                    changed_at = change['clusterTime'].as_datetime().astimezone().replace(tzinfo=None)
+                    publish(change['ns']['coll'], change['documentKey']['_id'], change.get('fullDocument'), changed_at)
+        except PyMongoError:
+            # Never opened successfully: let the caller fall back to polling.
+            if resume_token is None:
+                raise
+            time.sleep(INVALIDATION_POLL_SECONDS)
+
+
+def _poll_watermarks():
+    db = get_db()
+    overlap = timedelta(seconds=INVALIDATION_POLL_OVERLAP_SECONDS)
+    watermarks = {collection: datetime.now() for collection in WATERMARKS}
+    # _id -> watermark value already published, for documents inside the overlap window.
+    seen = {collection: {} for collection in WATERMARKS}
+    while True:
+        for collection, field in WATERMARKS.items():
+            published = seen[collection]
+            for doc in db[collection].find({field: {'$gte': watermarks[collection] - overlap}}).sort(field, 1):
+                if published.get(doc['_id']) == doc[field]:
+                    continue
+                published[doc['_id']] = doc[field]
+                watermarks[collection] = max(watermarks[collection], doc[field])
+                publish(collection, doc['_id'], doc, doc[field])
+            since = watermarks[collection] - overlap
+            seen[collection] = {doc_id: at for doc_id, at in published.items() if at >= since}
+        time.sleep(INVALIDATION_POLL_SECONDS)
+
+
+def _run():
+    mode = INVALIDATION_MODE
+    if mode in ('auto', 'changestream'):
+        try:
+            metrics.incr('invalidation.mode', mode='changestream')
+            _tail_change_stream()
+        except PyMongoError as e:
+            if mode == 'changestream':
+                raise
+            log.warning("Change streams unavailable (%s); polling watermarks instead.", e)
+    metrics.incr('invalidation.mode', mode='poll')
+    while True:
+        try:
+            _poll_watermarks()
+        except PyMongoError as e:
+            log.error("Invalidation polling error: %s", e)
+            time.sleep(INVALIDATION_POLL_SECONDS)
+
+
+def start():
+    """Start this process's invalidation listener (once per process, fork-safe)."""
+    global _thread, _thread_pid
+    if INVALIDATION_MODE == 'off':
+        return
+    if _thread is not None and _thread_pid == os.getpid() and _thread.is_alive():
+        return
+    with _lock:
+        if _thread is not None and _thread_pid == os.getpid() and _thread.is_alive():
+            return
+        _thread = threading.Thread(target=_run, name='cache-invalidation', daemon=True)
+        _thread_pid = os.getpid()
+        _thread.start()
@@ -0,0 +1,58 @@
+import json
+from datetime import date
+from decimal import Decimal
+from bson import ObjectId
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # falls back to the stdlib encoder
+    orjson = None
+
+
+def _default(o):
+    """Types neither encoder handles natively. Dates use ``isoformat`` like the ``to_json`` methods."""
+    if isinstance(o, date):
+        return o.isoformat()
+    if isinstance(o, (ObjectId, Decimal)):
+        return str(o)
+    return DefaultJSONProvider.default(o)
+
+
+def _options(sort_keys):
+    option = orjson.OPT_NON_STR_KEYS
+    if sort_keys:
+        option |= orjson.OPT_SORT_KEYS
+    return option
+
+
+def dumps(obj):
+    """Compact JSON text, e.g. for payloads stored on ``api_logs``."""
+    if orjson is None:
+        return json.dumps(obj, default=_default, separators=(',', ':'))
+    return orjson.dumps(obj, default=_default, option=_options(False)).decode()
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson, used by ``jsonify`` on every response.
+
+    Output matches the default provider apart from non-ASCII text being sent
+    as UTF-8 rather than ``\\u`` escapes, and dates using ``isoformat``.
+    Strings, including stored log responses, are encoded like any other
+    value. Without orjson, or when pretty-printing in debug mode, it behaves
+    like the default provider.
+    """
+
+    default = staticmethod(_default)
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=_default, option=_options(self.sort_keys)).decode()
+
+    def response(self, *args, **kwargs):
+        if orjson is None or self.compact is False or (self.compact is None and self._app.debug):
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        body = orjson.dumps(obj, default=_default, option=_options(self.sort_keys))
+        return self._app.response_class(body, mimetype=self.mimetype)
@@ -0,0 +1,40 @@
+import threading
+from collections import defaultdict
+
+# In-process counters and timings, exposed as JSON on /metrics.
+_lock = threading.Lock()
+_counters = defaultdict(int)
+_timings = {}
+
+
+def _key(name, labels):
+    if not labels:
+        return name
+    label_str = ','.join(f"{k}={v}" for k, v in sorted(labels.items()))
+    return f"{name}{{{label_str}}}"
+
+
+def incr(name, value=1, **labels):
+    """Increment a counter."""
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] += value
+
+
+def observe(name, seconds, **labels):
+    """Record a duration sample (count, sum and max are kept)."""
+    key = _key(name, labels)
+    with _lock:
+        stats = _timings.setdefault(key, {'count': 0, 'sum': 0.0, 'max': 0.0})
+        stats['count'] += 1
+        stats['sum'] += seconds
+        stats['max'] = max(stats['max'], seconds)
+
+
+def snapshot():
+    """Return a copy of all counters and timings."""
+    with _lock:
+        return {
+            'counters': dict(_counters),
+            'timings': {k: dict(v) for k, v in _timings.items()},
+        }
@@ -0,0 +1,71 @@
+from pymongo import UpdateOne
+from models import APILog, User
+from utils import crypto
+from utils import metrics
+
+
+def compact_legacy_logs(batch_size=1000, limit=None):
+    """Stream legacy api_logs documents and rewrite them in the compact schema.
+
+    Only documents without an ``ec`` field are touched, so the migration can
+    be stopped and re-run at any point. Returns the number of documents converted.
+    """
+    collection = APILog._get_collection()
+    legacy = {'ec': {'$exists': False}, 'endpoint': {'$exists': True}}
+    projection = {'endpoint': 1, 'platform': 1, 'status': 1, 'response': 1}
+    converted = 0
+    last_id = None
+
+    while limit is None or converted < limit:
+        query = dict(legacy, **({'_id': {'$gt': last_id}} if last_id else {}))
+        docs = list(collection.find(query, projection).sort('_id', 1).limit(batch_size))
+        if not docs:
+            break
+
+        ops = []
+        for doc in docs:
+            stored = APILog.compact_fields(doc.get('endpoint'), doc.get('platform'),
+                                           doc.get('status'), doc.get('response'))
+            unset = {'endpoint': '', 'platform': '', 'status': ''}
+            if 'rz' in stored:
+                unset['response'] = ''
+            ops.append(UpdateOne({'_id': doc['_id']}, {'$set': stored, '$unset': unset}))
+
+        collection.bulk_write(ops, ordered=False)
+        converted += len(ops)
+        last_id = docs[-1]['_id']
+        metrics.incr('migration.logs_compacted', len(ops))
+
+    return converted
+
+
+def rotate_user_secrets(batch_size=500):
+    """Re-encrypt every stored Razorpay secret under the current SECRET_KEY.
+
+    Secrets already encrypted with the primary key are skipped, so the
+    command is safe to re-run. Returns (rotated, scanned).
+    """
+    collection = User._get_collection()
+    rotated = scanned = 0
+    last_id = None
+
+    while True:
+        query = {'razorpay_key_secret': {'$nin': [None, '']}}
+        if last_id:
+            query['_id'] = {'$gt': last_id}
+        docs = list(collection.find(query, {'razorpay_key_secret': 1}).sort('_id', 1).limit(batch_size))
+        if not docs:
+            break
+
+        ops = [
+            UpdateOne({'_id': doc['_id'], 'razorpay_key_secret': doc['razorpay_key_secret']},
+                      {'$set': {'razorpay_key_secret': crypto.rotate(doc['razorpay_key_secret'])}})
+            for doc in docs if crypto.needs_rotation(doc['razorpay_key_secret'])
+        ]
+        if ops:
+            rotated += collection.bulk_write(ops, ordered=False).modified_count
+        scanned += len(docs)
+        last_id = docs[-1]['_id']
+        metrics.incr('migration.secrets_rotated', len(ops))
+
+    return rotated, scanned
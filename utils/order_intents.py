@@ -0,0 +1,190 @@
+import hashlib
+import hmac
+import ipaddress
+import logging
+import socket
+import time
+from datetime import datetime
+from urllib.parse import urlsplit
+from bson import ObjectId
+from models import OutboxMessage, User
+from utils import outbox, wallet, razorpay_sdk, json_provider
+from utils.orders import record_order
+from utils.utils import record_api_call
+
+ENDPOINT = "/auth/create-order"
+# Written into the Razorpay order notes so a retried submission can find an
+# order an earlier, timed-out attempt already created.
+INTENT_NOTE = 'cloudlesspay_intent'
+
+_STATUS = {'pending': 'pending', 'sending': 'processing', 'delivered': 'succeeded', 'failed': 'failed'}
+
+# Callbacks carry ``X-CloudlessPay-Signature: sha256=<hex>``, an HMAC-SHA256 of
+# ``<timestamp>.<body>`` keyed with the merchant's Razorpay key secret, and the
+# timestamp in ``X-CloudlessPay-Timestamp``.
+SIGNATURE_HEADER = 'X-CloudlessPay-Signature'
+TIMESTAMP_HEADER = 'X-CloudlessPay-Timestamp'
+
+log = logging.getLogger(__name__)
+
+
+def submit(principal, payment_data, domain, platform, callback_url=None, credit_lease=None,
+           email=None, balance=None):
+    """Persist an order intent for the dispatcher; credits are already charged.
+
+    The outbox message id doubles as the intent id returned to the client.
+    ``balance`` is the wallet balance after the charge; the low-balance alert
+    for it is sent to ``email`` once the order is created.
+    """
+    key = ObjectId()
+    payment_data = dict(payment_data, notes=dict(payment_data.get('notes', {}), **{INTENT_NOTE: str(key)}))
+    return outbox.enqueue('order.create', {
+        'key': str(key),
+        'user_id': principal.user_id,
+        'wallet_id': str(principal.wallet_id),
+        'credit_lease': str(credit_lease) if credit_lease else None,
+        'payment_data': payment_data,
+        'domain': domain,
+        'platform': platform,
+        'callback_url': callback_url,
+        'email': email,
+        'balance': balance,
+    }, message_id=key)
+
+
+def intent_json(message):
+    result = message.result or {}
+    return {
+        "intent_id": str(message.id),
+        "status": _STATUS.get(message.status, message.status),
+        "attempts": message.attempts,
+        "order": result.get('order'),
+        "error": message.last_error if message.status == 'failed' else None,
+        "created_at": message.created_at.isoformat(),
+    }
+
+
+def get_intent(intent_id, user_id):
+    if not ObjectId.is_valid(intent_id):
+        return None
+    return OutboxMessage.objects(id=intent_id, kind='order.create', payload__user_id=user_id).first()
+
+
+def callback_url_error(url):
+    """Why ``url`` cannot receive callbacks, or None.
+
+    The host is resolved, so names pointing at private, loopback or
+    link-local addresses are refused too. Raises OSError if it does not resolve.
+    """
+    try:
+        parts = urlsplit(url)
+        port = parts.port or 443
+    except ValueError:
+        return "callback_url is not a valid URL"
+    if parts.scheme != 'https' or not parts.hostname:
+        return "callback_url must be an https URL"
+    for *_, sockaddr in socket.getaddrinfo(parts.hostname, port, proto=socket.IPPROTO_TCP):
+        address = ipaddress.ip_address(sockaddr[0].split('%')[0])
+        if not address.is_global or address.is_multicast:
+            return "callback_url must resolve to a public address"
+    return None
+
+
+def sign(key_secret, timestamp, body):
+    mac = hmac.new(key_secret.encode(), f"{timestamp}.".encode() + body, hashlib.sha256)
+    return f"sha256={mac.hexdigest()}"
+
+
+def _callback(payload, body):
+    if payload.get('callback_url'):
+        outbox.enqueue('order.callback', {'url': payload['callback_url'], 'user_id': payload['user_id'], 'body': body})
+
+
+def _find_existing(client, payload):
+    receipt = payload['payment_data'].get('receipt')
+    for order in client.order.all({'receipt': receipt}).get('items', []):
+        if (order.get('notes') or {}).get(INTENT_NOTE) == payload['key']:
+            return order
+    return None
+
+
+def _client(payload, http):
+    user = User.objects(id=payload['user_id']).only('razorpay_key_id', 'razorpay_key_secret').first()
+    if not user or not user.razorpay_key_id or not user.razorpay_key_secret:
+        raise outbox.PermanentFailure("Razorpay credentials not found for the user")
+    return razorpay_sdk.client(user.razorpay_key_id, user.get_razorpay_key_secret(), session=http)
+
+
+def _succeed(payload, order):
+    """Record a created order, log the successful call and send the callback and
+    any low-balance alert; returns the outbox result."""
+    record_order(payload['user_id'], order)
+    order['amount'] = int(order['amount']) / 100
+    order['amount_due'] = int(order['amount_due']) / 100
+
+    order_response = {"order": order, "message": "Order created successfully"}
+    lease = payload.get('credit_lease')
+    record_api_call(payload['user_id'], ENDPOINT, payload['domain'], payload['platform'], order_response,
+                    "success", ObjectId(lease) if lease else None)
+    _callback(payload, {"intent_id": payload['key'], "status": "succeeded", "order": order})
+    if payload.get('email') and payload.get('balance') is not None:
+        wallet.notify_low_balance(payload['email'], payload['balance'] + 1, payload['balance'])
+    return {'order': order}
+
+
+def _release(message, error):
+    """The intent was given up on: refund the credit and record the failure.
+
+    An attempt that timed out may still have created the order, so Razorpay is
+    checked first; a found order completes the intent instead.
+    """
+    payload = message.payload
+    try:
+        order = _find_existing(_client(payload, outbox.get_session()), payload)
+    except Exception as e:
+        log.warning("Could not check Razorpay for intent %s before refunding: %s", message.id, e)
+        order = None
+    if order is not None:
+        result = _succeed(payload, order)
+        OutboxMessage.objects(id=message.id, status='failed').update_one(
+            set__status='delivered', set__result=result, set__delivered_at=datetime.now(), unset__last_error=True)
+        return
+
+    lease = payload.get('credit_lease')
+    wallet.refund(ObjectId(payload['wallet_id']), lease_id=ObjectId(lease) if lease else None)
+    record_api_call(payload['user_id'], ENDPOINT, payload['domain'], payload['platform'], error, "failure")
+    _callback(payload, {"intent_id": str(message.id), "status": "failed", "error": error})
+
+
+@outbox.handler('order.create', on_failure=_release)
+def dispatch_order(payload, http):
+    client = _client(payload, http)
+    try:
+        order = _find_existing(client, payload) or client.order.create(payload['payment_data'])
+    except razorpay_sdk.BadRequestError as e:
+        raise outbox.PermanentFailure(str(e))
+    return _succeed(payload, order)
+
+
+@outbox.handler('order.callback')
+def deliver_callback(payload, http):
+    # Checked again here: the name may have been re-pointed since submission.
+    error = callback_url_error(payload['url'])
+    if error:
+        raise outbox.PermanentFailure(error)
+    user = User.objects(id=payload.get('user_id')).only('razorpay_key_secret').first()
+    key_secret = user.get_razorpay_key_secret() if user else None
+    if not key_secret:
+        raise outbox.PermanentFailure("No Razorpay key secret to sign the callback with")
+
+    body = json_provider.dumps(payload['body']).encode()
+    timestamp = str(int(time.time()))
+    response = http.post(payload['url'], data=body, timeout=outbox.TIMEOUT, allow_redirects=False, headers={
+        'Content-Type': 'application/json',
+        TIMESTAMP_HEADER: timestamp,
+        SIGNATURE_HEADER: sign(key_secret, timestamp, body),
+    })
+    if 300 <= response.status_code < 500:
+        raise outbox.PermanentFailure(f"Status Code: {response.status_code}")
+    response.raise_for_status()
+    return {'status_code': response.status_code}
@@ -0,0 +1,121 @@
+import base64
+from datetime import datetime, timedelta
+from pymongo import UpdateOne
+from app.config import ORDER_SYNC_MAX_AGE_DAYS
+from models import Order, User
+from utils import metrics, razorpay_sdk
+
+# Razorpay order states that can still change; 'paid' is final.
+OPEN_STATUSES = ('created', 'attempted')
+PAGE_MAX = 100
+
+
+def _rupees(paise):
+    return int(paise or 0) / 100
+
+
+def _order_fields(order):
+    """Map a Razorpay order (amounts in paise) to Order field values."""
+    return {
+        'amount': _rupees(order.get('amount')),
+        'amount_paid': _rupees(order.get('amount_paid')),
+        'amount_due': _rupees(order.get('amount_due')),
+        'currency': order.get('currency'),
+        'receipt': order.get('receipt'),
+        'status': order.get('status'),
+        'attempts': order.get('attempts', 0),
+        'notes': order.get('notes') or {},
+        'partial_payment': bool(order.get('partial_payment')),
+        'created_at': datetime.fromtimestamp(order['created_at']) if order.get('created_at') else datetime.now(),
+    }
+
+
+def record_order(user_id, order):
+    """Store a freshly created Razorpay order (as returned by the API, in paise)."""
+    saved = Order(id=order['id'], user=user_id, synced_at=datetime.now(), **_order_fields(order)).save()
+    metrics.incr('orders.recorded')
+    return saved
+
+
+def encode_cursor(order):
+    raw = f"{order.created_at.isoformat()}|{order.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        created_at, order_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|', 1)
+        return datetime.fromisoformat(created_at), order_id
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("Invalid cursor")
+
+
+def list_orders(user_id, limit=20, cursor=None, status=None, receipt=None):
+    """Newest-first page of a user's orders using (created_at, id) keyset pagination.
+
+    Returns (orders, next_cursor); next_cursor is None on the last page.
+    """
+    limit = max(1, min(limit, PAGE_MAX))
+    query = {'user': user_id}
+    if status:
+        query['status'] = status
+    if receipt is not None:
+        query['receipt'] = receipt
+    if cursor:
+        created_at, order_id = decode_cursor(cursor)
+        query['$or'] = [
+            {'created_at': {'$lt': created_at}},
+            {'created_at': created_at, '_id': {'$lt': order_id}},
+        ]
+    orders = list(Order.objects(__raw__=query).order_by('-created_at', '-id').limit(limit + 1))
+    next_cursor = encode_cursor(orders[limit - 1]) if len(orders) > limit else None
+    return orders[:limit], next_cursor
+
+
+def _fetch_since(client, since):
+    """All of an account's Razorpay orders created since ``since``, page by page."""
+    skip = 0
+    while True:
+        page = client.order.all({'from': int(since.timestamp()), 'count': 100, 'skip': skip})
+        items = page.get('items', [])
+        yield from items
+        if len(items) < 100:
+            return
+        skip += len(items)
+
+
+def sync_open_orders(max_age_days=ORDER_SYNC_MAX_AGE_DAYS):
+    """Refresh open orders from Razorpay with one listing and one bulk write per user.
+
+    Returns the number of orders updated.
+    """
+    since = datetime.now() - timedelta(days=max_age_days)
+    open_orders = Order._get_collection().find(
+        {'status': {'$in': list(OPEN_STATUSES)}, 'created_at': {'$gte': since}},
+        {'_id': 1, 'user': 1, 'created_at': 1},
+    )
+    by_user = {}
+    for doc in open_orders:
+        by_user.setdefault(doc['user'], {})[doc['_id']] = doc['created_at']
+
+    updated = 0
+    for user_id, orders in by_user.items():
+        user = User.objects(id=user_id).only('razorpay_key_id', 'razorpay_key_secret').first()
+        if not user or not user.razorpay_key_id or not user.razorpay_key_secret:
+            continue
+        client = razorpay_sdk.client(user.razorpay_key_id, user.get_razorpay_key_secret())
+        now = datetime.now()
+        try:
+            ops = [
+                UpdateOne({'_id': order['id']}, {'$set': dict(_order_fields(order), synced_at=now)})
+                for order in _fetch_since(client, min(orders.values()))
+                if order['id'] in orders
+            ]
+        except Exception as e:
+            metrics.incr('orders.sync_failed')
+            print(f"Error syncing orders for user {user_id}: {e}")
+            continue
+        if ops:
+            updated += Order._get_collection().bulk_write(ops, ordered=False).modified_count
+    metrics.incr('orders.synced', updated)
+    return updated
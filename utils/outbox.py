@@ -0,0 +1,208 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import requests
+from requests.adapters import HTTPAdapter
+from mongoengine import Q
+from app.config import (OUTBOX_CONNECT_TIMEOUT, OUTBOX_READ_TIMEOUT, OUTBOX_MAX_ATTEMPTS,
+                        OUTBOX_BATCH_SIZE, OUTBOX_POLL_SECONDS, OUTBOX_CONCURRENCY)
+from models import OutboxMessage
+from utils import metrics
+
+# The worker thread runs outside any app context, so it logs through the
+# module logger rather than current_app.logger.
+log = logging.getLogger(__name__)
+
+# A claimed message not finished within this lease is picked up again; the
+# lease is renewed every half lease while the delivery is still running.
+SENDING_LEASE = timedelta(minutes=2)
+TIMEOUT = (OUTBOX_CONNECT_TIMEOUT, OUTBOX_READ_TIMEOUT)
+
+_handlers = {}
+_failure_handlers = {}
+_session = None
+_worker = None
+_worker_pid = None
+_worker_lock = threading.Lock()
+_wakeup = threading.Event()
+_claims_lock = threading.Lock()
+
+
+class PermanentFailure(Exception):
+    """Raised by a handler when retrying cannot succeed (e.g. a 4xx response)."""
+
+
+def handler(kind, on_failure=None):
+    """Register the delivery function for a message kind.
+
+    Handlers receive (payload, session) and return a JSON-friendly dict;
+    raising marks the attempt as failed. ``on_failure(message, error)`` is
+    called once if the message is given up on (e.g. to release resources
+    reserved when it was enqueued).
+    """
+    def register(fn):
+        _handlers[kind] = fn
+        if on_failure is not None:
+            _failure_handlers[kind] = on_failure
+        return fn
+    return register
+
+
+def get_session():
+    """Pooled keep-alive session shared by all deliveries in this process."""
+    global _session
+    if _session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=OUTBOX_BATCH_SIZE)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        _session = session
+    return _session
+
+
+def enqueue(kind, payload, message_id=None):
+    """Persist a message for background delivery and return it."""
+    message = OutboxMessage(id=message_id, kind=kind, payload=payload).save()
+    metrics.incr('outbox.enqueued', kind=kind)
+    start_worker()
+    _wakeup.set()
+    return message
+
+
+def backoff(attempts):
+    """Exponential backoff: 5s, 10s, 20s ... capped at one hour."""
+    return timedelta(seconds=min(5 * 2 ** (attempts - 1), 3600))
+
+
+def _lease_end():
+    # Millisecond precision, as stored, so the claim can be matched exactly.
+    end = datetime.now() + SENDING_LEASE
+    return end.replace(microsecond=end.microsecond // 1000 * 1000)
+
+
+def _claim(limit):
+    now = datetime.now()
+    claimable = (Q(status='pending') | Q(status='sending')) & Q(next_attempt_at__lte=now)
+    claimed = []
+    for _ in range(limit):
+        message = OutboxMessage.objects(claimable).order_by('next_attempt_at').modify(
+            set__status='sending', set__next_attempt_at=_lease_end(), new=True
+        )
+        if message is None:
+            break
+        claimed.append(message)
+    return claimed
+
+
+def _still_claimed(message):
+    """Filter matching ``message`` only while this worker's claim on it holds."""
+    return OutboxMessage.objects(id=message.id, status='sending', next_attempt_at=message.next_attempt_at)
+
+
+def _renew(messages, done):
+    while not done.wait(SENDING_LEASE.total_seconds() / 2):
+        for message in messages:
+            with _claims_lock:
+                lease_end = _lease_end()
+                if _still_claimed(message).update_one(set__next_attempt_at=lease_end):
+                    message.next_attempt_at = lease_end
+
+
+def _finish(message, **updates):
+    """Record the outcome if the claim still holds; False if another worker re-claimed it."""
+    with _claims_lock:
+        if _still_claimed(message).update_one(**updates):
+            return True
+    log.warning("Outbox message %s was re-claimed before its attempt finished", message.id)
+    metrics.incr('outbox.claim_lost', kind=message.kind)
+    return False
+
+
+def _deliver(message):
+    deliver = _handlers.get(message.kind)
+    attempts = message.attempts + 1
+    started = time.perf_counter()
+    try:
+        if deliver is None:
+            raise PermanentFailure(f"No handler registered for '{message.kind}'")
+        result = deliver(message.payload, get_session())
+    except Exception as e:
+        permanent = isinstance(e, PermanentFailure) or attempts >= OUTBOX_MAX_ATTEMPTS
+        if not _finish(
+            message,
+            set__status='failed' if permanent else 'pending',
+            set__attempts=attempts,
+            set__last_error=str(e)[:1000],
+            set__next_attempt_at=datetime.now() + backoff(attempts),
+        ):
+            return False
+        metrics.incr('outbox.failed' if permanent else 'outbox.retry', kind=message.kind)
+        if permanent and message.kind in _failure_handlers:
+            try:
+                _failure_handlers[message.kind](message, str(e))
+            except Exception:
+                log.exception("Outbox failure handler error for %s", message.id)
+        return False
+    finally:
+        metrics.observe('outbox.delivery_seconds', time.perf_counter() - started, kind=message.kind)
+
+    if not _finish(
+        message,
+        set__status='delivered',
+        set__attempts=attempts,
+        set__result=result or {},
+        set__delivered_at=datetime.now(),
+        unset__last_error=True,
+    ):
+        return False
+    metrics.incr('outbox.delivered', kind=message.kind)
+    return True
+
+
+def process_batch(limit=OUTBOX_BATCH_SIZE):
+    """Claim and deliver up to ``limit`` due messages. Returns the number processed."""
+    messages = _claim(limit)
+    if not messages:
+        return 0
+    # Keep the claims while slow deliveries (e.g. order.create) are in flight,
+    # so another worker does not deliver the same message concurrently.
+    done = threading.Event()
+    threading.Thread(target=_renew, args=(messages, done), name='outbox-lease', daemon=True).start()
+    try:
+        if len(messages) > 1 and OUTBOX_CONCURRENCY > 1:
+            # One slow upstream should not hold up the rest of the batch.
+            with ThreadPoolExecutor(max_workers=min(OUTBOX_CONCURRENCY, len(messages))) as pool:
+                list(pool.map(_deliver, messages))
+        else:
+            for message in messages:
+                _deliver(message)
+    finally:
+        done.set()
+    return len(messages)
+
+
+def _run():
+    while True:
+        try:
+            if process_batch():
+                continue
+        except Exception:
+            log.exception("Outbox worker error")
+        _wakeup.wait(OUTBOX_POLL_SECONDS)
+        _wakeup.clear()
+
+
+def start_worker():
+    """Start this process's delivery thread (once per process, fork-safe)."""
+    global _worker, _worker_pid
+    if _worker is not None and _worker_pid == os.getpid() and _worker.is_alive():
+        return
+    with _worker_lock:
+        if _worker is not None and _worker_pid == os.getpid() and _worker.is_alive():
+            return
+        _worker = threading.Thread(target=_run, name='outbox-worker', daemon=True)
+        _worker_pid = os.getpid()
+        _worker.start()
@@ -0,0 +1,117 @@
+import functools
+import multiprocessing
+import os
+import threading
+import time
+from concurrent import futures
+from concurrent.futures.process import BrokenProcessPool
+from werkzeug.security import generate_password_hash, check_password_hash
+from app.config import (PASSWORD_HASH_METHOD, PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_PENDING,
+                        PASSWORD_HASH_TIMEOUT)
+from utils import metrics
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(PASSWORD_HASH_MAX_PENDING)
+
+
+class HashingBusy(Exception):
+    """Raised when the hashing queue is full; callers should answer 503."""
+
+
+def _get_pool():
+    global _pool, _pool_pid
+    if _pool is not None and _pool_pid == os.getpid():
+        return _pool
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            # Not fork: by the first login the Mongo monitor, outbox and
+            # invalidation threads are running, and a forked child could
+            # inherit their locks held. Under gunicorn __main__ is gunicorn's
+            # own script, so the children do not import run.py.
+            if 'forkserver' in multiprocessing.get_all_start_methods():
+                context = multiprocessing.get_context('forkserver')
+                # Preload only the hashing code, not __main__, into the server.
+                context.set_forkserver_preload(['werkzeug.security'])
+            else:
+                context = multiprocessing.get_context('spawn')
+            _pool = futures.ProcessPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, mp_context=context)
+            _pool_pid = os.getpid()
+    return _pool
+
+
+def _discard_pool(pool):
+    # A worker died; the executor stays broken, so the next request builds a new one.
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False)
+
+
+def _in_child():
+    # Pool workers re-import the entry module (e.g. run.py under the dev
+    # server) while bootstrapping; they must not start pools of their own.
+    process = multiprocessing.current_process()
+    return getattr(process, '_inheriting', False) or multiprocessing.parent_process() is not None
+
+
+def _run(operation, fn, *args):
+    if PASSWORD_HASH_WORKERS <= 0:
+        return fn(*args)
+    if not _slots.acquire(blocking=False):
+        metrics.incr('passwords.rejected', operation=operation)
+        raise HashingBusy("Too many logins in progress, please retry shortly.")
+    started = time.perf_counter()
+    pool = _get_pool()
+    try:
+        future = pool.submit(fn, *args)
+    except BrokenProcessPool:
+        _slots.release()
+        _discard_pool(pool)
+        metrics.incr('passwords.pool_broken', operation=operation)
+        raise HashingBusy("Password worker restarting, please retry shortly.")
+    except Exception:
+        _slots.release()
+        raise
+    # The slot stays taken until the job is done, even if we stop waiting for it.
+    future.add_done_callback(lambda f: _slots.release())
+    try:
+        return future.result(timeout=PASSWORD_HASH_TIMEOUT)
+    except futures.TimeoutError:
+        metrics.incr('passwords.timed_out', operation=operation)
+        raise HashingBusy("Password check timed out, please retry shortly.")
+    except BrokenProcessPool:
+        _discard_pool(pool)
+        metrics.incr('passwords.pool_broken', operation=operation)
+        raise HashingBusy("Password worker restarting, please retry shortly.")
+    finally:
+        metrics.observe('passwords.seconds', time.perf_counter() - started, operation=operation)
+
+
+def hash_password(password):
+    """Hash with the configured method in the pool."""
+    return _run('hash', generate_password_hash, password, PASSWORD_HASH_METHOD)
+
+
+@functools.lru_cache(maxsize=None)
+def _method_prefix():
+    # werkzeug expands short methods in the stored hash, e.g. 'scrypt' is
+    # written as 'scrypt:32768:8:1', so compare against what it actually writes.
+    return generate_password_hash('x', PASSWORD_HASH_METHOD).split('$', 1)[0]
+
+
+def verify_password(stored_hash, password):
+    """Check a password in the pool; returns (matches, needs_rehash)."""
+    matches = _run('verify', check_password_hash, stored_hash, password)
+    return matches, matches and stored_hash.split('$', 1)[0] != _method_prefix()
+
+
+def warm_up():
+    """Start the pool's workers (and derive the hash prefix) now so the first login does not wait."""
+    if _in_child():
+        return
+    _method_prefix()
+    if PASSWORD_HASH_WORKERS > 0:
+        list(_get_pool().map(abs, range(PASSWORD_HASH_WORKERS)))
@@ -0,0 +1,34 @@
+from collections import namedtuple
+from models import User
+from utils import metrics
+
+# Everything /api/create-order needs about the caller, read in one round trip.
+# ``credits`` counts the credits held by active leases on the wallet.
+ApiPrincipal = namedtuple('ApiPrincipal', ['user_id', 'key_id', 'key_secret', 'wallet_id', 'credits'])
+
+_PIPELINE_TAIL = [
+    {'$limit': 1},
+    {'$lookup': {'from': 'wallet', 'localField': '_id', 'foreignField': 'user', 'as': 'w'}},
+    {'$project': {
+        '_id': 1,
+        'k': '$razorpay_key_id',
+        's': '$razorpay_key_secret',
+        'w': {'$arrayElemAt': ['$w._id', 0]},
+        'c': {'$add': [{'$arrayElemAt': ['$w.credits', 0]}, {'$ifNull': [{'$arrayElemAt': ['$w.leased', 0]}, 0]}]},
+    }},
+]
+
+
+def load_api_principal(email):
+    """Fetch the caller's key id, encrypted secret and wallet balance in one query.
+
+    Uses the unique users.email index and the wallet.user index; the
+    projected result is a single small document. Returns None if the user
+    does not exist.
+    """
+    metrics.incr('db.read_route', route='api_principal', target='primary')
+    pipeline = [{'$match': {'email': email}}] + _PIPELINE_TAIL
+    doc = next(User._get_collection().aggregate(pipeline), None)
+    if doc is None:
+        return None
+    return ApiPrincipal(doc['_id'], doc.get('k'), doc.get('s'), doc.get('w'), doc.get('c'))
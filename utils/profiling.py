@@ -0,0 +1,229 @@
+import cProfile
+import io
+import marshal
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict, deque
+from datetime import datetime
+from uuid import uuid4
+from flask import g, request
+from pymongo import monitoring
+from app.config import (SLOW_REQUEST_MS, SLOW_REQUEST_BUFFER, SLOW_REQUEST_SAMPLE_RATE,
+                        PROFILE_MAX_SECONDS)
+from utils import metrics
+
+# Everything here is per worker process; admin endpoints report on the worker
+# that serves them.
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MAX_QUERIES = 200
+KEEP_PROFILES = 4
+
+_lock = threading.Lock()
+_profiles = OrderedDict()   # profile id -> state of a sampling run
+_running = None
+_slow_requests = deque(maxlen=SLOW_REQUEST_BUFFER)
+_local = threading.local()  # per-thread command log for the request being profiled
+
+
+class ProfilerBusy(Exception):
+    """Raised when a sampling run is already in progress in this worker."""
+
+
+# ---------------------------------------------------------------------------
+# Sampling profiler
+# ---------------------------------------------------------------------------
+
+def _short(filename):
+    if filename.startswith(REPO_ROOT):
+        return os.path.relpath(filename, REPO_ROOT)
+    _, sep, rest = filename.partition('site-packages' + os.sep)
+    return rest if sep else os.path.basename(filename)
+
+
+def _collapse(frame, thread_name):
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append(f"{code.co_name} ({_short(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    stack.append(thread_name)
+    return ';'.join(reversed(stack))
+
+
+def _sample(profile_id, seconds, interval):
+    own = threading.get_ident()
+    counts = Counter()
+    samples = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident != own:
+                counts[_collapse(frame, names.get(ident, str(ident)))] += 1
+        samples += 1
+        time.sleep(interval)
+
+    global _running
+    with _lock:
+        _profiles[profile_id].update(
+            status='done', samples=samples, finished_at=datetime.now(),
+            folded=''.join(f"{stack} {count}\n" for stack, count in counts.most_common()),
+        )
+        _running = None
+    metrics.incr('profiling.sampling_runs')
+
+
+def start_sampling(seconds, interval_ms=5):
+    """Sample every thread's stack in this worker for ``seconds`` in the background.
+
+    Returns the profile id; the collapsed stacks (flamegraph.pl / speedscope
+    "folded" format) are available from ``get_profile`` once it is done.
+    """
+    global _running
+    seconds = min(max(seconds, 1), PROFILE_MAX_SECONDS)
+    interval = min(max(interval_ms, 1), 1000) / 1000
+    with _lock:
+        if _running is not None:
+            raise ProfilerBusy(_running)
+        profile_id = uuid4().hex[:12]
+        _profiles[profile_id] = {'id': profile_id, 'status': 'running', 'seconds': seconds,
+                                 'interval_ms': interval * 1000, 'started_at': datetime.now(), 'pid': os.getpid()}
+        while len(_profiles) > KEEP_PROFILES:
+            _profiles.popitem(last=False)
+        _running = profile_id
+    threading.Thread(target=_sample, args=(profile_id, seconds, interval),
+                     name='sampling-profiler', daemon=True).start()
+    return profile_id
+
+
+def get_profile(profile_id):
+    with _lock:
+        profile = _profiles.get(profile_id)
+        return dict(profile) if profile else None
+
+
+# ---------------------------------------------------------------------------
+# Slow-request capture
+# ---------------------------------------------------------------------------
+
+class _CommandLog(monitoring.CommandListener):
+    """Records Mongo commands issued by a request while it is being profiled."""
+
+    def started(self, event):
+        pending = getattr(_local, 'pending', None)
+        if pending is not None:
+            target = event.command.get(event.command_name)
+            pending[event.request_id] = target if isinstance(target, str) else event.command.get('collection')
+
+    def _finish(self, event, failed):
+        queries = getattr(_local, 'queries', None)
+        if queries is None:
+            return
+        collection = _local.pending.pop(event.request_id, None)
+        if len(queries) < MAX_QUERIES:
+            queries.append({'command': event.command_name, 'collection': collection,
+                            'ms': round(event.duration_micros / 1000, 3), 'failed': failed})
+
+    def succeeded(self, event):
+        self._finish(event, False)
+
+    def failed(self, event):
+        self._finish(event, True)
+
+
+def _start_request():
+    if SLOW_REQUEST_SAMPLE_RATE < 1 and random.random() >= SLOW_REQUEST_SAMPLE_RATE:
+        return
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:  # another profiler is active in this interpreter
+        return
+    _local.queries, _local.pending = [], {}
+    g._profiler = profiler
+    g._profile_started = time.perf_counter()
+
+
+def _stop():
+    profiler = g.pop('_profiler', None)
+    if profiler is None:
+        return None, None
+    profiler.disable()
+    queries = _local.queries
+    _local.queries = _local.pending = None
+    return profiler, queries
+
+
+def _finish_request(response):
+    profiler, queries = _stop()
+    if profiler is None:
+        return response
+    elapsed_ms = (time.perf_counter() - g.pop('_profile_started')) * 1000
+    if elapsed_ms >= SLOW_REQUEST_MS:
+        profiler.create_stats()
+        _slow_requests.append({
+            'id': uuid4().hex[:12],
+            'at': datetime.now(),
+            'method': request.method,
+            'path': request.path,
+            'endpoint': request.endpoint,
+            'status': response.status_code,
+            'duration_ms': round(elapsed_ms, 1),
+            'db_ms': round(sum(q['ms'] for q in queries), 1),
+            'queries': queries,
+            'profiler': profiler,
+        })
+        metrics.incr('profiling.slow_requests', endpoint=request.endpoint)
+    return response
+
+
+def _abort_request(exc):
+    # after_request does not run when the view raised; drop the profile.
+    _stop()
+
+
+def install(app):
+    """Capture slow requests in ``app``; must run before the Mongo client is created.
+
+    Nothing is registered unless SLOW_REQUEST_MS is set, so disabled capture
+    costs nothing per request.
+    """
+    if not SLOW_REQUEST_MS:
+        return
+    monitoring.register(_CommandLog())
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.teardown_request(_abort_request)
+
+
+def slow_request_json(entry):
+    return {key: value.isoformat() if key == 'at' else value
+            for key, value in entry.items() if key != 'profiler'}
+
+
+def slow_requests():
+    """Captured slow requests in this worker, newest first."""
+    return [slow_request_json(entry) for entry in reversed(list(_slow_requests))]
+
+
+def get_slow_request(entry_id):
+    for entry in list(_slow_requests):
+        if entry['id'] == entry_id:
+            return entry
+    return None
+
+
+def profile_dump(entry):
+    """The cProfile stats in ``.prof`` format (readable by pstats, snakeviz)."""
+    return marshal.dumps(entry['profiler'].stats)
+
+
+def profile_summary(entry, limit=30):
+    stream = io.StringIO()
+    pstats.Stats(entry['profiler'], stream=stream).sort_stats('cumulative').print_stats(limit)
+    return stream.getvalue()
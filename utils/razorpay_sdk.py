@@ -0,0 +1,37 @@
+import threading
+from app.config import RAZORPAY_KEY_ID, RAZORPAY_KEY_SECRET
+
+# The Razorpay SDK is slow to import and only the order and payment paths use
+# it, so it is imported on first use (or by the warm-up hook). Its exception
+# classes are available here as attributes, e.g. ``razorpay_sdk.BadRequestError``.
+
+_platform_client = None
+_lock = threading.Lock()
+
+
+def load():
+    import razorpay
+    import razorpay.errors
+    return razorpay
+
+
+def client(key_id, key_secret, session=None):
+    """A client for a merchant's own Razorpay account."""
+    return load().Client(session=session, auth=(key_id, key_secret))
+
+
+def platform_client():
+    """The platform account's client (dashboard wallet top-ups), built on first use."""
+    global _platform_client
+    if _platform_client is None:
+        with _lock:
+            if _platform_client is None:
+                _platform_client = client(RAZORPAY_KEY_ID, RAZORPAY_KEY_SECRET)
+    return _platform_client
+
+
+def __getattr__(name):
+    errors = load().errors
+    if hasattr(errors, name):
+        return getattr(errors, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,203 @@
+import os
+from datetime import datetime, timedelta
+from bson import json_util
+from dateutil.relativedelta import relativedelta
+from mongoengine.connection import get_db
+from pymongo.errors import BulkWriteError, CollectionInvalid
+from app.config import LOG_RETENTION_DAYS, LOG_RESPONSE_GRACE_DAYS, LOG_ARCHIVE_BACKEND, LOG_ARCHIVE_DIR
+from models import APILog
+from utils import metrics
+from utils.db import REPORTING_READ
+
+try:
+    import zstandard
+except ImportError:  # only needed for the 'file' archive backend
+    zstandard = None
+
+ARCHIVE_PREFIX = 'api_logs_archive_'
+
+
+def month_start(dt):
+    return dt.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def months_between(start, end):
+    """Yield the first day of every month overlapping [start, end)."""
+    month = month_start(start)
+    while month < end:
+        yield month
+        month += relativedelta(months=1)
+
+
+def archive_collection_name(month):
+    return f"{ARCHIVE_PREFIX}{month:%Y_%m}"
+
+
+def archive_file_path(month, archive_dir=LOG_ARCHIVE_DIR):
+    return os.path.join(archive_dir, f"api_logs_{month:%Y_%m}.ndjson.zst")
+
+
+def retention_cutoff(days=LOG_RETENTION_DAYS):
+    """Logs strictly older than this are eligible for archival."""
+    return datetime.now().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=days)
+
+
+def _archive_collection(db, month):
+    name = archive_collection_name(month)
+    try:
+        collection = db.create_collection(
+            name, storageEngine={'wiredTiger': {'configString': 'block_compressor=zstd'}}
+        )
+        collection.create_index([('user', 1), ('log_time', -1)])
+    except CollectionInvalid:
+        collection = db[name]
+    return collection
+
+
+def _write_collection_batch(db, month, docs):
+    try:
+        _archive_collection(db, month).insert_many(docs, ordered=False)
+    except BulkWriteError as e:
+        # Re-running after an interrupted pass re-inserts the same _ids.
+        if any(err.get('code') != 11000 for err in e.details.get('writeErrors', [])):
+            raise
+
+
+def _write_file_batch(month, docs, archive_dir):
+    if zstandard is None:
+        raise RuntimeError("The 'file' archive backend requires the zstandard package.")
+    os.makedirs(archive_dir, exist_ok=True)
+    payload = ''.join(json_util.dumps(doc) + '\n' for doc in docs).encode()
+    # Each batch is appended as its own zstd frame; readers decode across frames.
+    with open(archive_file_path(month, archive_dir), 'ab') as fh:
+        fh.write(zstandard.ZstdCompressor(level=10).compress(payload))
+
+
+def archive_old_logs(days=LOG_RETENTION_DAYS, backend=LOG_ARCHIVE_BACKEND,
+                     archive_dir=LOG_ARCHIVE_DIR, batch_size=1000):
+    """Move api_logs older than ``days`` into monthly archives. Returns the number moved."""
+    db = get_db()
+    hot = APILog._get_collection()
+    cutoff = retention_cutoff(days)
+    moved = 0
+
+    while True:
+        docs = list(hot.find({'log_time': {'$lt': cutoff}}).sort('log_time', 1).limit(batch_size))
+        if not docs:
+            break
+
+        by_month = {}
+        for doc in docs:
+            by_month.setdefault(month_start(doc['log_time']), []).append(doc)
+
+        for month, month_docs in by_month.items():
+            if backend == 'file':
+                _write_file_batch(month, month_docs, archive_dir)
+            else:
+                _write_collection_batch(db, month, month_docs)
+
+        hot.delete_many({'_id': {'$in': [doc['_id'] for doc in docs]}})
+        moved += len(docs)
+        metrics.incr('retention.archived', len(docs), backend=backend)
+
+    return moved
+
+
+def strip_old_responses(grace_days=LOG_RESPONSE_GRACE_DAYS):
+    """Drop the raw response payload from hot logs older than the grace period."""
+    cutoff = retention_cutoff(grace_days)
+    result = APILog._get_collection().update_many(
+        {'log_time': {'$lt': cutoff}, '$or': [{'response': {'$exists': True}}, {'rz': {'$exists': True}}]},
+        {'$unset': {'response': '', 'rz': ''}},
+    )
+    metrics.incr('retention.responses_stripped', result.modified_count)
+    return result.modified_count
+
+
+def _archive_query(user_id, start, end, status=None):
+    query = {'user': user_id, 'log_time': {'$gte': start, '$lt': end}}
+    if status:
+        query.update(APILog.status_raw_query(status))
+    return query
+
+
+def _matches(doc, user_id, start, end, status=None):
+    return (doc.get('user') == user_id
+            and start <= doc['log_time'] < end
+            and (status is None or APILog.raw_to_json(doc)['status'] == status))
+
+
+def _iter_file_month(month, user_id, start, end, status, archive_dir):
+    path = archive_file_path(month, archive_dir)
+    if zstandard is None or not os.path.exists(path):
+        return
+    seen = set()
+    with open(path, 'rb') as fh:
+        reader = zstandard.ZstdDecompressor().stream_reader(fh, read_across_frames=True)
+        buffer = b''
+        while True:
+            chunk = reader.read(1 << 16)
+            if not chunk:
+                break
+            buffer += chunk
+            *lines, buffer = buffer.split(b'\n')
+            for line in lines:
+                doc = json_util.loads(line)
+                if doc['_id'] not in seen and _matches(doc, user_id, start, end, status):
+                    seen.add(doc['_id'])
+                    yield doc
+
+
+def archived_months(start, end, backend=LOG_ARCHIVE_BACKEND, archive_dir=LOG_ARCHIVE_DIR):
+    """Months overlapping [start, end) that have an archive.
+
+    Checked against what exists rather than the configured retention, since
+    ``archive-logs --days`` may have archived more recent months.
+    """
+    months = list(months_between(start, end))
+    if backend == 'file':
+        return [month for month in months if os.path.exists(archive_file_path(month, archive_dir))]
+    names = [archive_collection_name(month) for month in months]
+    existing = set(get_db().list_collection_names(filter={'name': {'$regex': f'^{ARCHIVE_PREFIX}'}}))
+    return [month for month, name in zip(months, names) if name in existing]
+
+
+def iter_archived_logs(user_id, start, end, status=None,
+                       backend=LOG_ARCHIVE_BACKEND, archive_dir=LOG_ARCHIVE_DIR):
+    """Yield raw archived log documents for a user in [start, end), oldest month first."""
+    db = get_db()
+    query = _archive_query(user_id, start, end, status)
+    for month in archived_months(start, end, backend, archive_dir):
+        metrics.incr('retention.archive_reads', backend=backend)
+        if backend == 'file':
+            yield from _iter_file_month(month, user_id, start, end, status, archive_dir)
+        else:
+            collection = db[archive_collection_name(month)].with_options(read_preference=REPORTING_READ)
+            yield from collection.find(query).sort('log_time', 1)
+
+
+def count_logs(user_id, start, end, status=None, backend=LOG_ARCHIVE_BACKEND, route='count_logs'):
+    """Count a user's logs in [start, end) across the hot collection and archived months."""
+    metrics.incr('db.read_route', route=route, target=REPORTING_READ.mongos_mode)
+    query = _archive_query(user_id, start, end, status)
+    total = APILog._get_collection().with_options(read_preference=REPORTING_READ).count_documents(query)
+    return total + count_archived_logs(user_id, start, end, status, backend)
+
+
+def count_archived_logs(user_id, start, end, status=None, backend=LOG_ARCHIVE_BACKEND):
+    """Count only the archived part of a user's logs in [start, end)."""
+    if backend == 'file':
+        return sum(1 for _ in iter_archived_logs(user_id, start, end, status, backend))
+
+    db = get_db()
+    query = _archive_query(user_id, start, end, status)
+    total = 0
+    for month in archived_months(start, end, backend):
+        total += db[archive_collection_name(month)].with_options(
+            read_preference=REPORTING_READ).count_documents(query)
+    return total
+
+
+def archived_log_json(doc):
+    """Render an archived document in the same shape as ``APILog.to_json``."""
+    return APILog.raw_to_json(doc)
@@ -0,0 +1,83 @@
+import os
+import threading
+import time
+from datetime import datetime
+from mongoengine import NotUniqueError
+from app.config import REVOCATION_RELOAD_SECONDS
+from models import RevokedToken
+from utils import invalidation, metrics
+
+# jti -> expiry of every revoked token that could still be presented. Revoked
+# tokens leave the collection (TTL index) once expired, so the whole set fits
+# in memory on each worker.
+_revoked = {}
+_loaded_at = None
+_loaded_pid = None
+_lock = threading.Lock()
+# Guards writes to _revoked. Entries remembered while a reload is reading the
+# collection are also kept in _remembered_during_reload and merged into its result.
+_write_lock = threading.Lock()
+_remembered_during_reload = None
+
+
+def _remember(jti, expires_at):
+    if expires_at is None or expires_at > datetime.now():
+        with _write_lock:
+            _revoked[jti] = expires_at
+            if _remembered_during_reload is not None:
+                _remembered_during_reload[jti] = expires_at
+
+
+invalidation.subscribe('revoked_tokens', lambda doc_id, doc: doc and _remember(doc['jti'], doc.get('expires_at')))
+
+
+def _reload():
+    global _revoked, _loaded_at, _loaded_pid, _remembered_during_reload
+    with _write_lock:
+        _remembered_during_reload = {}
+    now = datetime.now()
+    try:
+        docs = RevokedToken._get_collection().find(
+            {'$or': [{'expires_at': None}, {'expires_at': {'$gt': now}}]}, {'_id': 0, 'jti': 1, 'expires_at': 1}
+        )
+        revoked = {doc['jti']: doc.get('expires_at') for doc in docs}
+    except Exception:
+        with _write_lock:
+            _remembered_during_reload = None
+        raise
+    # Swap in the new set in one step so concurrent checks never see it empty,
+    # keeping revocations that arrived after the read started.
+    with _write_lock:
+        revoked.update(_remembered_during_reload)
+        _remembered_during_reload = None
+        _revoked = revoked
+    _loaded_at = time.monotonic()
+    _loaded_pid = os.getpid()
+    metrics.incr('revocations.reload')
+
+
+def _ensure_loaded():
+    if _loaded_pid == os.getpid() and time.monotonic() - _loaded_at < REVOCATION_RELOAD_SECONDS:
+        return
+    with _lock:
+        if _loaded_pid != os.getpid() or time.monotonic() - _loaded_at >= REVOCATION_RELOAD_SECONDS:
+            _reload()
+
+
+def is_revoked(*jtis):
+    """True if any of the given token ids (e.g. a token's jti and its refresh token's) is revoked."""
+    _ensure_loaded()
+    return any(jti in _revoked for jti in jtis if jti)
+
+
+def revoke(jti, expires_at=None):
+    """Revoke a token until ``expires_at`` (its own expiry; None keeps it forever)."""
+    try:
+        RevokedToken(jti=jti, expires_at=expires_at).save()
+    except NotUniqueError:
+        pass
+    _remember(jti, expires_at)
+
+
+def size():
+    return len(_revoked)
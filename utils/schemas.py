@@ -0,0 +1,185 @@
+import re
+from functools import wraps
+from flask import request, jsonify, g
+from flask_jwt_extended import get_jwt_identity
+from utils import metrics
+
+_EMAIL = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+_BOOL_STRINGS = {'true': True, 'false': False, 'yes': True, 'no': False}
+
+
+class Field:
+    """Declarative description of one JSON field; see ``Schema``."""
+
+    def __init__(self, kind, required=True, default=None, gt=None, min=None, max=None,
+                 min_length=None, max_length=None, pattern=None, choices=None, coerce=False):
+        self.kind = kind
+        self.required = required
+        self.default = default
+        self.gt = gt
+        self.min = min
+        self.max = max
+        self.min_length = min_length
+        self.max_length = max_length
+        self.pattern = re.compile(pattern) if pattern else None
+        self.choices = frozenset(choices) if choices else None
+        self.coerce = coerce
+
+
+class Invalid(Exception):
+    pass
+
+
+def _type_check(field):
+    """Return a function that converts/validates the raw value for ``field.kind``."""
+    kind, coerce = field.kind, field.coerce
+
+    if kind in ('str', 'email'):
+        def check(value):
+            if isinstance(value, str):
+                return value
+            if coerce and isinstance(value, (int, float)) and not isinstance(value, bool):
+                return str(value)
+            raise Invalid("must be a string")
+    elif kind == 'int':
+        def check(value):
+            if isinstance(value, int) and not isinstance(value, bool):
+                return value
+            if coerce and isinstance(value, str):
+                try:
+                    return int(value.strip())
+                except ValueError:
+                    pass
+            raise Invalid("must be an integer")
+    elif kind == 'number':
+        def check(value):
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                return value
+            if coerce and isinstance(value, str):
+                try:
+                    return float(value.strip())
+                except ValueError:
+                    pass
+            raise Invalid("must be a number")
+    elif kind == 'bool':
+        def check(value):
+            if isinstance(value, bool):
+                return value
+            if coerce and isinstance(value, str) and value.lower() in _BOOL_STRINGS:
+                return _BOOL_STRINGS[value.lower()]
+            raise Invalid("must be true or false")
+    elif kind == 'dict':
+        def check(value):
+            if isinstance(value, dict):
+                return value
+            raise Invalid("must be an object")
+    else:
+        raise ValueError(f"Unknown field kind '{kind}'")
+    return check
+
+
+def _compile_field(field):
+    """Chain only the checks this field declares into one closure."""
+    checks = [_type_check(field)]
+    if field.kind == 'email':
+        checks.append(lambda v: v if _EMAIL.match(v) else _fail("must be a valid email address"))
+    if field.gt is not None:
+        gt = field.gt
+        checks.append(lambda v: v if v > gt else _fail(f"must be greater than {gt}"))
+    if field.min is not None:
+        low = field.min
+        checks.append(lambda v: v if v >= low else _fail(f"must be at least {low}"))
+    if field.max is not None:
+        high = field.max
+        checks.append(lambda v: v if v <= high else _fail(f"must be at most {high}"))
+    if field.min_length is not None:
+        shortest = field.min_length
+        checks.append(lambda v: v if len(v) >= shortest else _fail(f"must be at least {shortest} characters"))
+    if field.max_length is not None:
+        longest = field.max_length
+        checks.append(lambda v: v if len(v) <= longest else _fail(f"must be at most {longest} characters"))
+    if field.pattern is not None:
+        pattern = field.pattern
+        checks.append(lambda v: v if pattern.fullmatch(v) else _fail("has an invalid format"))
+    if field.choices is not None:
+        choices = field.choices
+        checks.append(lambda v: v if v in choices else _fail(f"must be one of {', '.join(sorted(map(str, choices)))}"))
+
+    if len(checks) == 1:
+        return checks[0]
+
+    def run(value):
+        for check in checks:
+            value = check(value)
+        return value
+    return run
+
+
+def _fail(message):
+    raise Invalid(message)
+
+
+class Schema:
+    """A set of fields compiled once into a single validation function.
+
+    ``rules`` are cross-field checks run after the fields validate:
+    (predicate(clean_data), field_name, message). Unknown keys are ignored.
+    Calling the schema returns (clean_data, errors).
+    """
+
+    def __init__(self, name, fields, rules=()):
+        self.name = name
+        self._fields = [(key, field.required, field.default, _compile_field(field)) for key, field in fields.items()]
+        self._rules = tuple(rules)
+
+    def __call__(self, data):
+        if not isinstance(data, dict):
+            return None, {'_body': "Request body must be a JSON object"}
+        clean, errors = {}, {}
+        for key, required, default, check in self._fields:
+            value = data.get(key)
+            if value is None:
+                if required:
+                    errors[key] = "is required"
+                else:
+                    clean[key] = default() if callable(default) else default
+                continue
+            try:
+                clean[key] = check(value)
+            except Invalid as e:
+                errors[key] = str(e)
+        if not errors:
+            for predicate, key, message in self._rules:
+                if not predicate(clean):
+                    errors[key] = message
+                    break
+        return clean, errors
+
+
+def error_message(errors):
+    key, message = next(iter(errors.items()))
+    return message if key == '_body' or message[0].isupper() else f"{key} {message}"
+
+
+def validate_json(schema, log_endpoint=None):
+    """Validate the JSON body before the view runs; the clean data is on ``g.payload``.
+
+    With ``log_endpoint`` a rejected body is also recorded as a failed API call
+    for the JWT identity, so apply it below ``@token_required``.
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if request.method == 'OPTIONS':  # CORS preflight carries no body
+                return fn(*args, **kwargs)
+            clean, errors = schema(request.get_json(silent=True))
+            if errors:
+                metrics.incr('schema.rejected', schema=schema.name)
+                if log_endpoint:
+                    from utils.utils import log_api_request  # imports models
+                    log_api_request(log_endpoint, get_jwt_identity(), error_message(errors), "failure")
+                return jsonify({"error": "Invalid Input", "message": error_message(errors), "fields": errors}), 400
+            g.payload = clean
+            return fn(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,128 @@
+import secrets
+from datetime import datetime
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+from app.config import SESSION_CACHE_TTL, SESSION_CACHE_SIZE, SESSION_MISS_TTL
+from models import ServerSession
+from utils import invalidation, metrics
+from utils.cache import TTLCache
+
+# sid -> session data for live sessions on this worker. Revocations on other
+# workers arrive through the invalidation bus.
+_sessions = TTLCache(maxsize=SESSION_CACHE_SIZE, ttl=SESSION_CACHE_TTL)
+invalidation.subscribe('sessions', lambda sid, doc: _sessions.pop(sid))
+# sids with no live record; revocation and expiry are final, so these never come back.
+_misses = TTLCache(maxsize=SESSION_CACHE_SIZE, ttl=SESSION_MISS_TTL)
+
+
+def _new_sid():
+    return secrets.token_urlsafe(32)
+
+
+class MongoSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None, new=False):
+        def on_update(session):
+            session.modified = True
+        CallbackDict.__init__(self, initial, on_update)
+        self.sid = sid or _new_sid()
+        self.new = new
+        self.modified = False
+        self.previous_sid = None
+        # Set when the request carried a cookie for a revoked or expired session.
+        self.stale_cookie = False
+
+    def regenerate(self):
+        """Issue a fresh session id (e.g. at login) and revoke the old one."""
+        if not self.new:
+            self.previous_sid = self.sid
+        self.sid = _new_sid()
+        self.modified = True
+
+
+def load_session(sid):
+    data = _sessions.get(sid)
+    if data is not None:
+        metrics.incr('sessions.lookup', source='cache')
+        return data
+    if _misses.get(sid):
+        metrics.incr('sessions.lookup', source='cached-miss')
+        return None
+    record = ServerSession.objects(id=sid, revoked=False, expires_at__gt=datetime.now()).first()
+    metrics.incr('sessions.lookup', source='db' if record else 'miss')
+    if record is None:
+        _misses.set(sid, True)
+        return None
+    _sessions.set(sid, record.data)
+    return record.data
+
+
+def revoke_session(sid):
+    """Revoke one session on every worker."""
+    ServerSession.objects(id=sid).update_one(set__revoked=True, set__updated_at=datetime.now())
+    _sessions.pop(sid)
+
+
+def revoke_user_sessions(user_id):
+    """Revoke all of a user's sessions on every worker."""
+    revoke_users_sessions([user_id])
+
+
+def revoke_users_sessions(user_ids):
+    """Revoke all sessions of several users (e.g. a bulk deactivation) in one update."""
+    user_ids = {str(user_id) for user_id in user_ids}
+    ServerSession.objects(user_id__in=list(user_ids), revoked=False).update(
+        set__revoked=True, set__updated_at=datetime.now())
+    _sessions.pop_values_matching(lambda data: str((data.get('user') or {}).get('id')) in user_ids)
+
+
+class MongoSessionInterface(SessionInterface):
+    """Flask sessions stored in the TTL-indexed ``sessions`` collection."""
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            data = load_session(sid)
+            if data is not None:
+                return MongoSession(data, sid=sid)
+            session = MongoSession(new=True)
+            session.stale_cookie = True
+            return session
+        return MongoSession(new=True)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if session.previous_sid:
+            revoke_session(session.previous_sid)
+
+        if not session:
+            if session.modified and not session.new:
+                revoke_session(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            elif session.stale_cookie:
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        if not self.should_set_cookie(app, session):
+            return
+
+        expires = self.get_expiration_time(app, session)
+        if session.modified:
+            data = dict(session)
+            ServerSession(
+                id=session.sid,
+                data=data,
+                user_id=(data.get('user') or {}).get('id'),
+                wallet_id=data.get('wallet_id'),
+                expires_at=expires or datetime.now() + app.permanent_session_lifetime,
+                updated_at=datetime.now(),
+            ).save()
+            _sessions.set(session.sid, data)
+
+        response.set_cookie(
+            name, session.sid, expires=expires, httponly=self.get_cookie_httponly(app),
+            domain=domain, path=path, secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+        )
@@ -0,0 +1,35 @@
+import json
+import re
+from functools import lru_cache
+from app.config import UA_RULES_FILE, UA_CACHE_SIZE
+
+UNKNOWN_CLIENT = 'Unknown Client'
+
+
+def load_rules(path=UA_RULES_FILE):
+    """Load the ordered [{label, pattern}] rule table; earlier rules win."""
+    with open(path) as fh:
+        return [(rule['label'], rule['pattern']) for rule in json.load(fh)]
+
+
+def compile_rules(rules):
+    """Compile an ordered rule table into one regex.
+
+    Each rule becomes an anchored lookahead alternative, so the regex engine
+    tries rules in table order and the first match wins regardless of where
+    the token appears in the string. ``lastgroup`` names the matching rule.
+    """
+    alternatives = [f"(?=.*?(?:{pattern}))(?P<r{i}>)" for i, (_, pattern) in enumerate(rules)]
+    return re.compile('^(?:' + '|'.join(alternatives) + ')', re.S)
+
+
+_RULES = load_rules()
+_LABELS = {f"r{i}": label for i, (label, _) in enumerate(_RULES)}
+_PATTERN = compile_rules(_RULES)
+
+
+@lru_cache(maxsize=UA_CACHE_SIZE)
+def classify(user_agent):
+    """Return the client label for a User-Agent string."""
+    match = _PATTERN.match(user_agent or '')
+    return _LABELS[match.lastgroup] if match else UNKNOWN_CLIENT
@@ -0,0 +1,36 @@
+from app.config import USER_STATUS_CACHE_TTL, USER_STATUS_CACHE_SIZE
+from models import User
+from utils import invalidation, metrics
+from utils.cache import TTLCache
+
+# email -> is_active for API callers on this worker.
+_status = TTLCache(maxsize=USER_STATUS_CACHE_SIZE, ttl=USER_STATUS_CACHE_TTL)
+
+
+def _evict(user_id, doc):
+    if doc and doc.get('email'):
+        _status.pop(doc['email'])
+    else:
+        _status.clear()
+
+
+invalidation.subscribe('users', _evict)
+
+
+def is_active(email):
+    """False only for users that have been deactivated; unknown users are left to the caller."""
+    active = _status.get(email)
+    if active is not None:
+        metrics.incr('user_status.lookup', source='cache')
+        return active
+    doc = User._get_collection().find_one({'email': email}, {'is_active': True})
+    active = doc is None or doc.get('is_active', True) is not False
+    _status.set(email, active)
+    metrics.incr('user_status.lookup', source='db')
+    return active
+
+
+def forget(emails):
+    """Drop cached entries on this worker, e.g. right after a bulk status change."""
+    for email in emails:
+        _status.pop(email)
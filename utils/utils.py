@@ -1,12 +1,15 @@
-from flask import jsonify, session
+from flask import jsonify, session, g
 from flask_jwt_extended import verify_jwt_in_request, get_jwt, get_jwt_identity
 from functools import wraps
 from requests.auth import HTTPBasicAuth
 import requests
-from models import RevokedToken, APILog
+from models import APILog
+from utils.user_agents import classify
+from utils import outbox, analytics, api_tokens, revocations, json_provider, user_status
 from flask import request
-import json
-from models import User
+import hmac
+from app.config import ADMIN_API_TOKEN
+from models import User, Wallet
 from datetime import datetime
 import smtplib
 from email.mime.text import MIMEText
@@ -61,6 +64,12 @@ def send_email(subject, recipient_email, body):
     except Exception as e:
         raise Exception(f"Failed to send email: {e}")
     
+@outbox.handler('email')
+def deliver_email(payload, http):
+    """Outbox delivery for queued emails."""
+    send_email(payload['subject'], payload['recipient'], payload['body'])
+    return {'recipient': payload['recipient']}
+
 def token_required(fn):
     @wraps(fn)
     def decorated_function(*args, **kwargs):
@@ -71,11 +80,18 @@ def token_required(fn):
             return jsonify({"error": "Token verification failed", "message": str(e)}), 401
 
         current_user = get_jwt_identity()
-        jti = get_jwt().get("jti")
+        claims = get_jwt()
+
+        if api_tokens.is_legacy(claims) and api_tokens.legacy_refused():
+            return jsonify({"error": "Token no longer accepted",
+                            "message": "Non-expiring API tokens have been retired. Generate a new API key from the dashboard."}), 401
 
-        if is_token_revoked(jti):
+        if is_token_revoked(claims.get("jti"), claims.get("rid")):
             return jsonify({"error": "Token has been revoked"}), 401
 
+        if not user_status.is_active(current_user):
+            return jsonify({"error": "Account is inactive"}), 403
+
         return fn(current_user, *args, **kwargs)
     return decorated_function
 
@@ -89,13 +105,32 @@ def login_required(f):
     return decorated_function
 
 
-def is_token_revoked(jti):
-    token = RevokedToken.objects(jti=jti).first()
-    return token is not None
+def admin_required(f):
+    """Operator endpoints: require the ADMIN_API_TOKEN bearer token (404 when unset)."""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if not ADMIN_API_TOKEN:
+            return jsonify({'error': 'Not found'}), 404
+        scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+        if scheme.lower() != 'bearer' or not hmac.compare_digest(token.encode(), ADMIN_API_TOKEN.encode()):
+            return jsonify({'error': 'Admin token required'}), 401
+        return f(*args, **kwargs)
+    return decorated_function
+
+
+def session_wallet():
+    """The logged-in user's wallet, resolved from the ids stored in the session."""
+    wallet_id = session.get('wallet_id')
+    if wallet_id:
+        return Wallet.objects(id=wallet_id).first()
+    return Wallet.objects(user=session['user']['id']).first()
+
 
-def add_token_to_blacklist(jti):
-    revoked_token = RevokedToken(jti=jti)
-    revoked_token.save() 
+def is_token_revoked(*jtis):
+    return revocations.is_revoked(*jtis)
+
+def add_token_to_blacklist(jti, expires_at=None):
+    revocations.revoke(jti, expires_at)
 
 def validate_razorpay_credentials(key_id, key_secret):
     url = "https://api.razorpay.com/v1/payments"
@@ -105,35 +140,38 @@ def validate_razorpay_credentials(key_id, key_secret):
 
 def identify_client(user_agent):
     """Identify the client based on the User-Agent string."""
-    if 'Postman' in user_agent:
-        return 'Postman'
-    elif 'curl' in user_agent:
-        return 'cURL'
-    elif 'Chrome' in user_agent:
-        return 'Google Chrome'
-    elif 'Firefox' in user_agent:
-        return 'Mozilla Firefox'
-    elif 'Safari' in user_agent and 'Chrome' not in user_agent:
-        return 'Apple Safari'
-    elif 'Edge' in user_agent:
-        return 'Microsoft Edge'
-    else:
-        return 'Unknown Client'
+    return classify(user_agent)
 
-def log_api_request(endpoint, email, response_data, status):
-    """Helper function to log API request."""
+def request_client():
+    """(domain, platform) of the current request, as recorded in API logs."""
     domain = request.headers.get('Origin', 'unknown domain')
     user_agent = request.headers.get('User-Agent', 'Unknown')
-    platform_info = identify_client(user_agent)
+    return domain, identify_client(user_agent)
+
+def log_api_request(endpoint, email, response_data, status):
+    """Helper function to log API request."""
+    domain, platform_info = request_client()
     
-    user = User.objects(email=email).first()
+    # Reuse the principal create_order already loaded instead of another lookup
+    principal = g.get('api_principal')
+    if principal is not None:
+        user_id = principal.user_id
+    else:
+        user = User.objects(email=email).first()
+        user_id = user.id if user else None
+
+    record_api_call(user_id, endpoint, domain, platform_info, response_data, status, g.get('credit_lease'))
+
 
-    log_entry = APILog(
+def record_api_call(user_id, endpoint, domain, platform, response_data, status, credit_lease=None):
+    """Write the API log and queue its usage rollups; usable outside a request (e.g. deferred orders)."""
+    log = APILog.log_api_call(
+        user=user_id,
         endpoint=endpoint,
-        user=user.id if user else None,  
         domain=domain,
-        platform=platform_info,
-        response=json.dumps(response_data) if isinstance(response_data, dict) else str(response_data),
-        status=status
+        platform=platform,
+        response=json_provider.dumps(response_data) if isinstance(response_data, dict) else str(response_data),
+        status=status,
+        credit_lease=credit_lease,
     )
-    log_entry.save()
+    analytics.record_call(user_id, log.log_time, endpoint, domain, platform, status)
@@ -0,0 +1,92 @@
+from flask import g, has_request_context
+from pymongo.errors import PyMongoError
+from app.config import WALLET_FLOOR, LOW_BALANCE_THRESHOLDS, CREDIT_LEASE_SIZE
+from models import Wallet
+from utils import credit_leases, metrics, outbox
+from utils.utils import email_template
+
+
+def charge(wallet_id, amount=1):
+    """Atomically take credits for an order.
+
+    Returns the new balance (counting credits held by leases), or None if the
+    charge would cross WALLET_FLOOR. With credit leasing on, the credit comes
+    from this worker's lease while the wallet is well above its alert
+    thresholds; the lease id is kept on ``g`` so the API log and any refund
+    are attributed to it.
+    """
+    if CREDIT_LEASE_SIZE and has_request_context():
+        try:
+            lease = credit_leases.charge(wallet_id, amount)
+        except PyMongoError as e:
+            # Leases need replica-set transactions; charge the wallet directly instead.
+            print(f"Credit lease unavailable, charging directly: {e}")
+            metrics.incr('wallet.charge', outcome='lease_error')
+            lease = None
+        if lease is not None:
+            g.credit_lease = lease.id
+            metrics.incr('wallet.charge', outcome='leased')
+            return lease.balance + lease.remaining
+
+    balance = Wallet.apply_credits(wallet_id, -amount, floor=WALLET_FLOOR, include_leased=True)
+    if balance is None and CREDIT_LEASE_SIZE and credit_leases.recall(wallet_id):
+        balance = Wallet.apply_credits(wallet_id, -amount, floor=WALLET_FLOOR, include_leased=True)
+    metrics.incr('wallet.charge', outcome='refused' if balance is None else 'ok')
+    return balance
+
+
+def refund(wallet_id, amount=1, lease_id=None):
+    """Give back credits taken by ``charge`` when the order could not be placed.
+
+    ``lease_id`` is only needed outside the charging request (deferred orders).
+    """
+    metrics.incr('wallet.refund')
+    if lease_id is None and has_request_context():
+        lease_id = g.pop('credit_lease', None)
+    if lease_id is not None:
+        credit_leases.refund(lease_id, wallet_id, amount)
+        return None
+    return Wallet.apply_credits(wallet_id, amount)
+
+
+def crossed_thresholds(old_balance, new_balance):
+    """Thresholds passed on the way down from old_balance to new_balance.
+
+    Direct balance changes are atomic and each returns its own before/after
+    pair, so concurrent charges do not both observe the same crossing. A
+    refund moves the balance back up, though, so after a failed order the next
+    charge crosses the same threshold again. Leased charges stay above the
+    thresholds (see credit_leases.LEASE_RESERVE).
+    """
+    return [t for t in LOW_BALANCE_THRESHOLDS if new_balance <= t < old_balance]
+
+
+def notify_low_balance(email, old_balance, new_balance):
+    """Queue a low-balance email if this charge crossed a threshold."""
+    crossed = crossed_thresholds(old_balance, new_balance)
+    if not crossed:
+        return
+    threshold = min(crossed)
+    metrics.incr('wallet.low_balance_alert', threshold=threshold)
+
+    if new_balance <= WALLET_FLOOR:
+        subject = "Your CloudlessPay credits have run out"
+        content = "<p>Your wallet has no credits left, so API requests will be refused until you recharge.</p>"
+    else:
+        subject = f"Low balance: {new_balance:g} CloudlessPay credits left"
+        content = f"<p>Your wallet balance has dropped to <b>{new_balance:g}</b> credits.</p>"
+
+    outbox.enqueue('email', {
+        'subject': subject,
+        'recipient': email,
+        'body': email_template(
+            title="Wallet Balance Alert",
+            content=f"""
+                <p>Hi,</p>
+                {content}
+                <p><a href="https://cloudlesspayment.com/docs/settings" style="color: #007bff;">Recharge your wallet</a> to keep your integration running.</p>
+                <p>Best Regards,</p>
+                <p>The CloudlessPay Team</p>
+            """
+        ),
+    })
@@ -0,0 +1,44 @@
+import logging
+import time
+from mongoengine.connection import get_db
+from models import LogCode
+from utils import crypto, invalidation, metrics, outbox, passwords, razorpay_sdk, revocations
+
+log = logging.getLogger(__name__)
+
+
+def _ping_mongo():
+    get_db().command('ping')
+
+
+def _start_background_threads():
+    outbox.start_worker()
+    invalidation.start()
+
+
+# First-use work of a fresh worker, in the order it is done at warm-up.
+# The password pool starts first, before the Mongo client's monitor threads.
+STEPS = [
+    ('password_pool', passwords.warm_up),
+    ('mongo', _ping_mongo),
+    ('log_codes', LogCode.preload),
+    ('revocations', revocations.is_revoked),
+    ('cipher', crypto.get_cipher),
+    ('razorpay_sdk', razorpay_sdk.load),
+    ('background_threads', _start_background_threads),
+]
+
+
+def warm_up():
+    """Run every warm-up step; returns ({step: seconds}, {step: error})."""
+    timings, errors = {}, {}
+    for name, step in STEPS:
+        started = time.perf_counter()
+        try:
+            step()
+        except Exception as e:
+            log.exception("Warm-up step %s failed", name)
+            errors[name] = str(e)
+        timings[name] = round(time.perf_counter() - started, 4)
+        metrics.observe('warmup.seconds', timings[name], step=name)
+    return timings, errors